@@ -1,21 +1,24 @@
 import streamlit as st
 import base64
 import time
-import os
 import re
 import pandas as pd
 from PIL import Image
-from dotenv import load_dotenv
 from prompts import prompt1
-import google.generativeai as genai
+from llm import generate_text, LLMError, DIET_ANALYSIS_CONFIG
+from llm_cache import make_content_key, prompt_version, get_cached_response, store_response
 from passlib.hash import pbkdf2_sha256
-from functions import resize_image, pick_random_number, get_session_key, choose_meal, cook_style, cook_time, ingredients
+from functions import resize_uploads, remove_near_duplicates, encode_image_for_model, pick_random_number, get_session_key, choose_meal, cook_style, cook_time, ingredients, persist_widget_state
 from feedback import feedback, recent_commend, feedback_score
-from history import hello, save_profile_data, save_user_profile, get_db_connection
+from history import (hello, save_profile_data, save_user_profile, get_db_connection, USER_HABITS_SQL, ACCOUNT_SQL,
+                     NAME_TAKEN_SQL, UPDATE_ACCOUNT_SQL, UPDATE_ACCOUNT_PASSWORD_SQL)
 from recommandation import recommandation2
 from analysis_storage import process_analysis_result
 from rank import popular_habits, new_habits
 from nutrition_history import save_nutrition_history, display_nutrition_history_chart
+from migrations import bootstrap
+from tracing import start_rerun, finish_rerun, trace_panel, trace_fragment, span
+from cache import cache_panel
 
 img = Image.open("Logo.png")
 
@@ -28,6 +31,7 @@ st.set_page_config(
 # Part 1: Image Upload and Gallery
 def image_upload():
     session_key_uploaded_images = get_session_key("uploaded_images")
+    session_key_keep_images = get_session_key("keep_uploaded_images")
 
 
     if session_key_uploaded_images not in st.session_state:
@@ -40,21 +44,26 @@ def image_upload():
         key=get_session_key("file_uploader")
     )
 
-    # Clear the session state if no files are uploaded
+    # Clear the session state if no files are uploaded. The uploader starts out empty
+    # when the Habit section is opened again, so keep the earlier upload until new files arrive.
     if uploaded_files is None or len(uploaded_files) == 0:
-        st.session_state[session_key_uploaded_images] = []
+        if st.session_state.get("section_changed", False):
+            st.session_state[session_key_keep_images] = True
+        if st.session_state.get(session_key_keep_images, False) and st.session_state[session_key_uploaded_images]:
+            st.caption(f"Using the {len(st.session_state[session_key_uploaded_images])} images you uploaded earlier.")
+        else:
+            st.session_state[session_key_uploaded_images] = []
     elif uploaded_files:
-        st.session_state[session_key_uploaded_images] = []
-        for file in uploaded_files:
-            image_bytes = file.read()
-            resized_image_bytes = resize_image(image_bytes)  # Resize before storing
-            st.session_state[session_key_uploaded_images].append(resized_image_bytes)
+        st.session_state[session_key_keep_images] = False
+        # Resize before storing; uploads already resized on an earlier rerun are reused
+        st.session_state[session_key_uploaded_images] = resize_uploads(uploaded_files)
         uploaded_files = []
         
     return st.session_state[session_key_uploaded_images]
     # Return the resized images
 
 @st.fragment
+@trace_fragment("images_displayed")
 def images_displayed():
     session_key_uploaded_images = get_session_key("uploaded_images")
 
@@ -66,6 +75,7 @@ def images_displayed():
 
 # Part 2: Gemini Analysis
 @st.fragment
+@trace_fragment("images_analysis")
 def images_analysis():
     session_key_uploaded_images = get_session_key("uploaded_images")
     session_key_analysis_result = get_session_key("analysis_result")
@@ -74,43 +84,30 @@ def images_analysis():
     
     if st.button('Analyze', key=get_session_key("analyze_button")):
         if 3 <= num_images <= 6:
+            # Near-duplicates (burst shots, the same meal twice) are only sent once
+            images = remove_near_duplicates(st.session_state[session_key_uploaded_images])
+            num_duplicates = num_images - len(images)
+            if len(images) < 3:
+                st.warning(f"{num_duplicates} of your images look like near-duplicates of another one. "
+                           f"Please upload {3 - len(images)} more distinct images for analysis.")
+                return
+            if num_duplicates:
+                st.caption(f"Skipping {num_duplicates} near-duplicate images.")
             with st.spinner("Analyzing your dietary preference..."):
 
-                load_dotenv()
-                genai.configure(api_key=os.environ["GEMINI_API_KEY"])
-
-                generation_config = {
-                    "temperature": 1.0,
-                    "top_p": 0.95,
-                    "top_k": 64,
-                    "max_output_tokens": 300,
-                    "response_mime_type": "text/plain",
-                }
-
-                model = genai.GenerativeModel(
-                    model_name="gemini-2.0-flash",
-                    generation_config=generation_config,
-                )
-
-                chat_session = model.start_chat(history=[])
-
-                # Prepare the message content with text and images
-                message_parts = [str(prompt1)]  # Start with the prompt text
-                
-                # Add each image as a separate part
-                for image_bytes in st.session_state[session_key_uploaded_images]:
-                    base64_encoded = base64.b64encode(image_bytes).decode()
-                    message_parts.append({
-                        "mime_type": "image/jpeg",
-                        "data": base64_encoded
-                    })
-                
-                # Send the multipart message to Gemini
-                response = chat_session.send_message(message_parts)
+                # The same image set analysed with the same prompt is answered from the cache
+                analysis_cache_key = make_content_key(images)
+                analysis_version = prompt_version(prompt1, "gemini-2.0-flash", DIET_ANALYSIS_CONFIG)
+                analysis_text = get_cached_response("diet_analysis", analysis_cache_key, analysis_version)
+                if analysis_text is None:
+                    analysis_text = analyze_images(images)
+                    if analysis_text is None:
+                        return
+                    store_response("diet_analysis", analysis_cache_key, analysis_version, analysis_text)
 
-                st.markdown(response.text)
+                st.markdown(analysis_text)
 
-                st.session_state[session_key_analysis_result] = response.text
+                st.session_state[session_key_analysis_result] = analysis_text
                 
                 # Save analysis result to database if user is logged in
                 success, message = process_analysis_result()
@@ -126,6 +123,22 @@ def images_analysis():
         else:  #num_images > 6
             st.warning("You can upload a maximum of 6 images for analysis.")
 
+# Send the images with prompt1 to Gemini and return the analysis text, or None on error
+def analyze_images(images):
+    # Prepare the message content with text and images
+    message_parts = [str(prompt1)]  # Start with the prompt text
+
+    # Add each image as a separate part: compact re-encode, correct MIME type, raw bytes
+    for image_bytes in images:
+        message_parts.append(encode_image_for_model(image_bytes))
+
+    # Send the multipart message to Gemini (with timeout, retries and key failover)
+    try:
+        return generate_text("GEMINI_API_KEY", "gemini-2.0-flash", DIET_ANALYSIS_CONFIG, message_parts)
+    except LLMError as e:
+        st.error(str(e))
+        return None
+
 # Part 3: personal information
 def personal_data_form():
     session_key_profile = get_session_key("profile")
@@ -375,7 +388,8 @@ def nutrition():
                     st.warning(f"Could not save to database: {message}")
             
 
-@st.fragment            
+@st.fragment
+@trace_fragment("note")
 def note():
     session_key_notes = get_session_key("notes")
     
@@ -394,344 +408,369 @@ def note():
         if st.session_state[session_key_notes]:
             notes.markdown(f"**Your notes:** {st.session_state[session_key_notes]}")
         
-# Main Streamlit app
-if __name__ == "__main__":
-
-# -- introduction --
-    hide_streamlit_style = """
-    <style>
-        div[data-testid="stDecoration"] {
-            visibility: hidden;
-        }
-    </style>
-    """
-    
-    st.markdown(hide_streamlit_style, unsafe_allow_html=True)
-
-    st.markdown(
-    """
-    <div style="text-align: center; display: flex; justify-content: center; align-items: center;">
-        <img src="data:image/png;base64,""" + base64.b64encode(open("Logo.png", "rb").read()).decode() + """" style="height: 50px; margin-right: 10px;">
-        <h1>My Plate</h1>
-    </div>
-    """,
-    unsafe_allow_html=True,
-    )
-
-
-    # Create tabs
-    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-        "Habit", 
-        "Goal",
-        "Recipe", 
-        "Profile",
-        "Feedback",
-        "Rank",
-    ])
-    
-    # If we need to switch to the Profile tab, use JavaScript to click on it
-    if 'active_tab' in st.session_state and st.session_state['active_tab'] == 3:
-        # Reset the active tab after it's been used
-        st.session_state['active_tab'] = 0
-        
-        # Use JavaScript to click on the Profile tab
-        js = """
-        <script>
-            // Wait for the DOM to be fully loaded
-            document.addEventListener('DOMContentLoaded', function() {
-                // Find all tab buttons
-                var tabs = document.querySelectorAll('[data-baseweb="tab"]');
-                // Click on the Profile tab (index 3)
-                if (tabs.length >= 4) {
-                    tabs[3].click();
-                }
-            });
-        </script>
-        """
-        st.markdown(js, unsafe_allow_html=True)
-
 # -- part 1 --
-    with tab1:
-        st.markdown("""
+def habit_section():
+    st.markdown("""
     <br><br>
     <div style="text-align: center;">
         <h4>Diet Preference</h4>
     <br><br>
     """, unsafe_allow_html=True)
 
-        image_upload()
-        images_displayed()
-        images_analysis()
+    image_upload()
+    images_displayed()
+    images_analysis()
 
 # -- part 2 --
-    with tab2:
-        st.markdown("""
+def goal_section():
+    st.markdown("""
     <br><br>
     <div style="text-align: center;">
         <h4>Personal Details and Diet Goal</h4>
     </div>
     """, unsafe_allow_html=True)
 
-        personal_data_form()
+    personal_data_form()
 
-        st.text("")
+    st.text("")
+
+    nutrition()
 
-        nutrition()
-        
 # -- part 3 --
-    with tab3:
-        st.markdown("""
+def recipe_section():
+    st.markdown("""
     <br><br>
     <div style="text-align: center;">
         <h4>Today's Recipe</h4>
     </div>   
     """, unsafe_allow_html=True)
-        choose_meal()
-        cook_style()
-        from functions import display_habit_collection
-        display_habit_collection()
-        cook_time()
-        ingredients()
-        note()
-        recommandation2()
+    choose_meal()
+    cook_style()
+    from functions import display_habit_collection
+    display_habit_collection()
+    cook_time()
+    ingredients()
+    note()
+    recommandation2()
 
 # -- part 4 --
-    with tab4:
-        # First display the welcome message and login/signup functionality
+def profile_section():
+    # First display the welcome message and login/signup functionality
+    st.text("")
+    if 'logged_in' in st.session_state and st.session_state.logged_in:
+        st.subheader(f"Welcome {st.session_state.username}!")
+        
+        # Display user information
+        if st.session_state.username == "Demo User":
+            st.write("You are currently in demo mode. Database functionality is limited.")
+        
+        st.button("Refresh Profile")
+        # Display Habit Collection
         st.text("")
-        if 'logged_in' in st.session_state and st.session_state.logged_in:
-            st.subheader(f"Welcome {st.session_state.username}!")
-            
-            # Display user information
-            if st.session_state.username == "Demo User":
-                st.write("You are currently in demo mode. Database functionality is limited.")
-            
-            st.button("Refresh Profile")
-            # Display Habit Collection
-            st.text("")
-            st.subheader("Habit Collection")
-            # Display saved analysis results
-            if 'user_id' in st.session_state and st.session_state.user_id and st.session_state.username != "Demo User":
-                conn = get_db_connection()
-                if conn:
-                    try:
-                        cur = conn.cursor()
-                        cur.execute("""
-                            SELECT analysis_text, created_at 
-                            FROM analysis_results 
-                            WHERE user_id = %s
-                            ORDER BY created_at DESC
-                        """, (st.session_state.user_id,))
+        st.subheader("Habit Collection")
+        # Display saved analysis results
+        if 'user_id' in st.session_state and st.session_state.user_id and st.session_state.username != "Demo User":
+            conn = get_db_connection()
+            if conn:
+                try:
+                    cur = conn.cursor()
+                    cur.execute(USER_HABITS_SQL, (st.session_state.user_id,))
+                    
+                    analysis_results = cur.fetchall()
+                    cur.close()
+                    conn.close()
+                    
+                    if analysis_results:
+                        # Create a container for the pills
+                        # Extract all analysis texts
+                        analysis_texts = [analysis for analysis, _ in analysis_results if len(analysis) < 60] 
+                        # Display all analyses as pills
+                        st.pills(label="Diet Analysis History", options=analysis_texts, key="analysis_pills", label_visibility="collapsed")
                         
-                        analysis_results = cur.fetchall()
-                        cur.close()
-                        conn.close()
+                        # Add option to delete analysis results
+                        st.text("")
                         
-                        if analysis_results:
-                            # Create a container for the pills
-                            # Extract all analysis texts
-                            analysis_texts = [analysis for analysis, _ in analysis_results if len(analysis) < 60] 
-                            # Display all analyses as pills
-                            st.pills(label="Diet Analysis History", options=analysis_texts, key="analysis_pills", label_visibility="collapsed")
+                        # Initialize session state for showing delete UI
+                        if 'show_delete_habit_ui' not in st.session_state:
+                            st.session_state.show_delete_habit_ui = False
                             
-                            # Add option to delete analysis results
-                            st.text("")
+                        # Button to show/hide delete UI
+                        if st.button("Manage Habits", key="manage_habits_button"):
+                            st.session_state.show_delete_habit_ui = not st.session_state.show_delete_habit_ui
+                            st.rerun()
                             
-                            # Initialize session state for showing delete UI
-                            if 'show_delete_habit_ui' not in st.session_state:
-                                st.session_state.show_delete_habit_ui = False
+                        # Only show delete UI when button is clicked
+                        if st.session_state.show_delete_habit_ui:
+                            delete_container = st.container(border=True)
+                            with delete_container:
                                 
-                            # Button to show/hide delete UI
-                            if st.button("Manage Habits", key="manage_habits_button"):
-                                st.session_state.show_delete_habit_ui = not st.session_state.show_delete_habit_ui
-                                st.rerun()
+                                selected_analysis = st.selectbox(
+                                        "Select a habit to delete:",
+                                        options=analysis_texts,
+                                        key="delete_analysis_selectbox"
+                                    )
+                            
+                                if st.button("Delete", key="delete_analysis_button"):
+                                        from analysis_storage import delete_analysis_result
+                                        success, message = delete_analysis_result(st.session_state.user_id, selected_analysis)
+                                        if success:
+                                            st.success("Habit deleted successfully!")
+                                            st.session_state.show_delete_habit_ui = False
+                                            st.rerun()  # Refresh the page to update the list
+                                        else:
+                                            st.error(f"Error deleting habit: {message}")
                                 
-                            # Only show delete UI when button is clicked
-                            if st.session_state.show_delete_habit_ui:
-                                delete_container = st.container(border=True)
-                                with delete_container:
-                                    
-                                    selected_analysis = st.selectbox(
-                                            "Select a habit to delete:",
-                                            options=analysis_texts,
-                                            key="delete_analysis_selectbox"
-                                        )
+                                # Button to cancel/hide delete UI
+                                if st.button("Cancel", key="cancel_delete_button"):
+                                    st.session_state.show_delete_habit_ui = False
+                                    st.rerun()
+                    else:
+                        st.info("No Habit found. Upload food images in the Habit tab to analyze your diet preferences.")
+                        
+                except Exception as e:
+                    st.error(f"Error retrieving analysis history: {e}")
+        else:
+            st.info("Login to view your diet analysis history.")
+        
+        # Display Saved Recipes
+        st.text("")
+        st.subheader("Saved Recipes")
+        from saved_recipes import display_saved_recipes
+        display_saved_recipes()
+        
+        # Display Nutrition History
+        display_nutrition_history_chart()
+        
+        # Display Profile Information after Nutrition History
+        st.text("")
+        st.subheader("Profile Information")
+        a = st.container(border=True)
+        
+        # Get user information from database
+        if 'user_id' in st.session_state and st.session_state.user_id and st.session_state.username != "Demo User":
+            conn = get_db_connection()
+            if conn:
+                try:
+                    cur = conn.cursor()
+                    cur.execute(ACCOUNT_SQL, (st.session_state.user_id,))
+                    user_info = cur.fetchone()
+                    cur.close()
+                    conn.close()
+                    
+                    if user_info:
+                        username, password_hash, email, created_at = user_info
+                        a.write(f"Username: {username}")
+                        a.write(f"Password: {'*' * 8}")  # Don't display actual password for security
+                        a.write(f"Email: {email}")
+                        a.write(f"Account created: {created_at}")
+
+                        if a.button("Update User Information"):
+                            st.session_state.show_update_form = True
+        
+                        if st.button("Logout"):
+                                # Save profile data before logging out
+                                if st.session_state.user_id and st.session_state.username != "Demo User":
+                                    from functions import get_session_key
+                                    session_key_profile = get_session_key("profile")
+                                    if session_key_profile in st.session_state:
+                                        save_user_profile(st.session_state.user_id, st.session_state[session_key_profile])
                                 
-                                    if st.button("Delete", key="delete_analysis_button"):
-                                            from analysis_storage import delete_analysis_result
-                                            success, message = delete_analysis_result(st.session_state.user_id, selected_analysis)
-                                            if success:
-                                                st.success("Habit deleted successfully!")
-                                                st.session_state.show_delete_habit_ui = False
-                                                st.rerun()  # Refresh the page to update the list
-                                            else:
-                                                st.error(f"Error deleting habit: {message}")
-                                    
-                                    # Button to cancel/hide delete UI
-                                    if st.button("Cancel", key="cancel_delete_button"):
-                                        st.session_state.show_delete_habit_ui = False
-                                        st.rerun()
-                        else:
-                            st.info("No Habit found. Upload food images in the Habit tab to analyze your diet preferences.")
-                            
-                    except Exception as e:
-                        st.error(f"Error retrieving analysis history: {e}")
-            else:
-                st.info("Login to view your diet analysis history.")
-            
-            # Display Saved Recipes
-            st.text("")
-            st.subheader("Saved Recipes")
-            from saved_recipes import display_saved_recipes
-            display_saved_recipes()
-            
-            # Display Nutrition History
-            display_nutrition_history_chart()
-            
-            # Display Profile Information after Nutrition History
-            st.text("")
-            st.subheader("Profile Information")
-            a = st.container(border=True)
-            
-            # Get user information from database
-            if 'user_id' in st.session_state and st.session_state.user_id and st.session_state.username != "Demo User":
-                conn = get_db_connection()
-                if conn:
-                    try:
-                        cur = conn.cursor()
-                        cur.execute("SELECT username, password_hash, email, created_at FROM users WHERE id = %s", (st.session_state.user_id,))
-                        user_info = cur.fetchone()
-                        cur.close()
-                        conn.close()
+                                st.session_state.logged_in = False
+                                st.session_state.user_id = None
+                                st.session_state.username = None
+                                st.session_state.profile_synced = False
+                                st.rerun()
                         
-                        if user_info:
-                            username, password_hash, email, created_at = user_info
-                            a.write(f"Username: {username}")
-                            a.write(f"Password: {'*' * 8}")  # Don't display actual password for security
-                            a.write(f"Email: {email}")
-                            a.write(f"Account created: {created_at}")
-    
-                            if a.button("Update User Information"):
-                                st.session_state.show_update_form = True
-            
-                            if st.button("Logout"):
-                                    # Save profile data before logging out
-                                    if st.session_state.user_id and st.session_state.username != "Demo User":
-                                        from functions import get_session_key
-                                        session_key_profile = get_session_key("profile")
-                                        if session_key_profile in st.session_state:
-                                            save_user_profile(st.session_state.user_id, st.session_state[session_key_profile])
-                                    
-                                    st.session_state.logged_in = False
-                                    st.session_state.user_id = None
-                                    st.session_state.username = None
-                                    st.session_state.profile_synced = False
-                                    st.rerun()
+                        # Show update form when button is clicked
+                        if 'show_update_form' not in st.session_state:
+                            st.session_state.show_update_form = False
                             
-                            # Show update form when button is clicked
-                            if 'show_update_form' not in st.session_state:
-                                st.session_state.show_update_form = False
+                        if st.session_state.show_update_form:
+                            with st.form("update_user_info"):
+                                st.subheader("Update User Information")
+                                new_username = st.text_input("New Username", value=username)
+                                new_email = st.text_input("New Email", value=email)
+                                new_password = st.text_input("New Password", type="password", 
+                                                           help="Leave blank to keep current password")
+                                confirm_password = st.text_input("Confirm New Password", type="password")
                                 
-                            if st.session_state.show_update_form:
-                                with st.form("update_user_info"):
-                                    st.subheader("Update User Information")
-                                    new_username = st.text_input("New Username", value=username)
-                                    new_email = st.text_input("New Email", value=email)
-                                    new_password = st.text_input("New Password", type="password", 
-                                                               help="Leave blank to keep current password")
-                                    confirm_password = st.text_input("Confirm New Password", type="password")
-                                    
-                                    update_submitted = st.form_submit_button("Save Changes")
-                                    
-                                    if update_submitted:
-                                        # Validate inputs
-                                        if new_username and new_email:
-                                            # Validate email format
-                                            if not re.match(r"[^@]+@[^@]+\.[^@]+", new_email):
-                                                st.error("Invalid email format")
-                                            else:
-                                                # Check if new password was provided
-                                                update_password = False
-                                                if new_password:
-                                                    if new_password != confirm_password:
-                                                        st.error("Passwords do not match")
-                                                    elif len(new_password) < 8:
-                                                        st.error("Password must be at least 8 characters long")
+                                update_submitted = st.form_submit_button("Save Changes")
+                                
+                                if update_submitted:
+                                    # Validate inputs
+                                    if new_username and new_email:
+                                        # Validate email format
+                                        if not re.match(r"[^@]+@[^@]+\.[^@]+", new_email):
+                                            st.error("Invalid email format")
+                                        else:
+                                            # Check if new password was provided
+                                            update_password = False
+                                            if new_password:
+                                                if new_password != confirm_password:
+                                                    st.error("Passwords do not match")
+                                                elif len(new_password) < 8:
+                                                    st.error("Password must be at least 8 characters long")
+                                                else:
+                                                    update_password = True
+                                            
+                                            # Update user information in database
+                                            try:
+                                                conn = get_db_connection()
+                                                if conn:
+                                                    cur = conn.cursor()
+                                                    
+                                                    # Check if username or email already exists (except for current user)
+                                                    cur.execute(
+                                                        NAME_TAKEN_SQL,
+                                                        (new_username, new_email, st.session_state.user_id)
+                                                    )
+                                                    
+                                                    if cur.fetchone():
+                                                        st.error("Username or email already exists")
                                                     else:
-                                                        update_password = True
-                                                
-                                                # Update user information in database
-                                                try:
-                                                    conn = get_db_connection()
-                                                    if conn:
-                                                        cur = conn.cursor()
+                                                        # Update username and email
+                                                        if update_password:
+                                                            # Hash the new password
+                                                            password_hash = pbkdf2_sha256.hash(new_password)
+                                                            
+                                                            # Update all fields including password
+                                                            cur.execute(
+                                                                UPDATE_ACCOUNT_PASSWORD_SQL,
+                                                                (new_username, new_email, password_hash, st.session_state.user_id)
+                                                            )
+                                                        else:
+                                                            # Update only username and email
+                                                            cur.execute(
+                                                                UPDATE_ACCOUNT_SQL,
+                                                                (new_username, new_email, st.session_state.user_id)
+                                                            )
                                                         
-                                                        # Check if username or email already exists (except for current user)
-                                                        cur.execute(
-                                                            "SELECT id FROM users WHERE (username = %s OR email = %s) AND id != %s", 
-                                                            (new_username, new_email, st.session_state.user_id)
-                                                        )
+                                                        conn.commit()
                                                         
-                                                        if cur.fetchone():
-                                                            st.error("Username or email already exists")
-                                                        else:
-                                                            # Update username and email
-                                                            if update_password:
-                                                                # Hash the new password
-                                                                password_hash = pbkdf2_sha256.hash(new_password)
-                                                                
-                                                                # Update all fields including password
-                                                                cur.execute(
-                                                                    "UPDATE users SET username = %s, email = %s, password_hash = %s WHERE id = %s",
-                                                                    (new_username, new_email, password_hash, st.session_state.user_id)
-                                                                )
-                                                            else:
-                                                                # Update only username and email
-                                                                cur.execute(
-                                                                    "UPDATE users SET username = %s, email = %s WHERE id = %s",
-                                                                    (new_username, new_email, st.session_state.user_id)
-                                                                )
-                                                            
-                                                            conn.commit()
-                                                            
-                                                            # Update session state if username changed
-                                                            if new_username != username:
-                                                                st.session_state.username = new_username
-                                                            
-                                                            st.success("User information updated successfully!")
-                                                            st.session_state.show_update_form = False
-                                                            st.rerun()
+                                                        # Update session state if username changed
+                                                        if new_username != username:
+                                                            st.session_state.username = new_username
                                                         
-                                                        cur.close()
-                                                        conn.close()
-                                                except Exception as e:
-                                                    st.error(f"Error updating user information: {e}")
-                                        else:
-                                            st.warning("Username and email are required")
-                    except Exception as e:
-                        st.error(f"Error retrieving user information: {e}")
-        else:
-            # If not logged in, show the login/signup functionality
-            hello()
-
-
+                                                        st.success("User information updated successfully!")
+                                                        st.session_state.show_update_form = False
+                                                        st.rerun()
+                                                    
+                                                    cur.close()
+                                                    conn.close()
+                                            except Exception as e:
+                                                st.error(f"Error updating user information: {e}")
+                                    else:
+                                        st.warning("Username and email are required")
+                except Exception as e:
+                    st.error(f"Error retrieving user information: {e}")
+    else:
+        # If not logged in, show the login/signup functionality
+        hello()
 
 # -- part 5 --
-    with tab5:
-        st.markdown("""
+def feedback_section():
+    st.markdown("""
     <br><br>
     <div style="text-align: center;">
         <h4>Rate the Experience</h4>
     </div>
     """, unsafe_allow_html=True)
-        
-        feedback()
-        feedback_score()
-        recent_commend()
+    
+    feedback()
+    feedback_score()
+    recent_commend()
 
 # -- part 6 --
-    with tab6:
-        popular_habits()
-        new_habits()
+def rank_section():
+    popular_habits()
+    new_habits()
+
+# Sections shown in the navigation bar. Only the selected section's code runs on
+# each rerun, so e.g. moving a Recipe slider no longer queries the Profile tables.
+SECTIONS = {
+    "Habit": habit_section,
+    "Goal": goal_section,
+    "Recipe": recipe_section,
+    "Profile": profile_section,
+    "Feedback": feedback_section,
+    "Rank": rank_section,
+}
+
+# Widgets whose values must survive while their section is not rendered
+# (Streamlit drops the state of widgets that are not drawn in a rerun)
+PERSISTENT_WIDGET_KEYS = [
+    "q1", "feedback_text",
+    "meal", "cook_style", "cook_time", "ingredients",
+    "carbs_input", "protein_input", "fat_input", "calories_input",
+]
+
+# Navigation bar; returns the name of the section to render
+def navigation():
+    if "nav_section" not in st.session_state:
+        st.session_state.nav_section = "Habit"
+
+    # Switch to the Profile section when requested (replaces clicking the tab via JavaScript)
+    if 'active_tab' in st.session_state and st.session_state['active_tab'] == 3:
+        # Reset the active tab after it's been used
+        st.session_state['active_tab'] = 0
+        st.session_state.nav_section = "Profile"
+
+    selection = st.radio(
+        "Section",
+        options=list(SECTIONS),
+        key="nav_section",
+        horizontal=True,
+        label_visibility="collapsed",
+    )
+    st.session_state.section_changed = selection != st.session_state.get("last_section")
+    st.session_state.last_section = selection
+    return selection
+
+
+# Main Streamlit app
+if __name__ == "__main__":
+
+    # Per-rerun span trace (TRACE_ENABLED, or ?trace=1 for TRACE_ADMINS); None when off
+    trace = start_rerun()
 
+    # Provision the database and apply schema migrations once per process
+    # (no-op after the first successful run, so reruns never issue DDL)
+    db_ready, db_message = bootstrap()
+    if not db_ready:
+        st.warning(db_message)
+
+# -- introduction --
+    hide_streamlit_style = """
+    <style>
+        div[data-testid="stDecoration"] {
+            visibility: hidden;
+        }
+    </style>
+    """
+    
+    st.markdown(hide_streamlit_style, unsafe_allow_html=True)
+
+    st.markdown(
+    """
+    <div style="text-align: center; display: flex; justify-content: center; align-items: center;">
+        <img src="data:image/png;base64,""" + base64.b64encode(open("Logo.png", "rb").read()).decode() + """" style="height: 50px; margin-right: 10px;">
+        <h1>My Plate</h1>
+    </div>
+    """,
+    unsafe_allow_html=True,
+    )
 
+    persist_widget_state(PERSISTENT_WIDGET_KEYS)
+
+    # Render only the active section
+    section = navigation()
+    if trace is not None:
+        trace.section = section
+    try:
+        with span(f"section.{section}"):
+            SECTIONS[section]()
+    finally:
+        # Also runs when the section calls st.rerun() or st.stop()
+        finish_rerun(trace)
+    trace_panel(trace)
+    cache_panel()
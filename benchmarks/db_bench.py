@@ -0,0 +1,440 @@
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import analysis_storage  # noqa: E402
+import db  # noqa: E402
+import history  # noqa: E402
+import nutrition_history  # noqa: E402
+import rank  # noqa: E402
+import saved_recipes  # noqa: E402
+from migrations import bootstrap  # noqa: E402
+
+# The benchmark seeds and truncates its own database, never the app's DB_NAME
+DEFAULT_DATABASE = f"{db.DB_NAME or 'myplate'}_bench"
+MEAL_TYPES = ["Breakfast", "Lunch", "Dinner", "Snack", "Other"]
+SEEDED_TABLES = ["users", "user_profiles", "user_nutrition", "analysis_results", "habit_counts",
+                 "habit_first_seen", "nutrition_history", "saved_recipes", "feedback"]
+COPY_CHUNK_ROWS = 50000
+USER_CHUNK = 2000
+
+# Every statement issued by rank.py, nutrition_history.py, saved_recipes.py,
+# analysis_storage.py and history.py, as (name, sql, params(sample), is_write).
+# The SQL is imported from those modules, so the benchmark measures exactly what
+# the app runs. Writes run inside a savepoint that is rolled back, so the
+# dataset stays fixed.
+QUERIES = [
+    ("rank.get_popular_habits", rank.POPULAR_HABITS_SQL, lambda s: (5,), False),
+    ("rank.get_new_habits", rank.NEW_HABITS_SQL, lambda s: (5,), False),
+    ("nutrition_history.save_nutrition_history", nutrition_history.INSERT_NUTRITION_HISTORY_SQL,
+     lambda s: (s["user_id"], 250, 110, 70, 2070), True),
+    ("nutrition_history.get_nutrition_history", nutrition_history.NUTRITION_HISTORY_SQL,
+     lambda s: (s["user_id"], 30), False),
+    ("saved_recipes.save_recipe", saved_recipes.INSERT_RECIPE_SQL,
+     lambda s: (s["user_id"], "Bench recipe", "Recipe body", "Dinner"), True),
+    ("saved_recipes.get_saved_recipes", saved_recipes.SAVED_RECIPES_SQL, lambda s: (s["user_id"],), False),
+    ("saved_recipes.delete_saved_recipe", saved_recipes.DELETE_RECIPE_SQL,
+     lambda s: (s["recipe_id"], s["user_id"]), True),
+    ("analysis_storage.save_analysis_result", analysis_storage.INSERT_ANALYSIS_SQL,
+     lambda s: (s["user_id"], s["new_habit"]), True),
+    ("analysis_storage.delete_analysis_result", analysis_storage.DELETE_ANALYSIS_SQL,
+     lambda s: (s["user_id"], s["habit"], s["habit"]), True),
+    ("history.save_user_profile (profile)", history.UPSERT_PROFILE_SQL,
+     lambda s: (s["user_id"], "Bench", 35, "Female", 62.0, 168.0, "Moderately Active", "Stay Active"), True),
+    ("history.save_user_profile (nutrition)", history.UPSERT_NUTRITION_SQL,
+     lambda s: (s["user_id"], 250, 110, 70, 2070), True),
+    ("history.get_user_profile (profile)", history.PROFILE_SQL, lambda s: (s["user_id"],), False),
+    ("history.get_user_profile (nutrition)", history.NUTRITION_SQL, lambda s: (s["user_id"],), False),
+    ("history.register_user (exists)", history.USER_EXISTS_SQL, lambda s: (s["username"], s["email"]), False),
+    ("history.register_user (insert)", history.INSERT_USER_SQL,
+     lambda s: (s["new_username"], s["new_username"] + "@example.com", "x"), True),
+    ("history.login_user", history.LOGIN_SQL, lambda s: (s["username"],), False),
+    ("history.user_profile (habits)", history.USER_HABITS_SQL, lambda s: (s["user_id"],), False),
+    ("history.user_profile (account)", history.ACCOUNT_SQL, lambda s: (s["user_id"],), False),
+    ("history.user_profile (name taken)", history.NAME_TAKEN_SQL,
+     lambda s: (s["new_username"], s["new_username"] + "@example.com", s["user_id"]), False),
+    ("history.user_profile (update)", history.UPDATE_ACCOUNT_SQL,
+     lambda s: (s["new_username"], s["new_username"] + "@example.com", s["user_id"]), True),
+    ("history.save_feedback", history.INSERT_FEEDBACK_SQL, lambda s: (s["user_id"], 8.5, "Bench comment", 9, 9), True),
+    ("history.get_feedback_stats", history.FEEDBACK_STATS_SQL, lambda s: (), False),
+    ("history.get_recent_comments", history.RECENT_COMMENTS_SQL, lambda s: (5,), False),
+]
+
+# Stream rows into table with COPY, in CSV chunks so memory stays flat
+def copy_rows(cur, table, columns, rows):
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    total = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        total += 1
+        if total % COPY_CHUNK_ROWS == 0:
+            buffer.seek(0)
+            cur.copy_expert(statement, buffer)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+    if buffer.tell():
+        buffer.seek(0)
+        cur.copy_expert(statement, buffer)
+    return total
+
+
+# Random timestamps spread over the last `days` days, as strings COPY understands
+def random_timestamps(rng, now, days, size):
+    offsets = (rng.random(size) * days * 86400).astype("timedelta64[s]")
+    return np.datetime_as_string(now - offsets)
+
+
+# Per-user row counts: Poisson around the mean, so some users are much heavier than others
+def per_user_counts(rng, mean, size):
+    return rng.poisson(mean, size) if mean > 0 else np.zeros(size, dtype=int)
+
+
+def habit_rows(rng, user_ids, habits_per_user, probabilities, now, days):
+    vocabulary = len(probabilities)
+    for start in range(0, len(user_ids), USER_CHUNK):
+        chunk = np.asarray(user_ids[start:start + USER_CHUNK], dtype=np.int64)
+        owners = np.repeat(chunk, per_user_counts(rng, habits_per_user, len(chunk)))
+        ranks = rng.choice(vocabulary, size=len(owners), p=probabilities)
+        # A user keeps each habit once (uq_analysis_results_user_text), so repeats are dropped
+        keys = np.unique(owners * vocabulary + ranks)
+        created = random_timestamps(rng, now, days, len(keys))
+        for key, created_at in zip(keys.tolist(), created):
+            yield key // vocabulary, habit_text(key % vocabulary), created_at
+
+
+# Habit label for a Zipf rank: rank 0 is the most common habit
+def habit_text(rank):
+    return f"Habit {rank + 1}"
+
+
+def nutrition_rows(rng, user_ids, nutrition_per_user, now, days):
+    for start in range(0, len(user_ids), USER_CHUNK):
+        chunk = np.asarray(user_ids[start:start + USER_CHUNK], dtype=np.int64)
+        owners = np.repeat(chunk, per_user_counts(rng, nutrition_per_user, len(chunk)))
+        size = len(owners)
+        carbs = rng.integers(120, 360, size)
+        protein = rng.integers(60, 200, size)
+        fat = rng.integers(40, 120, size)
+        calories = carbs * 4 + protein * 4 + fat * 9
+        recorded = random_timestamps(rng, now, days, size)
+        yield from zip(owners.tolist(), carbs.tolist(), protein.tolist(), fat.tolist(), calories.tolist(), recorded)
+
+
+def recipe_rows(rng, user_ids, recipes_per_user, recipe_bytes, now, days):
+    body = ("Chop, season and cook until done. " * (recipe_bytes // 34 + 1))[:recipe_bytes]
+    for start in range(0, len(user_ids), USER_CHUNK):
+        chunk = np.asarray(user_ids[start:start + USER_CHUNK], dtype=np.int64)
+        owners = np.repeat(chunk, per_user_counts(rng, recipes_per_user, len(chunk)))
+        meals = rng.integers(0, len(MEAL_TYPES), len(owners))
+        saved = random_timestamps(rng, now, days, len(owners))
+        for n, (owner, meal, saved_at) in enumerate(zip(owners.tolist(), meals.tolist(), saved)):
+            yield owner, f"Recipe {start + n} ({saved_at})", body, MEAL_TYPES[meal], saved_at
+
+
+def feedback_rows(rng, user_ids, count, now, days):
+    ratings = np.round(rng.random(count) * 10, 1)
+    owners = rng.choice(np.asarray(user_ids), size=count)
+    anonymous = rng.random(count) < 0.3
+    commented = rng.random(count) < 0.6
+    created = random_timestamps(rng, now, days, count)
+    for n in range(count):
+        yield (
+            "" if anonymous[n] else int(owners[n]),
+            float(ratings[n]),
+            f"Comment {n}" if commented[n] else "",
+            created[n],
+        )
+
+
+# Replace the benchmark database's contents with a synthetic dataset loaded through COPY
+def seed(users, habits_per_user, nutrition_per_user, recipes_per_user, feedback, vocabulary, zipf_s,
+         days, recipe_bytes, random_seed):
+    """
+    Args:
+        users (int): Number of users
+        habits_per_user (float): Mean analysis_results rows per user
+        nutrition_per_user (float): Mean nutrition_history rows per user
+        recipes_per_user (float): Mean saved_recipes rows per user
+        feedback (int): Number of feedback rows
+        vocabulary (int): Distinct habit texts
+        zipf_s (float): Zipf exponent of the habit text distribution
+        days (int): Timestamps are spread over this many past days
+        recipe_bytes (int): Length of each recipe body
+        random_seed (int): Seed, so a dataset can be reproduced
+
+    Returns:
+        dict: Rows loaded and seconds spent per table
+    """
+    rng = np.random.default_rng(random_seed)
+    now = np.datetime64(datetime.now().replace(microsecond=0), "s")
+    ranks = np.arange(1, vocabulary + 1, dtype=float)
+    probabilities = ranks ** -zipf_s
+    probabilities /= probabilities.sum()
+    report = {}
+
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"TRUNCATE {', '.join(SEEDED_TABLES)} RESTART IDENTITY CASCADE")
+        # The habit aggregates are rebuilt in bulk below instead of row by row
+        cur.execute("ALTER TABLE analysis_results DISABLE TRIGGER USER")
+
+        def load(table, columns, rows):
+            started = time.perf_counter()
+            count = copy_rows(cur, table, columns, rows)
+            report[table] = {"rows": count, "seconds": round(time.perf_counter() - started, 2)}
+            print(f"{table:<18} {count:>10} rows  {report[table]['seconds']:>7.2f} s", flush=True)
+
+        load("users", ["username", "email", "password_hash"],
+             ((f"bench_{n}", f"bench_{n}@example.com", "x") for n in range(users)))
+        cur.execute("SELECT id FROM users ORDER BY id")
+        user_ids = [row[0] for row in cur.fetchall()]
+        load("user_profiles", ["user_id", "name", "age", "gender", "weight", "height", "activity_level", "goal"],
+             ((u, f"Bench {u}", 18 + u % 60, "Female" if u % 2 else "Male", 50 + u % 50, 150 + u % 45,
+               "Moderately Active", "Stay Active") for u in user_ids))
+        load("user_nutrition", ["user_id", "carbs", "protein", "fat", "calories"],
+             ((u, 250, 110, 70, 2070) for u in user_ids))
+        load("analysis_results", ["user_id", "analysis_text", "created_at"],
+             habit_rows(rng, user_ids, habits_per_user, probabilities, now, days))
+        load("nutrition_history", ["user_id", "carbs", "protein", "fat", "calories", "recorded_at"],
+             nutrition_rows(rng, user_ids, nutrition_per_user, now, days))
+        load("saved_recipes", ["user_id", "recipe_title", "recipe_content", "meal_type", "saved_at"],
+             recipe_rows(rng, user_ids, recipes_per_user, recipe_bytes, now, days))
+        load("feedback", ["user_id", "rating", "comment", "created_at"],
+             feedback_rows(rng, user_ids, feedback, now, days))
+
+        # Same rebuilds as migrations 4-6
+        started = time.perf_counter()
+        cur.execute("""
+            INSERT INTO habit_counts (analysis_text, habit_count)
+            SELECT analysis_text, COUNT(*) FROM analysis_results GROUP BY analysis_text
+        """)
+        cur.execute("""
+            INSERT INTO habit_first_seen (analysis_text, first_seen)
+            SELECT analysis_text, MIN(created_at) FROM analysis_results
+            WHERE created_at IS NOT NULL GROUP BY analysis_text
+        """)
+        cur.execute("""
+            UPDATE feedback_stats SET
+                rating_sum = totals.rating_sum,
+                rating_count = totals.rating_count,
+                rating_histogram = totals.rating_histogram
+            FROM (
+                SELECT COALESCE(SUM(rating), 0) AS rating_sum, COUNT(rating) AS rating_count,
+                       ARRAY(
+                           SELECT COUNT(f.rating)::INTEGER
+                           FROM generate_series(0, 10) AS bucket
+                           LEFT JOIN feedback f ON LEAST(FLOOR(f.rating), 10) = bucket
+                           GROUP BY bucket
+                           ORDER BY bucket
+                       ) AS rating_histogram
+                FROM feedback
+            ) totals
+            WHERE feedback_stats.id
+        """)
+        cur.execute("ALTER TABLE analysis_results ENABLE TRIGGER USER")
+        report["aggregates"] = {"seconds": round(time.perf_counter() - started, 2)}
+        print(f"{'aggregates':<18} {'':>10}       {report['aggregates']['seconds']:>7.2f} s", flush=True)
+        cur.close()
+
+    # VACUUM cannot run in a transaction; it also sets the visibility map for index-only scans
+    conn = db.get_db_connection()
+    try:
+        conn.autocommit = True
+        cur = conn.cursor()
+        for table in SEEDED_TABLES:
+            cur.execute(f"VACUUM ANALYZE {table}")
+        cur.close()
+    finally:
+        conn.autocommit = False
+        conn.close()
+    return report
+
+
+# Pick the users the queries run for, with one of their habits and recipes each
+def load_samples(cur, count, random_seed):
+    cur.execute("SELECT id, username, email FROM users ORDER BY random() LIMIT %s", (count,))
+    users = cur.fetchall()
+    if not users:
+        raise SystemExit("The benchmark database is empty; run the seed command first")
+    cur.execute("""
+        SELECT DISTINCT ON (user_id) user_id, analysis_text
+        FROM analysis_results WHERE user_id = ANY(%s)
+        ORDER BY user_id, created_at DESC
+    """, ([u[0] for u in users],))
+    habits = dict(cur.fetchall())
+    cur.execute("""
+        SELECT DISTINCT ON (user_id) user_id, id
+        FROM saved_recipes WHERE user_id = ANY(%s)
+        ORDER BY user_id, saved_at DESC
+    """, ([u[0] for u in users],))
+    recipes = dict(cur.fetchall())
+    rng = random.Random(random_seed)
+    samples = []
+    for user_id, username, email in users:
+        token = rng.getrandbits(32)
+        samples.append({
+            "user_id": user_id,
+            "username": username,
+            "email": email,
+            "habit": habits.get(user_id, habit_text(0)),
+            "new_habit": f"Bench habit {token}",
+            "recipe_id": recipes.get(user_id, 0),
+            "new_username": f"bench_new_{token}",
+        })
+    return samples
+
+
+# Nearest-rank percentile
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+# Time every app query over the sampled users and capture one EXPLAIN ANALYZE plan per query
+def run_queries(repeat, samples, explain=True, only=None):
+    """
+    Everything runs in one transaction that is rolled back at the end, and
+    each write additionally runs in a savepoint, so every repetition sees the
+    seeded data unchanged.
+
+    Returns:
+        dict: Query name -> {"p50_ms", "p95_ms", "max_ms", "rows", "plan"}
+    """
+    results = {}
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor()
+        table_rows = {}
+        for table in SEEDED_TABLES:
+            cur.execute("SELECT reltuples::BIGINT FROM pg_class WHERE relname = %s", (table,))
+            row = cur.fetchone()
+            table_rows[table] = row[0] if row else 0
+        for name, query, params, is_write in QUERIES:
+            if only and only not in name:
+                continue
+            timings, rows = [], 0
+            for n in range(repeat):
+                sample = samples[n % len(samples)]
+                if is_write:
+                    cur.execute("SAVEPOINT bench")
+                started = time.perf_counter()
+                cur.execute(query, params(sample))
+                fetched = cur.fetchall() if cur.description else []
+                timings.append((time.perf_counter() - started) * 1000)
+                rows += len(fetched) if cur.description else max(cur.rowcount, 0)
+                if is_write:
+                    cur.execute("ROLLBACK TO SAVEPOINT bench")
+            plan = None
+            if explain:
+                cur.execute("SAVEPOINT bench")
+                cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params(samples[0]))
+                plan = [line[0] for line in cur.fetchall()]
+                cur.execute("ROLLBACK TO SAVEPOINT bench")
+            results[name] = {
+                "p50_ms": round(percentile(timings, 50), 3),
+                "p95_ms": round(percentile(timings, 95), 3),
+                "max_ms": round(max(timings), 3),
+                "rows": round(rows / repeat, 1),
+                "plan": plan,
+            }
+        cur.close()
+    finally:
+        conn.rollback()
+        conn.close()
+    return table_rows, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Seed a synthetic dataset with COPY and time every app query against it.")
+    parser.add_argument("--database", default=DEFAULT_DATABASE,
+                        help=f"benchmark database, created if missing (default {DEFAULT_DATABASE}; never the app's DB_NAME)")
+    subparsers = parser.add_subparsers(dest="command")
+    seed_parser = subparsers.add_parser("seed", help="truncate the benchmark database and load a synthetic dataset")
+    seed_parser.add_argument("--users", type=int, default=10000)
+    seed_parser.add_argument("--habits-per-user", type=float, default=40)
+    seed_parser.add_argument("--nutrition-per-user", type=float, default=100)
+    seed_parser.add_argument("--recipes-per-user", type=float, default=10)
+    seed_parser.add_argument("--feedback", type=int, default=100000)
+    seed_parser.add_argument("--vocabulary", type=int, default=20000, help="distinct habit texts")
+    seed_parser.add_argument("--zipf-s", type=float, default=1.1, help="Zipf exponent of habit popularity")
+    seed_parser.add_argument("--days", type=int, default=365, help="history spread over this many days")
+    seed_parser.add_argument("--recipe-bytes", type=int, default=2000)
+    seed_parser.add_argument("--seed", type=int, default=42)
+    run_parser = subparsers.add_parser("run", help="time every query and capture EXPLAIN ANALYZE (default)")
+    run_parser.add_argument("--repeat", type=int, default=50, help="executions per query")
+    run_parser.add_argument("--samples", type=int, default=200, help="distinct users the queries run for")
+    run_parser.add_argument("--only", help="run only queries whose name contains this text")
+    run_parser.add_argument("--no-explain", action="store_true")
+    run_parser.add_argument("--show-plans", action="store_true", help="print the EXPLAIN ANALYZE output")
+    run_parser.add_argument("--output", help="write results and plans to this JSON file")
+    run_parser.add_argument("--baseline", help="earlier --output file to compare p50/p95 against")
+    run_parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.database == db.DB_NAME:
+        raise SystemExit(f"Refusing to seed or benchmark the app database {db.DB_NAME}; pick another --database")
+    # The pool is created lazily, so switching the module setting is enough
+    db.DB_NAME = args.database
+    print(f"Benchmark database: {db.DB_NAME}")
+    success, message = bootstrap()
+    if not success:
+        raise SystemExit(f"Database not available: {message}")
+
+    if args.command == "seed":
+        seed(args.users, args.habits_per_user, args.nutrition_per_user, args.recipes_per_user, args.feedback,
+             args.vocabulary, args.zipf_s, args.days, args.recipe_bytes, args.seed)
+        raise SystemExit(0)
+
+    repeat = getattr(args, "repeat", 50)
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor()
+        samples = load_samples(cur, getattr(args, "samples", 200), getattr(args, "seed", 42))
+        cur.close()
+    finally:
+        conn.rollback()
+        conn.close()
+    table_rows, results = run_queries(repeat, samples, explain=not getattr(args, "no_explain", False),
+                                      only=getattr(args, "only", None))
+
+    print("  ".join(f"{table}={rows}" for table, rows in table_rows.items()))
+    baseline = {}
+    if getattr(args, "baseline", None):
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file).get("queries", {})
+    print(f"{'query':<45} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'rows':>8}" + ("  p50 vs baseline" if baseline else ""))
+    for name, stats in results.items():
+        line = f"{name:<45} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} {stats['max_ms']:>9.3f} {stats['rows']:>8.1f}"
+        if name in baseline and baseline[name]["p50_ms"]:
+            line += f"  {(stats['p50_ms'] / baseline[name]['p50_ms'] - 1) * 100:+.0f}%"
+        print(line)
+        if getattr(args, "show_plans", False) and stats["plan"]:
+            print("\n".join("    " + plan_line for plan_line in stats["plan"]))
+
+    if getattr(args, "output", None):
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump({
+                "meta": {
+                    "database": db.DB_NAME,
+                    "repeat": repeat,
+                    "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "table_rows": table_rows,
+                },
+                "queries": results,
+            }, output_file, indent=2)
+        print(f"Saved results to {args.output}")
@@ -0,0 +1,51 @@
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from functions import resize_image, resize_images, IMAGE_WORKERS, IMAGE_WORKERS_PER_SESSION  # noqa: E402
+from resize_bench import make_image  # noqa: E402
+
+
+def serial(images):
+    return [resize_image(image_bytes) for image_bytes in images]
+
+
+def pooled(images):
+    return resize_images(images)
+
+
+# Median wall time (ms) for `sessions` concurrent sessions each preprocessing the same upload
+def bench(func, images, sessions, repeat):
+    timings = []
+    for _ in range(repeat):
+        threads = [threading.Thread(target=func, args=(images,)) for _ in range(sessions)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare serial and pooled preprocessing of an upload.")
+    parser.add_argument("--images", type=int, default=6)
+    parser.add_argument("--sessions", type=int, default=1, help="concurrent sessions uploading at once")
+    parser.add_argument("--format", default="JPEG", choices=["JPEG", "PNG", "WEBP"])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    images = [make_image(args.format) for _ in range(args.images)]
+    resize_images(images[:2])  # start the pool threads outside the timed runs
+
+    print(f"{args.images} x {args.format} 4032x3024, {args.sessions} session(s), "
+          f"pool={IMAGE_WORKERS} workers, per-session cap={IMAGE_WORKERS_PER_SESSION}, cpus={os.cpu_count()}")
+    total = args.images * args.sessions
+    for name, func in (("serial", serial), ("pooled", pooled)):
+        elapsed = bench(func, images, args.sessions, args.repeat)
+        print(f"{name:<7} {elapsed:>8.1f}ms  {total / elapsed * 1000:>6.1f} images/s")
@@ -0,0 +1,265 @@
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.logger import set_log_level  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+from streamlit.testing.v1 import element_tree  # noqa: E402
+
+import db  # noqa: E402
+import llm  # noqa: E402
+from functions import resize_image  # noqa: E402
+from migrations import bootstrap  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, "app.py")
+BENCH_USERNAME = "rerun_bench"
+
+
+# AppTest in Streamlit 1.43 assumes every st.pills/segmented_control value is a list and
+# fails on single-select pills (choose_meal) whose value is None or a plain option
+def _button_group_indices(self):
+    value = self.value
+    if value is None:
+        return []
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    return [self.options.index(self.format_func(v)) for v in value]
+
+
+element_tree.ButtonGroup.indices = property(_button_group_indices)
+# Cached helpers called outside a script run warn about a missing ScriptRunContext; keep the report readable
+set_log_level("error")
+
+
+# Create the benchmark user and give it exactly `recipes` saved recipes and no habits
+def reset_bench_user(recipes):
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO users (username, email, password_hash)
+            VALUES (%s, %s, 'x')
+            ON CONFLICT (username) DO UPDATE SET email = EXCLUDED.email
+            RETURNING id
+        """, (BENCH_USERNAME, BENCH_USERNAME + "@example.com"))
+        user_id = cur.fetchone()[0]
+        cur.execute("DELETE FROM saved_recipes WHERE user_id = %s", (user_id,))
+        cur.execute("DELETE FROM analysis_results WHERE user_id = %s", (user_id,))
+        cur.execute("""
+            INSERT INTO saved_recipes (user_id, recipe_title, recipe_content, meal_type, saved_at)
+            SELECT %s, 'Bench recipe ' || g, repeat('Step. ', 200),
+                   (ARRAY['Breakfast', 'Lunch', 'Dinner', 'Snack', 'Other'])[1 + g %% 5],
+                   now() - (g || ' hours')::interval
+            FROM generate_series(1, %s) g
+        """, (user_id, recipes))
+        cur.close()
+    return user_id
+
+
+# Remove the benchmark user; saved recipes, habits and aggregates follow by cascade and triggers
+def drop_bench_user():
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM users WHERE username = %s", (BENCH_USERNAME,))
+        cur.close()
+
+
+# Distinct photo-like thumbnails, different for every iteration so the LLM response cache stays cold
+def make_uploads(iteration, count=4):
+    rng = np.random.default_rng(iteration)
+    uploads = []
+    for _ in range(count):
+        blocks = (rng.random((6, 8, 3)) * 255).astype("uint8")
+        buffer = io.BytesIO()
+        Image.fromarray(blocks).resize((1200, 900), Image.Resampling.BICUBIC).save(buffer, "JPEG")
+        uploads.append(resize_image(buffer.getvalue()))
+    return uploads
+
+
+def button(at, label):
+    matches = [b for b in at.button if b.label == label]
+    if not matches:
+        raise RuntimeError(f"No button labelled {label!r} on the page")
+    return matches[0]
+
+
+def navigate(at, section):
+    return at.radio(key="nav_section").set_value(section)
+
+
+# One scripted user journey; yields (step name, action) pairs, each action triggering one rerun
+def journey(at, user_id, iteration):
+    prefix = f"{user_id}_"
+
+    yield "open app", lambda: at
+    # Habit: the uploader cannot be driven headlessly, so the resized uploads are put in
+    # session state the way image_upload() leaves them
+    at.session_state[prefix + "uploaded_images"] = make_uploads(iteration)
+    at.session_state[prefix + "keep_uploaded_images"] = True
+    yield "analyze images", lambda: button(at, "Analyze").click()
+
+    yield "open Goal", lambda: navigate(at, "Goal")
+
+    def fill_profile():
+        for widget in at.number_input:
+            if widget.label == "Age":
+                widget.set_value(30 + iteration % 20)
+            elif widget.label == "Weight (kg)":
+                widget.set_value(70.0)
+            elif widget.label == "Height (cm)":
+                widget.set_value(175.0)
+        return button(at, "Save").click()
+    yield "save profile", fill_profile
+    yield "generate nutrition", lambda: button(at, "Generate").click()
+
+    yield "open Recipe", lambda: navigate(at, "Recipe")
+    yield "move slider", lambda: at.slider(key=prefix + "cook_time").set_value(20 + iteration % 30)
+
+    def get_recipe():
+        at.session_state[prefix + "notes"] = f"benchmark run {iteration}"
+        return button(at, "Get Recipe").click()
+    yield "get recipe", get_recipe
+    yield "save recipe", lambda: button(at, "Save Recipe").click()
+
+    yield "open Profile", lambda: navigate(at, "Profile")
+    yield "open Rank", lambda: navigate(at, "Rank")
+
+
+# Run every journey step once, returning {step: (wall_ms, queries, alloc_peak_kb or None)}
+def run_journey(user_id, iteration, trace_allocations=False):
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.session_state["logged_in"] = True
+    at.session_state["user_id"] = user_id
+    at.session_state["username"] = BENCH_USERNAME
+    at.session_state["profile_synced"] = True
+
+    results = {}
+    for name, action in journey(at, user_id, iteration):
+        queries_before = db.query_count()
+        if trace_allocations:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        action().run()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        alloc_kb = None
+        if trace_allocations:
+            alloc_kb = (tracemalloc.get_traced_memory()[1] - memory_before) / 1024
+        if at.exception:
+            raise RuntimeError(f"Step {name!r} raised: {at.exception[0].value}")
+        results[name] = (elapsed_ms, db.query_count() - queries_before, alloc_kb)
+    return results
+
+
+# Nearest-rank percentile
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(timed_runs, traced_run):
+    steps = {}
+    for name in timed_runs[0]:
+        timings = [run[name][0] for run in timed_runs]
+        queries = [run[name][1] for run in timed_runs]
+        steps[name] = {
+            "p50_ms": round(percentile(timings, 50), 2),
+            "p95_ms": round(percentile(timings, 95), 2),
+            "queries": round(sum(queries) / len(queries), 2),
+            "alloc_peak_kb": round(traced_run[name][2], 1) if traced_run else None,
+        }
+    return steps
+
+
+# Steps slower or chattier than the baseline beyond the tolerance
+def compare(steps, baseline, tolerance, noise_ms):
+    regressions = []
+    for name, current in steps.items():
+        previous = baseline.get("steps", {}).get(name)
+        if previous is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            limit = previous[metric] * (1 + tolerance)
+            if current[metric] > limit and current[metric] - previous[metric] > noise_ms:
+                regressions.append(f"{name}: {metric} {previous[metric]} -> {current[metric]}")
+        if current["queries"] > previous["queries"]:
+            regressions.append(f"{name}: queries {previous['queries']} -> {current['queries']}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rerun latency of the main user journeys, driven headlessly with AppTest.")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1, help="untimed journeys run first (imports, caches)")
+    parser.add_argument("--recipes", type=int, default=50, help="saved recipes shown in the Profile section")
+    parser.add_argument("--llm-profile", default="instant", choices=sorted(llm.STUB_PROFILES),
+                        help="latency profile of the stub LLM")
+    parser.add_argument("--cassette", help="replay recorded LLM exchanges instead of the stub")
+    parser.add_argument("--no-alloc", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--baseline", help="JSON baseline to compare against; exits 1 on regressions")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--noise-ms", type=float, default=5.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    success, message = bootstrap()
+    if not success:
+        raise SystemExit(f"Database not available: {message}")
+    if args.cassette:
+        llm.set_backend(llm.CassetteBackend(args.cassette, "replay", match="model"))
+    else:
+        llm.set_backend(llm.StubBackend(args.llm_profile))
+
+    timed_runs, traced_run = [], None
+    try:
+        for iteration in range(args.warmup + args.iterations):
+            user_id = reset_bench_user(args.recipes)
+            run = run_journey(user_id, iteration)
+            if iteration >= args.warmup:
+                timed_runs.append(run)
+        if not args.no_alloc:
+            user_id = reset_bench_user(args.recipes)
+            tracemalloc.start()
+            traced_run = run_journey(user_id, args.warmup + args.iterations, trace_allocations=True)
+            tracemalloc.stop()
+    finally:
+        drop_bench_user()
+
+    steps = summarize(timed_runs, traced_run)
+    print(f"{'step':<20} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'alloc KB':>9}")
+    for name, stats in steps.items():
+        alloc = "-" if stats["alloc_peak_kb"] is None else f"{stats['alloc_peak_kb']:.0f}"
+        print(f"{name:<20} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['queries']:>8.1f} {alloc:>9}")
+
+    result = {
+        "meta": {
+            "iterations": args.iterations,
+            "recipes": args.recipes,
+            "llm": f"cassette:{args.cassette}" if args.cassette else f"stub:{args.llm_profile}",
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "steps": steps,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(result, baseline_file, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = compare(steps, json.load(baseline_file), args.tolerance, args.noise_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        raise SystemExit(1 if regressions else 0)
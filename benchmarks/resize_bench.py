@@ -0,0 +1,69 @@
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from functions import resize_image  # noqa: E402
+
+
+# Synthetic photo-like image (smooth gradients), optionally tagged with an EXIF orientation
+def make_image(image_format, size=(4032, 3024), orientation=6):
+    y, x = np.mgrid[0:size[1], 0:size[0]]
+    pixels = np.stack([x * 255 // size[0], y * 255 // size[1], (x + y) % 256], axis=-1).astype("uint8")
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, image_format, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+# Reference path: decode every pixel, then orient and shrink
+def full_decode_resize(image_bytes, max_size=(300, 300)):
+    image = Image.open(io.BytesIO(image_bytes))
+    image_format = image.format
+    image.load()
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(max_size)
+    new_image_bytes = io.BytesIO()
+    image.save(new_image_bytes, format=image_format)
+    return new_image_bytes.getvalue()
+
+
+# Pixels the decoder actually produces before the final resample
+def decoded_megapixels(image_bytes, max_size=(300, 300)):
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.format == "JPEG":
+        side = max(max_size) * 2
+        image.draft(image.mode, (side, side))
+    return image.width * image.height / 1e6
+
+
+def bench(func, image_bytes, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(image_bytes)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare resize_image with a full-resolution decode.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    args = parser.parse_args()
+
+    print(f"{'format':<6} {'full decode':>12} {'resize_image':>13} {'speedup':>8} {'decoded MP':>11}")
+    for image_format in ("JPEG", "PNG", "WEBP"):
+        image_bytes = make_image(image_format, (args.width, args.height))
+        full = bench(full_decode_resize, image_bytes, args.repeat)
+        fast = bench(resize_image, image_bytes, args.repeat)
+        megapixels = decoded_megapixels(image_bytes)
+        print(f"{image_format:<6} {full:>10.1f}ms {fast:>11.1f}ms {full / fast:>7.1f}x {megapixels:>11.2f}")
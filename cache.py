@@ -0,0 +1,174 @@
+import functools
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# How long cached reads stay fresh unless invalidated earlier
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+
+
+# Turn lists into tuples, recursively, so a cached value cannot be mutated by one session under another
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class TTLCache:
+    """
+    Process-wide read cache shared by every Streamlit session.
+
+    Entries are grouped in namespaces (e.g. "habits", "feedback") so that a
+    write can invalidate every read it affects with one call. Each namespace
+    carries a generation number: a load that started before an invalidation
+    is not stored, so a slow read can never put stale data back in the cache.
+    """
+
+    def __init__(self, ttl=CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries = {}  # (namespace, key) -> (value, expires_at)
+        self._generations = {}  # namespace -> int
+        self._key_locks = {}  # (namespace, key) -> [Lock, users], so only one session loads a missing key
+        self._stats = {}  # namespace -> {"hits": int, "misses": int}
+        self._lock = threading.Lock()
+
+    def _count(self, namespace, field):
+        counters = self._stats.setdefault(namespace, {"hits": 0, "misses": 0, "invalidations": 0})
+        counters[field] += 1
+
+    def _lookup(self, entry_key):
+        entry = self._entries.get(entry_key)
+        if entry is not None and entry[1] > time.monotonic():
+            return True, entry[0]
+        return False, None
+
+    def get_or_load(self, namespace, key, loader, ttl=None):
+        """
+        Return the cached value for key, calling loader() on a miss. None results are not cached.
+
+        Values are shared by every session, so lists in them are stored (and
+        returned, including to the caller that loaded them) as tuples.
+        """
+        entry_key = (namespace, key)
+        with self._lock:
+            found, value = self._lookup(entry_key)
+            if found:
+                self._count(namespace, "hits")
+                return value
+            # [lock, callers holding or waiting for it]; removed when the last one leaves,
+            # so a caller arriving meanwhile still queues behind the load in progress
+            slot = self._key_locks.get(entry_key)
+            if slot is None:
+                slot = self._key_locks[entry_key] = [threading.Lock(), 0]
+            slot[1] += 1
+
+        try:
+            with slot[0]:
+                # Another session may have loaded the value while we waited
+                with self._lock:
+                    found, value = self._lookup(entry_key)
+                    if found:
+                        self._count(namespace, "hits")
+                        return value
+                    self._count(namespace, "misses")
+                    generation = self._generations.get(namespace, 0)
+
+                value = _freeze(loader())
+
+                with self._lock:
+                    if value is not None and self._generations.get(namespace, 0) == generation:
+                        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+                        self._entries[entry_key] = (value, expires_at)
+                return value
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if slot[1] == 0:
+                    self._key_locks.pop(entry_key, None)
+
+    def invalidate(self, namespace=None):
+        """Drop every entry in namespace, or the whole cache when namespace is None."""
+        with self._lock:
+            namespaces = set(self._generations) | {ns for ns, _ in self._entries} if namespace is None else {namespace}
+            for ns in namespaces:
+                self._generations[ns] = self._generations.get(ns, 0) + 1
+                self._count(ns, "invalidations")
+            self._entries = {
+                entry_key: entry for entry_key, entry in self._entries.items()
+                if entry_key[0] not in namespaces
+            }
+
+    def stats(self):
+        """Hit/miss/invalidation counters and current size per namespace."""
+        with self._lock:
+            result = {ns: dict(counters) for ns, counters in self._stats.items()}
+            for ns, _ in self._entries:
+                result.setdefault(ns, {"hits": 0, "misses": 0, "invalidations": 0})
+            for ns, counters in result.items():
+                counters["size"] = sum(1 for entry_ns, _ in self._entries if entry_ns == ns)
+                total = counters["hits"] + counters["misses"]
+                counters["hit_rate"] = counters["hits"] / total if total else 0.0
+            return result
+
+
+_cache = TTLCache()
+
+
+# Decorator caching a function's result in the shared cache under namespace
+def cached(namespace, ttl=None):
+    """
+    Cache a read function's results for every session in the process.
+
+    Args:
+        namespace (str): Group invalidated together by writes, e.g. "habits"
+        ttl (float): Seconds to keep results, defaults to CACHE_TTL_SECONDS
+
+    Example:
+        @cached("feedback")
+        def get_recent_comments(limit=5):
+            ...
+
+    The undecorated function stays available as `func.uncached`.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())))
+            return _cache.get_or_load(namespace, key, lambda: func(*args, **kwargs), ttl)
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+# Invalidate cached reads after a write; call with no namespace to clear everything
+def invalidate(namespace=None):
+    _cache.invalidate(namespace)
+
+
+# Hit/miss counters per namespace
+def cache_stats():
+    return _cache.stats()
+
+
+# Cache counters in the sidebar, shown to TRACE_ADMINS only
+def cache_panel():
+    from tracing import is_admin
+    if not is_admin():
+        return
+    import pandas as pd
+    import streamlit as st
+
+    stats = cache_stats()
+    with st.sidebar:
+        st.subheader("Cache")
+        if not stats:
+            st.caption("No cached reads yet")
+            return
+        df = pd.DataFrame.from_dict(stats, orient="index")[["hits", "misses", "invalidations", "size", "hit_rate"]]
+        df["hit_rate"] = (df["hit_rate"] * 100).round(1)
+        st.dataframe(df.rename(columns={"hit_rate": "hit %"}), use_container_width=True)
@@ -0,0 +1,406 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, sql
+from dotenv import load_dotenv
+
+from tracing import span
+
+# Load environment variables
+load_dotenv()
+
+# Database connection parameters
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = os.getenv("DB_PORT")
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+
+# Connection pool parameters
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Idle connections older than this are pinged with SELECT 1 before being handed out
+DB_POOL_HEALTH_CHECK_AFTER = float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no pooled connection becomes available within the checkout timeout."""
+
+
+_query_count = 0
+_query_count_lock = threading.Lock()
+
+
+# First line of a statement, as a short label for traces
+def _statement_label(query):
+    text = query if isinstance(query, str) else str(query)
+    return " ".join(text.split())[:120]
+
+
+class CountingCursor(extensions.cursor):
+    """
+    Cursor that counts the statements sent to the server (see query_count())
+    and records each one as a "db.execute" span when the rerun is traced.
+    """
+
+    def execute(self, query, vars=None):
+        global _query_count
+        with _query_count_lock:
+            _query_count += 1
+        with span("db.execute", sql=_statement_label(query)):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        global _query_count
+        with _query_count_lock:
+            _query_count += 1
+        with span("db.executemany", sql=_statement_label(query)):
+            return super().executemany(query, vars_list)
+
+
+# Number of statements executed through pooled connections since the process started
+def query_count():
+    return _query_count
+
+
+class PooledConnection:
+    """
+    Thin proxy around a psycopg2 connection checked out from a ConnectionPool.
+
+    It behaves like the underlying connection, except that close() hands the
+    connection back to the pool instead of closing the socket, so existing
+    `conn = get_db_connection() ... conn.close()` code keeps working unchanged.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(conn, name)
+
+    def __setattr__(self, name, value):
+        if name in ("_pool", "_conn"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    @property
+    def closed(self):
+        conn = self.__dict__.get("_conn")
+        return 1 if conn is None else conn.closed
+
+    def close(self):
+        conn = self.__dict__.get("_conn")
+        if conn is not None:
+            self._conn = None
+            self._pool.release(conn)
+
+    def discard(self):
+        """Close the underlying connection instead of returning it, e.g. when it may hold session state."""
+        conn = self.__dict__.get("_conn")
+        if conn is not None:
+            self._conn = None
+            self._pool._discard(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        conn = self.__dict__.get("_conn")
+        if conn is not None:
+            if exc_type is None:
+                conn.commit()
+            else:
+                conn.rollback()
+        self.close()
+
+    def __del__(self):
+        # Safety net for code paths that return early without calling close()
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe, process-wide pool of psycopg2 connections.
+
+    Connections are created lazily up to max_size, checked for health before
+    being handed out, and rolled back to a clean state when returned.
+    """
+
+    def __init__(self, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 timeout=DB_POOL_TIMEOUT, health_check_after=DB_POOL_HEALTH_CHECK_AFTER,
+                 **connect_kwargs):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self.connect_kwargs = connect_kwargs
+        self._idle = []  # list of (connection, returned_at)
+        self._size = 0  # connections currently owned by the pool (idle + checked out)
+        self._closed = False
+        self._cond = threading.Condition()
+
+        for _ in range(min_size):
+            conn = self._connect()
+            with self._cond:
+                self._size += 1
+                self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs)
+
+    def _is_healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def getconn(self, timeout=None):
+        """Check out a connection, waiting up to `timeout` seconds for one to become free."""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise psycopg2.InterfaceError("connection pool is closed")
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        conn, returned_at = None, None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"Timed out after {timeout:.1f}s waiting for a database connection "
+                            f"(pool max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+
+            # Open or validate outside the lock so slow network calls do not block other threads
+            if conn is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            if self._is_healthy(conn, returned_at):
+                return conn
+            self._discard(conn)
+
+    def putconn(self, conn):
+        """Return a connection to the pool, discarding it if it is broken."""
+        if conn.closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            if self._closed:
+                conn.close()
+                self._size -= 1
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    # Alias used by PooledConnection.close()
+    release = putconn
+
+    def connection(self, timeout=None):
+        """Check out a connection wrapped so that close() returns it to this pool."""
+        return PooledConnection(self, self.getconn(timeout))
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max_size": self.max_size,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_database_ready = False
+_database_lock = threading.Lock()
+
+
+# Create the application database if it does not exist yet
+def ensure_database():
+    """
+    One-time provisioning step, run at process start or via `python db.py`.
+
+    Connects to the `postgres` maintenance database only the first time it is
+    called in a process, so regular queries never pay for the existence probe.
+
+    Returns:
+        tuple: (success, message)
+    """
+    global _database_ready
+    if _database_ready:
+        return True, "Database already provisioned"
+    with _database_lock:
+        if _database_ready:
+            return True, "Database already provisioned"
+        try:
+            conn = psycopg2.connect(
+                host=DB_HOST,
+                port=DB_PORT,
+                database="postgres",  # Connect to default database first
+                user=DB_USER,
+                password=DB_PASSWORD,
+                connect_timeout=DB_CONNECT_TIMEOUT,
+            )
+        except Exception as e:
+            return False, str(e)
+        try:
+            conn.autocommit = True  # CREATE DATABASE cannot run inside a transaction
+            cur = conn.cursor()
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (DB_NAME,))
+            if cur.fetchone() is None:
+                cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(DB_NAME)))
+                message = f"Created database {DB_NAME}"
+            else:
+                message = f"Database {DB_NAME} already exists"
+            cur.close()
+            _database_ready = True
+            return True, message
+        except Exception as e:
+            return False, str(e)
+        finally:
+            conn.close()
+
+
+# Get the process-wide connection pool, creating it on first use
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    host=DB_HOST,
+                    port=DB_PORT,
+                    database=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    connect_timeout=DB_CONNECT_TIMEOUT,
+                    cursor_factory=CountingCursor,
+                )
+    return _pool
+
+
+# Close every pooled connection, e.g. before the process exits
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+# Check out a pooled connection; close() on it returns it to the pool
+def get_db_connection(timeout=None):
+    with span("db.connect"):
+        return get_pool().connection(timeout)
+
+
+# Check whether the application database is reachable, reusing a pooled connection when possible
+def is_available(timeout=3):
+    """
+    Return True if a connection can be checked out, False on any other failure.
+
+    A pool that stays full for `timeout` seconds means the database is busy,
+    not down: PoolTimeout is raised so the caller can ask the user to retry
+    instead of switching to the no-database code paths.
+    """
+    try:
+        get_db_connection(timeout).close()
+        return True
+    except PoolTimeout:
+        raise
+    except Exception:
+        return False
+
+
+@contextmanager
+def connection(timeout=None):
+    """
+    Context manager around a pooled connection.
+
+    Commits when the block exits normally, rolls back on error, and always
+    returns the connection to the pool.
+
+    Example:
+        with connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+    """
+    conn = get_db_connection(timeout)
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    success, message = ensure_database()
+    print(message)
+    raise SystemExit(0 if success else 1)
@@ -1,12 +1,9 @@
 import streamlit as st
 from functions import get_session_key
-from history import save_feedback, get_average_rating, get_recent_comments, init_db, get_db_connection
+from history import save_feedback, get_feedback_stats, get_recent_comments
 
 
 def feedback():
-    # Initialize database tables if they don't exist
-    init_db()
-    
     session_key_q1 = get_session_key("q1")
     session_key_feedback_text = get_session_key("feedback_text")
 
@@ -46,23 +43,9 @@ def feedback():
 
 
 def feedback_score():
-    # Get average rating from database
-    avg_rating = get_average_rating()
-    
-    # Get total number of ratings
-    conn = get_db_connection()
-    total_ratings = 0
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("SELECT COUNT(*) FROM feedback")
-            total_ratings = cur.fetchone()[0]
-            cur.close()
-            conn.close()
-        except Exception as e:
-            st.error(f"Error retrieving rating count: {e}")
-            if conn:
-                conn.close()
+    # Get average rating and total number of ratings in one read
+    stats = get_feedback_stats()
+    avg_rating, total_ratings = (stats[0], stats[1]) if stats else (None, 0)
     
     st.markdown("""
     <div style="text-align: center;">
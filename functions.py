@@ -1,17 +1,203 @@
+import hashlib
 import io
-from PIL import Image
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from PIL import Image, ImageOps
+import numpy as np
 import random
 import uuid
 import streamlit as st
+from tracing import traced, propagate
 
+# Image preprocessing runs on a pool shared by every session; Pillow releases the GIL
+# while decoding and resampling, so threads scale across cores. Each session keeps at
+# most IMAGE_WORKERS_PER_SESSION images in flight so one large upload cannot starve others.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+IMAGE_WORKERS_PER_SESSION = int(os.getenv("IMAGE_WORKERS_PER_SESSION", "2"))
 
+_image_pool = None
+_image_pool_lock = threading.Lock()
+
+# Images whose 64-bit difference hashes differ in at most this many bits count as the same photo
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("NEAR_DUPLICATE_DISTANCE", "6"))
+
+# Images sent to Gemini are re-encoded to one compact format, lowering the quality
+# step by step until each one fits the byte budget (or MODEL_IMAGE_MIN_QUALITY is reached)
+MODEL_IMAGE_FORMAT = os.getenv("MODEL_IMAGE_FORMAT", "JPEG").upper()
+MODEL_IMAGE_QUALITY = int(os.getenv("MODEL_IMAGE_QUALITY", "75"))
+MODEL_IMAGE_MIN_QUALITY = int(os.getenv("MODEL_IMAGE_MIN_QUALITY", "40"))
+MODEL_IMAGE_MAX_BYTES = int(os.getenv("MODEL_IMAGE_MAX_BYTES", str(48 * 1024)))
+MODEL_IMAGE_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+# Decode at reduced scale where possible, because only a thumbnail is kept
+# (scaled to at least RESIZE_REDUCING_GAP x the target, then resampled properly)
+RESIZE_REDUCING_GAP = 2
+
+@traced("image.resize")
 def resize_image(image_bytes, max_size=(300, 300)):
     image = Image.open(io.BytesIO(image_bytes))
+    image_format = image.format or "PNG"
+    # A square box, because EXIF orientation may swap width and height
+    side = max(max_size) * RESIZE_REDUCING_GAP
+    if image_format == "JPEG":
+        # Let the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding (DCT scaling)
+        image.draft(image.mode, (side, side))
+    elif image.mode not in ("P", "1"):
+        # Bounded box-filter reduction before the full-quality resample
+        # (palette and bilevel images cannot be reduced without converting them)
+        factor = min(image.width, image.height) // side
+        if factor >= 2:
+            image = image.reduce(factor)
+    image = ImageOps.exif_transpose(image)
     image.thumbnail(max_size)
     new_image_bytes = io.BytesIO()
-    image.save(new_image_bytes, format=image.format or "PNG")
+    image.save(new_image_bytes, format=image_format)
     return new_image_bytes.getvalue()
 
+# Get the process-wide image worker pool, creating it on first use
+def get_image_pool():
+    global _image_pool
+    if _image_pool is None:
+        with _image_pool_lock:
+            if _image_pool is None:
+                _image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+    return _image_pool
+
+# Resize several images on the shared pool, keeping at most max_in_flight of them queued at once
+def resize_images(images, max_in_flight=None):
+    """
+    Resize images in parallel and return the results in input order.
+
+    Args:
+        images (list): Raw image bytes
+        max_in_flight (int): Per-session cap, defaults to IMAGE_WORKERS_PER_SESSION
+
+    Returns:
+        list: Resized image bytes
+    """
+    max_in_flight = IMAGE_WORKERS_PER_SESSION if max_in_flight is None else max_in_flight
+    if len(images) <= 1 or max_in_flight <= 1:
+        return [resize_image(image_bytes) for image_bytes in images]
+
+    pool = get_image_pool()
+    results = [None] * len(images)
+    pending = {}
+    next_index = 0
+    while next_index < len(images) or pending:
+        while next_index < len(images) and len(pending) < max_in_flight:
+            pending[pool.submit(propagate(resize_image), images[next_index])] = next_index
+            next_index += 1
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[pending.pop(future)] = future.result()
+    return results
+
+# Resize uploaded files, reusing results from earlier reruns of the same uploads
+def resize_uploads(uploaded_files):
+    """
+    Return the resized bytes of each upload, in upload order.
+
+    Results are memoized in session state by the upload's file_id (or a hash
+    of its content when there is none), so a rerun with unchanged uploads
+    does no decoding or resizing. Entries for removed uploads are dropped.
+    """
+    session_key_resized = get_session_key("resized_uploads")
+    memo = st.session_state.get(session_key_resized, {})
+    memo_keys = []
+    missing = {}  # memo_key -> raw bytes still to be resized
+    for file in uploaded_files:
+        memo_key = getattr(file, "file_id", None)
+        if memo_key is None or memo_key not in memo:
+            image_bytes = file.getvalue()
+            if memo_key is None:
+                memo_key = hashlib.sha256(image_bytes).hexdigest()
+            if memo_key not in memo:
+                missing[memo_key] = image_bytes
+        memo_keys.append(memo_key)
+
+    if missing:
+        memo.update(zip(missing, resize_images(list(missing.values()))))
+
+    st.session_state[session_key_resized] = {memo_key: memo[memo_key] for memo_key in memo_keys}
+    return [memo[memo_key] for memo_key in memo_keys]
+
+# Difference hash (dHash) of an image as an int: one bit per horizontally adjacent pixel pair
+def dhash(image_bytes, hash_size=8):
+    image = Image.open(io.BytesIO(image_bytes))
+    image = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+# Drop near-duplicate images (burst shots, the same meal photographed twice), keeping the first of each
+def remove_near_duplicates(images, max_distance=None):
+    """
+    Collapse near-duplicates using perceptual difference hashes.
+
+    Args:
+        images (list): Image bytes, e.g. the resized upload thumbnails
+        max_distance (int): Hamming distance treated as a duplicate,
+            defaults to NEAR_DUPLICATE_DISTANCE
+
+    Returns:
+        list: The distinct images, in upload order
+    """
+    max_distance = NEAR_DUPLICATE_DISTANCE if max_distance is None else max_distance
+    kept, kept_hashes = [], []
+    for image_bytes in images:
+        image_hash = dhash(image_bytes)
+        if all(bin(image_hash ^ other).count("1") > max_distance for other in kept_hashes):
+            kept.append(image_bytes)
+            kept_hashes.append(image_hash)
+    return kept
+
+# Re-encode an image for the model and return it as an inline-data part
+def encode_image_for_model(image_bytes, image_format=None, quality=None, max_bytes=None):
+    """
+    Build the Gemini part for one image: raw bytes with the matching MIME type.
+
+    Args:
+        image_bytes (bytes): Image in any format Pillow can read
+        image_format (str): "JPEG", "WEBP" or "PNG", defaults to MODEL_IMAGE_FORMAT
+        quality (int): Starting quality for lossy formats, defaults to MODEL_IMAGE_QUALITY
+        max_bytes (int): Byte budget per image, defaults to MODEL_IMAGE_MAX_BYTES
+
+    Returns:
+        dict: {"mime_type": ..., "data": bytes}
+    """
+    image_format = (image_format or MODEL_IMAGE_FORMAT).upper()
+    quality = MODEL_IMAGE_QUALITY if quality is None else quality
+    max_bytes = MODEL_IMAGE_MAX_BYTES if max_bytes is None else max_bytes
+    if image_format not in MODEL_IMAGE_MIME_TYPES:
+        raise ValueError(f"Unsupported model image format: {image_format}")
+
+    image = Image.open(io.BytesIO(image_bytes))
+    # Already in the target format and within budget: send as is rather than lose quality again
+    if image.format == image_format and len(image_bytes) <= max_bytes:
+        return {"mime_type": MODEL_IMAGE_MIME_TYPES[image_format], "data": image_bytes}
+
+    if image_format == "JPEG" and image.mode != "RGB":
+        # JPEG has no alpha channel: flatten transparent images onto white
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+    while True:
+        buffer = io.BytesIO()
+        if image_format == "PNG":
+            image.save(buffer, format="PNG", optimize=True)
+        else:
+            image.save(buffer, format=image_format, quality=quality)
+        data = buffer.getvalue()
+        if len(data) <= max_bytes or image_format == "PNG" or quality <= MODEL_IMAGE_MIN_QUALITY:
+            return {"mime_type": MODEL_IMAGE_MIME_TYPES[image_format], "data": data}
+        quality = max(MODEL_IMAGE_MIN_QUALITY, quality - 10)
+
 def pick_random_number(lower, upper):
     return random.uniform(lower, upper)
 
@@ -23,6 +209,14 @@ def get_user_id():
 def get_session_key(base_key):
     return f"{get_user_id()}_{base_key}"
 
+def persist_widget_state(base_keys):
+    """Keep widget values alive across reruns in which their section is not rendered."""
+    for base_key in base_keys:
+        key = get_session_key(base_key)
+        if key in st.session_state:
+            # Re-assigning detaches the value from the widget so Streamlit does not clean it up
+            st.session_state[key] = st.session_state[key]
+
 def choose_meal():
     if "meal" not in st.session_state:
         st.session_state.meal = "Other"
@@ -71,7 +265,7 @@ def display_habit_collection():
     """Display the user's habit collection (diet analysis results) from the database."""
     if ('user_id' in st.session_state and st.session_state.user_id and 
         'username' in st.session_state and st.session_state.username != "Demo User"):
-        from history import get_db_connection
+        from history import get_db_connection, USER_HABITS_SQL
         conn = get_db_connection()
         if conn:
             try:
@@ -87,12 +281,7 @@ def display_habit_collection():
                         # we need to handle this case differently
                         return None
                 
-                cur.execute("""
-                    SELECT analysis_text, created_at 
-                    FROM analysis_results 
-                    WHERE user_id = %s
-                    ORDER BY created_at DESC
-                """, (user_id,))
+                cur.execute(USER_HABITS_SQL, (user_id,))
                 
                 analysis_results = cur.fetchall()
                 cur.close()
@@ -1,145 +1,100 @@
 import streamlit as st
-import psycopg2
-import os
-from dotenv import load_dotenv
 from passlib.hash import pbkdf2_sha256
 import re
+import db
+from cache import cached, invalidate
 
-# Load environment variables
-load_dotenv()
+# Statements issued by this module; benchmarks/db_bench.py and tests/test_index_check.py import them
+UPSERT_PROFILE_SQL = """
+    INSERT INTO user_profiles
+    (user_id, name, age, gender, weight, height, activity_level, goal)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        name = EXCLUDED.name,
+        age = EXCLUDED.age,
+        gender = EXCLUDED.gender,
+        weight = EXCLUDED.weight,
+        height = EXCLUDED.height,
+        activity_level = EXCLUDED.activity_level,
+        goal = EXCLUDED.goal,
+        updated_at = CURRENT_TIMESTAMP
+"""
+UPSERT_NUTRITION_SQL = """
+    INSERT INTO user_nutrition
+    (user_id, carbs, protein, fat, calories)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        carbs = EXCLUDED.carbs,
+        protein = EXCLUDED.protein,
+        fat = EXCLUDED.fat,
+        calories = EXCLUDED.calories,
+        updated_at = CURRENT_TIMESTAMP
+"""
+PROFILE_SQL = """
+    SELECT name, age, gender, weight, height, activity_level, goal
+    FROM user_profiles
+    WHERE user_id = %s
+"""
+NUTRITION_SQL = """
+    SELECT carbs, protein, fat, calories
+    FROM user_nutrition
+    WHERE user_id = %s
+"""
+USER_EXISTS_SQL = "SELECT * FROM users WHERE username = %s OR email = %s"
+INSERT_USER_SQL = "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s) RETURNING id"
+LOGIN_SQL = "SELECT id, username, password_hash FROM users WHERE username = %s"
+USER_HABITS_SQL = """
+    SELECT analysis_text, created_at
+    FROM analysis_results
+    WHERE user_id = %s
+    ORDER BY created_at DESC
+"""
+ACCOUNT_SQL = "SELECT username, password_hash, email, created_at FROM users WHERE id = %s"
+NAME_TAKEN_SQL = "SELECT id FROM users WHERE (username = %s OR email = %s) AND id != %s"
+UPDATE_ACCOUNT_SQL = "UPDATE users SET username = %s, email = %s WHERE id = %s"
+UPDATE_ACCOUNT_PASSWORD_SQL = "UPDATE users SET username = %s, email = %s, password_hash = %s WHERE id = %s"
+INSERT_FEEDBACK_SQL = """
+    WITH new_feedback AS (
+        INSERT INTO feedback (user_id, rating, comment)
+        VALUES (%s, %s, %s)
+        RETURNING rating
+    )
+    UPDATE feedback_stats
+    SET rating_sum = rating_sum + new_feedback.rating,
+        rating_count = rating_count + 1,
+        rating_histogram[%s] = rating_histogram[%s] + 1
+    FROM new_feedback
+    WHERE feedback_stats.id
+"""
+FEEDBACK_STATS_SQL = """
+    SELECT rating_sum / NULLIF(rating_count, 0), rating_count, rating_histogram
+    FROM feedback_stats
+"""
+RECENT_COMMENTS_SQL = """
+    SELECT comment, rating, created_at
+    FROM feedback
+    WHERE comment IS NOT NULL AND comment != ''
+    ORDER BY created_at DESC
+    LIMIT %s
+"""
 
-# Database connection parameters
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-
-# Initialize database connection
+# Check out a pooled connection to the application database.
+# The database itself is provisioned once per process by db.ensure_database().
 def get_db_connection():
     try:
-        # First try to connect to the default 'postgres' database to create our database if it doesn't exist
-        try:
-            conn = psycopg2.connect(
-                host=DB_HOST,
-                port=DB_PORT,
-                database="postgres",  # Connect to default database first
-                user=DB_USER,
-                password=DB_PASSWORD
-            )
-            conn.autocommit = True  # Set autocommit to create database
-            cur = conn.cursor()
-            
-            # Check if our database exists
-            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (DB_NAME,))
-            if cur.fetchone() is None:
-                # Create database if it doesn't exist
-                cur.execute(f"CREATE DATABASE {DB_NAME}")
-            
-            cur.close()
-            conn.close()
-        except Exception as e:
-            st.warning(f"Could not create database: {e}")
-            # Continue anyway to try connecting to the database if it already exists
-        
-        # Now connect to our application database
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        return conn
+        return db.get_db_connection()
     except Exception as e:
         st.error(f"Database connection error: {e}")
         st.info("Please make sure PostgreSQL is installed and running with the credentials specified in the .env file.")
         return None
 
-# Create database tables if they don't exist
-def create_tables():
-    conn = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            # Create users table
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    email VARCHAR(100) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Create user_profiles table
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS user_profiles (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                    name VARCHAR(100),
-                    age INTEGER,
-                    gender VARCHAR(20),
-                    weight FLOAT,
-                    height FLOAT,
-                    activity_level VARCHAR(50),
-                    goal VARCHAR(50),
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id)
-                )
-            ''')
-            
-            # Create user_nutrition table
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS user_nutrition (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                    carbs INTEGER,
-                    protein INTEGER,
-                    fat INTEGER,
-                    calories INTEGER,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id)
-                )
-            ''')
-            
-            # Create analysis_results table
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS analysis_results (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                    analysis_text TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Create feedback table
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS feedback (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
-                    rating FLOAT NOT NULL,
-                    comment TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            conn.commit()
-            cur.close()
-            conn.close()
-            return True
-        except Exception as e:
-            st.error(f"Error creating tables: {e}")
-            conn.close()
-            return False
-    return False
-
-# Initialize the database
+# Legacy function for backward compatibility: schema setup now runs once per process in migrations.bootstrap()
 def init_db():
-    if create_tables():
-        return True
-    return False
+    from migrations import bootstrap
+    success, message = bootstrap()
+    return success
 
 # Save user profile to database
 def save_user_profile(user_id, profile_data):
@@ -152,21 +107,7 @@ def save_user_profile(user_id, profile_data):
             cur = conn.cursor()
             
             # Save basic profile information
-            cur.execute("""
-                INSERT INTO user_profiles 
-                (user_id, name, age, gender, weight, height, activity_level, goal)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET 
-                    name = EXCLUDED.name,
-                    age = EXCLUDED.age,
-                    gender = EXCLUDED.gender,
-                    weight = EXCLUDED.weight,
-                    height = EXCLUDED.height,
-                    activity_level = EXCLUDED.activity_level,
-                    goal = EXCLUDED.goal,
-                    updated_at = CURRENT_TIMESTAMP
-            """, (
+            cur.execute(UPSERT_PROFILE_SQL, (
                 user_id, 
                 profile_data.get('name', ''),
                 profile_data.get('age', 0),
@@ -180,18 +121,7 @@ def save_user_profile(user_id, profile_data):
             # Save nutrition information if available
             if 'nutrition' in profile_data:
                 nutrition = profile_data['nutrition']
-                cur.execute("""
-                    INSERT INTO user_nutrition
-                    (user_id, carbs, protein, fat, calories)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (user_id)
-                    DO UPDATE SET
-                        carbs = EXCLUDED.carbs,
-                        protein = EXCLUDED.protein,
-                        fat = EXCLUDED.fat,
-                        calories = EXCLUDED.calories,
-                        updated_at = CURRENT_TIMESTAMP
-                """, (
+                cur.execute(UPSERT_NUTRITION_SQL, (
                     user_id,
                     nutrition.get('carbs', 0),
                     nutrition.get('protein', 0),
@@ -235,11 +165,7 @@ def get_user_profile(user_id):
             cur = conn.cursor()
             
             # Get basic profile information
-            cur.execute("""
-                SELECT name, age, gender, weight, height, activity_level, goal
-                FROM user_profiles
-                WHERE user_id = %s
-            """, (user_id,))
+            cur.execute(PROFILE_SQL, (user_id,))
             
             profile_data = cur.fetchone()
             if profile_data:
@@ -252,11 +178,7 @@ def get_user_profile(user_id):
                 profile['goal'] = profile_data[6]
             
             # Get nutrition information
-            cur.execute("""
-                SELECT carbs, protein, fat, calories
-                FROM user_nutrition
-                WHERE user_id = %s
-            """, (user_id,))
+            cur.execute(NUTRITION_SQL, (user_id,))
             
             nutrition_data = cur.fetchone()
             if nutrition_data:
@@ -295,7 +217,7 @@ def register_user(username, email, password):
         try:
             cur = conn.cursor()
             # Check if username or email already exists
-            cur.execute("SELECT * FROM users WHERE username = %s OR email = %s", (username, email))
+            cur.execute(USER_EXISTS_SQL, (username, email))
             if cur.fetchone():
                 cur.close()
                 conn.close()
@@ -303,7 +225,7 @@ def register_user(username, email, password):
             
             # Insert new user
             cur.execute(
-                "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s) RETURNING id",
+                INSERT_USER_SQL,
                 (username, email, password_hash)
             )
             user_id = cur.fetchone()[0]  # Get the newly created user ID
@@ -322,7 +244,7 @@ def login_user(username, password):
     if conn:
         try:
             cur = conn.cursor()
-            cur.execute("SELECT id, username, password_hash FROM users WHERE username = %s", (username,))
+            cur.execute(LOGIN_SQL, (username,))
             user = cur.fetchone()
             cur.close()
             conn.close()
@@ -338,19 +260,7 @@ def login_user(username, password):
 
 # Check if PostgreSQL is available
 def is_postgres_available():
-    try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            database="postgres",
-            user=DB_USER,
-            password=DB_PASSWORD,
-            connect_timeout=3  # Short timeout to check availability
-        )
-        conn.close()
-        return True
-    except:
-        return False
+    return db.is_available(timeout=3)
 
 # Import profile data from session state to database
 def import_profile_from_session(user_id):
@@ -425,8 +335,14 @@ def user_profile():
     if 'profile_synced' not in st.session_state:
         st.session_state.profile_synced = False
     
-    # Check if PostgreSQL is available
-    postgres_available = is_postgres_available()
+    # Check if PostgreSQL is available (a busy pool is not an outage)
+    try:
+        postgres_available = is_postgres_available()
+    except db.PoolTimeout:
+        st.warning("The database is busy right now. Please try again in a moment.")
+        if st.button("Retry"):
+            st.rerun()
+        return
     
     if not postgres_available:
         st.error("PostgreSQL database is not available.")
@@ -444,9 +360,6 @@ def user_profile():
             st.rerun()
         return
     
-    # Initialize database
-    init_db()
-    
     # Create tabs for login and registration
     if not st.session_state.logged_in:
         tab1, tab2 = st.tabs(["Login", "Sign Up"])
@@ -542,12 +455,7 @@ def user_profile():
                 if conn:
                     try:
                         cur = conn.cursor()
-                        cur.execute("""
-                            SELECT analysis_text, created_at 
-                            FROM analysis_results 
-                            WHERE user_id = %s
-                            ORDER BY created_at DESC
-                        """, (st.session_state.user_id,))
+                        cur.execute(USER_HABITS_SQL, (st.session_state.user_id,))
                         
                         analysis_results = cur.fetchall()
                         cur.close()
@@ -580,7 +488,7 @@ def user_profile():
             if conn:
                 try:
                     cur = conn.cursor()
-                    cur.execute("SELECT username, password_hash, email, created_at FROM users WHERE id = %s", (st.session_state.user_id,))
+                    cur.execute(ACCOUNT_SQL, (st.session_state.user_id,))
                     user_info = cur.fetchone()
                     cur.close()
                     conn.close()
@@ -649,7 +557,7 @@ def user_profile():
                                                     
                                                     # Check if username or email already exists (except for current user)
                                                     cur.execute(
-                                                        "SELECT id FROM users WHERE (username = %s OR email = %s) AND id != %s", 
+                                                        NAME_TAKEN_SQL, 
                                                         (new_username, new_email, st.session_state.user_id)
                                                     )
                                                     
@@ -663,13 +571,13 @@ def user_profile():
                                                             
                                                             # Update all fields including password
                                                             cur.execute(
-                                                                "UPDATE users SET username = %s, email = %s, password_hash = %s WHERE id = %s",
+                                                                UPDATE_ACCOUNT_PASSWORD_SQL,
                                                                 (new_username, new_email, password_hash, st.session_state.user_id)
                                                             )
                                                         else:
                                                             # Update only username and email
                                                             cur.execute(
-                                                                "UPDATE users SET username = %s, email = %s WHERE id = %s",
+                                                                UPDATE_ACCOUNT_SQL,
                                                                 (new_username, new_email, st.session_state.user_id)
                                                             )
                                                         
@@ -737,48 +645,52 @@ def save_feedback(rating, comment):
         try:
             cur = conn.cursor()
             
-            # Insert feedback
-            cur.execute("""
-                INSERT INTO feedback (user_id, rating, comment)
-                VALUES (%s, %s, %s)
-            """, (user_id, rating, comment))
+            # Insert feedback and update the running aggregates in one statement
+            bucket = min(max(int(rating), 0), 10) + 1  # 1-based histogram slot
+            cur.execute(INSERT_FEEDBACK_SQL, (user_id, rating, comment, bucket, bucket))
             
             conn.commit()
             cur.close()
             conn.close()
+            invalidate("feedback")
             return True, "Feedback saved successfully"
         except Exception as e:
             conn.close()
             return False, f"Error saving feedback: {e}"
     return False, "Database connection error"
 
-# Function to get average rating
-def get_average_rating():
+# Function to get the running feedback aggregates
+@cached("feedback")
+def get_feedback_stats():
     """
-    Get the average rating from all feedback.
+    Get the average rating, rating count and rating histogram in one read.
     
     Returns:
-        float or None: Average rating or None if no ratings
+        tuple or None: (average_rating, rating_count, histogram) where
+        average_rating is None if there are no ratings and histogram[i]
+        counts ratings in [i, i + 1), with histogram[10] counting 10.0
     """
     conn = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
             
-            # Get average rating
-            cur.execute("SELECT AVG(rating) FROM feedback")
+            cur.execute(FEEDBACK_STATS_SQL)
             
-            avg_rating = cur.fetchone()[0]
+            row = cur.fetchone()
             cur.close()
             conn.close()
             
-            return avg_rating
+            if row is None:
+                return None, 0, (0,) * 11
+            return row[0], row[1], tuple(row[2])
         except Exception as e:
-            st.error(f"Error retrieving average rating: {e}")
+            st.error(f"Error retrieving feedback statistics: {e}")
             conn.close()
     return None
 
 # Function to get recent comments
+@cached("feedback")
 def get_recent_comments(limit=5):
     """
     Get recent comments from feedback.
@@ -787,7 +699,7 @@ def get_recent_comments(limit=5):
         limit (int): Maximum number of comments to retrieve
         
     Returns:
-        list: List of tuples (comment, rating, created_at)
+        tuple: Tuples (comment, rating, created_at), newest first
     """
     conn = get_db_connection()
     if conn:
@@ -795,13 +707,7 @@ def get_recent_comments(limit=5):
             cur = conn.cursor()
             
             # Get recent comments
-            cur.execute("""
-                SELECT comment, rating, created_at 
-                FROM feedback 
-                WHERE comment IS NOT NULL AND comment != ''
-                ORDER BY created_at DESC
-                LIMIT %s
-            """, (limit,))
+            cur.execute(RECENT_COMMENTS_SQL, (limit,))
             
             comments = cur.fetchall()
             cur.close()
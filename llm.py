@@ -0,0 +1,601 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import google.ai.generativelanguage as glm
+from google.api_core import exceptions as api_exceptions
+from google.generativeai.types import content_types, generation_types
+from dotenv import load_dotenv
+
+from tracing import span, trace_iterator
+
+# Load environment variables once per process instead of on every button press
+load_dotenv()
+
+# Which LLMBackend serves the app: "gemini" (default) or "stub" for offline runs
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+# Latency profile of the stub backend, see STUB_PROFILES
+LLM_STUB_PROFILE = os.getenv("LLM_STUB_PROFILE", "gemini-flash").lower()
+# Record exchanges to, or replay them from, a cassette file (see CassetteBackend)
+LLM_CASSETTE = os.getenv("LLM_CASSETTE") or None
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "replay").lower()
+# "exact": replay only identical requests; "model": fall back to any recording for the same model
+LLM_CASSETTE_MATCH = os.getenv("LLM_CASSETTE_MATCH", "exact").lower()
+# Replay speed factor, e.g. 2 replays twice as fast as recorded
+LLM_CASSETTE_SPEED = float(os.getenv("LLM_CASSETTE_SPEED", "1"))
+
+# API keys tried in order after the caller's own key fails
+API_KEY_ENVS = ("GEMINI_API_KEY", "GEMINI_API_KEY_2", "GEMINI_API_KEY_3")
+
+# Per-request timeout and overall deadline (seconds) for one logical LLM call, retries included
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "120"))
+# Attempts per API key, and the exponential backoff between them
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+
+# Transient errors worth retrying with the same key
+RETRYABLE_ERRORS = (
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    TimeoutError,
+    ConnectionError,
+)
+# Errors tied to one key (quota, invalid or revoked key): move on to the next key straight away
+FAILOVER_ERRORS = (
+    api_exceptions.ResourceExhausted,
+    api_exceptions.TooManyRequests,
+    api_exceptions.PermissionDenied,
+    api_exceptions.Unauthenticated,
+)
+
+
+class LLMError(Exception):
+    """Raised when an LLM call fails on every configured key or runs out of time."""
+
+
+# Generation settings used by the app's Gemini calls
+DIET_ANALYSIS_CONFIG = {
+    "temperature": 1.0,
+    "top_p": 0.95,
+    "top_k": 64,
+    "max_output_tokens": 300,
+    "response_mime_type": "text/plain",
+}
+
+NUTRITION_ADVICE_CONFIG = {
+    "temperature": 0.8,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 1024,
+    "response_mime_type": "text/plain",
+}
+
+RECIPE_CONFIG = {
+    "temperature": 0.8,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+    "response_mime_type": "text/plain",
+}
+
+_clients = {}  # key_env -> GenerativeServiceClient bound to that API key
+_lock = threading.Lock()
+
+
+# Read an API key from the environment, e.g. "GEMINI_API_KEY_2"
+def get_api_key(key_env):
+    return os.environ.get(key_env) or None
+
+
+# Get the shared Gemini client for an API key
+def get_client(key_env):
+    """
+    Return a process-wide GenerativeServiceClient bound to the API key in `key_env`.
+
+    Each key gets its own client, built with the public google.ai.generativelanguage
+    API, so no session ever touches the global genai.configure() state another
+    session relies on. Clients hold no per-conversation state and are shared by
+    every Streamlit session.
+
+    Args:
+        key_env (str): Name of the environment variable holding the API key
+
+    Returns:
+        GenerativeServiceClient or None: None when the API key is not set
+    """
+    client = _clients.get(key_env)
+    if client is not None:
+        return client
+
+    api_key = get_api_key(key_env)
+    if api_key is None:
+        return None
+
+    with _lock:
+        client = _clients.get(key_env)
+        if client is None:
+            client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+            _clients[key_env] = client
+    return client
+
+
+# Build the generateContent request for one chat turn
+def build_request(model_name, generation_config, message, history=()):
+    content = content_types.to_content(message)
+    if not content.role:
+        content.role = "user"
+    return glm.GenerateContentRequest(
+        model=model_name if model_name.startswith("models/") else f"models/{model_name}",
+        contents=[*content_types.to_contents(list(history)), content],
+        generation_config=glm.GenerationConfig(**generation_config),
+    )
+
+
+# Drop every cached client, e.g. after rotating API keys
+def reset_clients():
+    with _lock:
+        _clients.clear()
+
+
+class LLMBackend:
+    """
+    One attempt at a chat turn against some model provider.
+
+    `message` is a text prompt or a list of parts (text and
+    {"mime_type": ..., "data": bytes} images); `history` is a Gemini-style
+    list of {"role": ..., "parts": [...]} turns. send() returns the full text,
+    or when stream=True an iterator of text chunks that is returned once the
+    first chunk is available. Retries, deadlines and key failover are handled
+    by generate_text()/stream_text(), so backends raise the provider errors
+    listed in RETRYABLE_ERRORS and FAILOVER_ERRORS and do not retry.
+
+    When a `usage` dict is passed, backends fill in "prompt_tokens" and
+    "output_tokens" once the response is complete.
+    """
+
+    name = None
+
+    def has_key(self, key_env):
+        return True
+
+    def send(self, key_env, model_name, generation_config, message, history=(), stream=False, timeout=None,
+             usage=None):
+        raise NotImplementedError
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini through the generateContent API, one shared client per API key (see get_client)."""
+
+    name = "gemini"
+
+    def has_key(self, key_env):
+        return get_api_key(key_env) is not None
+
+    def send(self, key_env, model_name, generation_config, message, history=(), stream=False, timeout=None,
+             usage=None):
+        client = get_client(key_env)
+        if client is None:
+            raise api_exceptions.Unauthenticated(f"{key_env} is not set")
+        request = build_request(model_name, generation_config, message, history)
+        options = {"timeout": timeout} if timeout is not None else {}
+        if not stream:
+            response = generation_types.GenerateContentResponse.from_response(
+                client.generate_content(request, **options))
+            self._record_usage(response, usage)
+            return response.text
+        # from_iterator reads the first chunk, so errors before it surface here and are retried
+        response = generation_types.GenerateContentResponse.from_iterator(
+            client.stream_generate_content(request, **options))
+        return self._stream(response, usage)
+
+    def _stream(self, response, usage):
+        for chunk in response:
+            # The token counts arrive with the last chunk
+            self._record_usage(chunk, usage)
+            if chunk.parts:
+                yield chunk.text
+
+    @staticmethod
+    def _record_usage(response, usage):
+        metadata = getattr(response, "usage_metadata", None)
+        if usage is not None and metadata is not None and metadata.candidates_token_count:
+            usage["prompt_tokens"] = metadata.prompt_token_count
+            usage["output_tokens"] = metadata.candidates_token_count
+
+
+# Stub latency profiles: seconds to the first token, tokens per second after it, and response length
+STUB_PROFILES = {
+    "instant": {"first_token_latency": 0.0, "tokens_per_second": None, "response_tokens": 200},
+    "gemini-flash": {"first_token_latency": 0.6, "tokens_per_second": 150, "response_tokens": 250},
+    "gemini-flash-lite": {"first_token_latency": 0.4, "tokens_per_second": 200, "response_tokens": 400},
+    "slow": {"first_token_latency": 3.0, "tokens_per_second": 20, "response_tokens": 400},
+}
+
+_STUB_VOCABULARY = (
+    "rice", "beans", "chicken", "tofu", "salmon", "spinach", "tomato", "garlic", "onion", "lemon",
+    "olive oil", "yogurt", "oats", "berries", "quinoa", "broccoli", "pepper", "basil", "eggs", "lentils",
+    "bake", "simmer", "stir", "season", "serve", "chop", "roast", "grill", "steam", "whisk",
+)
+
+
+class StubBackend(LLMBackend):
+    """
+    Offline backend with deterministic output and a configurable latency profile.
+
+    The response depends only on the model name, generation config, message
+    and history (image parts included), so identical inputs always give
+    identical text. Its length follows `response_tokens`, capped by
+    max_output_tokens. `errors` maps an API key name to a list of exceptions
+    (or None for success) consumed one per call, for exercising the retry
+    and failover paths.
+
+    Example:
+        set_backend(StubBackend(profile="instant", errors={"GEMINI_API_KEY": [ServiceUnavailable("busy")]}))
+    """
+
+    name = "stub"
+
+    def __init__(self, profile=LLM_STUB_PROFILE, first_token_latency=None, tokens_per_second=None,
+                 response_tokens=None, errors=None):
+        settings = dict(STUB_PROFILES[profile])
+        overrides = {
+            "first_token_latency": first_token_latency,
+            "tokens_per_second": tokens_per_second,
+            "response_tokens": response_tokens,
+        }
+        settings.update({k: v for k, v in overrides.items() if v is not None})
+        self.profile = profile
+        self.first_token_latency = settings["first_token_latency"]
+        self.tokens_per_second = settings["tokens_per_second"]
+        self.response_tokens = settings["response_tokens"]
+        self.errors = {key_env: list(queue) for key_env, queue in (errors or {}).items()}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def response_text(self, model_name, generation_config, message, history=()):
+        """The deterministic text returned for these inputs."""
+        seed = request_fingerprint(model_name, generation_config, message, history)
+        image_count = sum(1 for part in _flatten_parts(message, history) if isinstance(part, (bytes, bytearray)))
+        rng = random.Random(seed)
+        tokens = min(self.response_tokens, int(generation_config.get("max_output_tokens", self.response_tokens)))
+        words = [rng.choice(_STUB_VOCABULARY) for _ in range(max(tokens - 4, 1))]
+        title = f"Stub answer {seed[:8]}" + (f" for {image_count} images" if image_count else "")
+        return title + "\n\n" + " ".join(words)
+
+    def send(self, key_env, model_name, generation_config, message, history=(), stream=False, timeout=None,
+             usage=None):
+        with self._lock:
+            self.calls[key_env] = self.calls.get(key_env, 0) + 1
+            queue = self.errors.get(key_env)
+            error = queue.pop(0) if queue else None
+        if timeout is not None and self.first_token_latency > timeout:
+            time.sleep(timeout)
+            raise api_exceptions.DeadlineExceeded(f"Stub request exceeded {timeout:.2f}s")
+        time.sleep(self.first_token_latency)
+        if error is not None:
+            raise error
+
+        text = self.response_text(model_name, generation_config, message, history)
+        if usage is not None:
+            usage["prompt_tokens"] = sum(len(str(part).split()) for part in _flatten_parts(message, history)
+                                         if not isinstance(part, (bytes, bytearray)))
+            usage["output_tokens"] = len(text.split(" "))
+        if not stream:
+            if self.tokens_per_second:
+                time.sleep(len(text.split(" ")) / self.tokens_per_second)
+            return text
+        return self._stream(text)
+
+    def _stream(self, text):
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            if i and self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield word if i == 0 else " " + word
+
+
+def _flatten_parts(*values):
+    # Walk messages, parts and history turns, yielding text and raw image bytes
+    for value in values:
+        if isinstance(value, dict):
+            for key in sorted(value):
+                yield key
+                yield from _flatten_parts(value[key])
+        elif isinstance(value, (list, tuple)):
+            yield from _flatten_parts(*value)
+        else:
+            yield value
+
+
+# Stable hash of a chat turn: model, generation config, message and history, image bytes included
+def request_fingerprint(model_name, generation_config, message, history=()):
+    digest = hashlib.sha256()
+    for part in _flatten_parts(model_name, generation_config, message, history):
+        data = bytes(part) if isinstance(part, (bytes, bytearray)) else str(part).encode("utf-8")
+        # Length-prefixed so that ("ab", "c") and ("a", "bc") differ
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class CassetteBackend(LLMBackend):
+    """
+    Record real exchanges to a JSON-lines cassette, or replay them offline.
+
+    In "record" mode every successful call to `inner` is appended to the
+    cassette with its request fingerprint, time to first token, per-chunk
+    arrival offsets, total latency and token counts (prompts and images are
+    not stored, only their hash). In "replay" mode the recorded chunks are
+    yielded with the recorded timing, scaled by `speed`, without touching
+    the network. Several recordings of one request are replayed in turn.
+
+    Args:
+        path (str): Cassette file
+        mode (str): "record" or "replay"
+        inner (LLMBackend): Backend to record, required in record mode
+        match (str): "exact" fingerprints only, or "model" to fall back to
+            any recording for the same model and streaming mode
+        speed (float): Replay speed factor
+    """
+
+    name = "cassette"
+
+    def __init__(self, path=LLM_CASSETTE, mode=LLM_CASSETTE_MODE, inner=None, match=LLM_CASSETTE_MATCH,
+                 speed=LLM_CASSETTE_SPEED):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected record or replay")
+        if mode == "record" and inner is None:
+            raise ValueError("Recording a cassette needs an inner backend")
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self.match = match
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._by_fingerprint = {}
+        self._by_model = {}
+        self._next = {}
+        if mode == "replay":
+            self._load()
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as cassette:
+            for line in cassette:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._by_fingerprint.setdefault(entry["fingerprint"], []).append(entry)
+                    self._by_model.setdefault((entry["model"], entry["stream"]), []).append(entry)
+
+    def has_key(self, key_env):
+        # Replays need no API keys
+        return self.inner.has_key(key_env) if self.inner is not None else True
+
+    def send(self, key_env, model_name, generation_config, message, history=(), stream=False, timeout=None,
+             usage=None):
+        fingerprint = request_fingerprint(model_name, generation_config, message, history)
+        if self.mode == "record":
+            return self._record(fingerprint, key_env, model_name, generation_config, message, history,
+                                stream, timeout, usage)
+        return self._replay(fingerprint, model_name, stream, timeout, usage)
+
+    def _record(self, fingerprint, key_env, model_name, generation_config, message, history, stream, timeout, usage):
+        usage = {} if usage is None else usage
+        started = time.monotonic()
+        result = self.inner.send(key_env, model_name, generation_config, message, history,
+                                 stream=stream, timeout=timeout, usage=usage)
+        if not stream:
+            self._append(fingerprint, model_name, stream, started, [(time.monotonic() - started, result)], usage)
+            return result
+        return self._record_stream(fingerprint, model_name, started, result, usage)
+
+    def _record_stream(self, fingerprint, model_name, started, chunks, usage):
+        recorded = []
+        for chunk in chunks:
+            recorded.append((time.monotonic() - started, chunk))
+            yield chunk
+        self._append(fingerprint, model_name, True, started, recorded, usage)
+
+    def _append(self, fingerprint, model_name, stream, started, chunks, usage):
+        entry = {
+            "fingerprint": fingerprint,
+            "model": model_name,
+            "stream": stream,
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "first_token_s": round(chunks[0][0], 4) if chunks else None,
+            "total_s": round(time.monotonic() - started, 4),
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "output_tokens": usage.get("output_tokens"),
+            "chunks": [[round(offset, 4), text] for offset, text in chunks],
+        }
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as cassette:
+                cassette.write(json.dumps(entry) + "\n")
+
+    def _replay(self, fingerprint, model_name, stream, timeout, usage):
+        with self._lock:
+            entries = self._by_fingerprint.get(fingerprint)
+            lookup = fingerprint
+            if not entries and self.match == "model":
+                entries = self._by_model.get((model_name, stream))
+                lookup = (model_name, stream)
+            if not entries:
+                raise LLMError(f"No recorded {model_name} response in {self.path} for request {fingerprint[:12]}")
+            position = self._next.get(lookup, 0)
+            self._next[lookup] = position + 1
+            entry = entries[position % len(entries)]
+
+        chunks = [(offset / self.speed, text) for offset, text in entry["chunks"]]
+        first_offset = chunks[0][0] if chunks else 0
+        if timeout is not None and first_offset > timeout:
+            time.sleep(timeout)
+            raise api_exceptions.DeadlineExceeded(f"Replayed request exceeded {timeout:.2f}s")
+        if usage is not None:
+            usage["prompt_tokens"] = entry.get("prompt_tokens")
+            usage["output_tokens"] = entry.get("output_tokens")
+
+        started = time.monotonic()
+        time.sleep(first_offset)
+        if not stream:
+            time.sleep(max(0, entry["total_s"] / self.speed - (time.monotonic() - started)))
+            return "".join(text for _, text in chunks)
+        return self._replay_stream(chunks, started)
+
+    @staticmethod
+    def _replay_stream(chunks, started):
+        for offset, text in chunks:
+            time.sleep(max(0, offset - (time.monotonic() - started)))
+            yield text
+
+
+BACKENDS = {"gemini": GeminiBackend, "stub": StubBackend}
+
+_backend = None
+
+
+# Get the process-wide backend chosen by LLM_BACKEND
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                if LLM_BACKEND not in BACKENDS:
+                    raise ValueError(f"Unknown LLM_BACKEND {LLM_BACKEND!r}, expected one of {', '.join(BACKENDS)}")
+                if LLM_CASSETTE and LLM_CASSETTE_MODE == "replay":
+                    _backend = CassetteBackend()
+                elif LLM_CASSETTE:
+                    _backend = CassetteBackend(inner=BACKENDS[LLM_BACKEND]())
+                else:
+                    _backend = BACKENDS[LLM_BACKEND]()
+    return _backend
+
+
+# Replace the process-wide backend, e.g. with a StubBackend in benchmarks; None restores LLM_BACKEND
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+# Key order for a call: the caller's key first, then the other configured keys
+def failover_keys(primary_key_env, backend=None):
+    backend = backend or get_backend()
+    keys = [primary_key_env] + [k for k in API_KEY_ENVS if k != primary_key_env]
+    return [k for k in keys if backend.has_key(k)]
+
+
+# Full-jitter exponential backoff delay before retry number `attempt` (1-based)
+def backoff_delay(attempt):
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+# Send one chat turn through the backend with timeouts, retries and API key failover
+def send_message(key_env, model_name, generation_config, message, history=(), stream=False,
+                 timeout=None, deadline=None):
+    """
+    Send `message` in a new chat, retrying transient failures.
+
+    Each attempt gets its own request timeout, bounded by an overall deadline
+    so a slow or rate-limited API cannot pin the script thread. Transient
+    errors are retried with jittered exponential backoff; quota and key errors
+    fail over to the next configured key.
+
+    Args:
+        key_env (str): Preferred API key, e.g. "GEMINI_API_KEY_2"
+        model_name (str): Gemini model name
+        generation_config (dict): Generation settings
+        message: Text or list of parts (text and image dicts) to send
+        history (list): Chat history to start the session with
+        stream (bool): Return an iterator of text chunks; only the wait for
+            the first chunk is retried
+        timeout (float): Per-request timeout, defaults to LLM_TIMEOUT_SECONDS
+        deadline (float): Overall budget in seconds, defaults to LLM_DEADLINE_SECONDS
+
+    Returns:
+        str, or an iterator of str when stream=True
+
+    Raises:
+        LLMError: when every key failed, the deadline passed or the request
+            failed in a way retries cannot fix; with stream=True, also while
+            iterating over the chunks
+    """
+    backend = get_backend()
+    timeout = LLM_TIMEOUT_SECONDS if timeout is None else timeout
+    expires_at = time.monotonic() + (LLM_DEADLINE_SECONDS if deadline is None else deadline)
+    keys = failover_keys(key_env, backend)
+    if not keys:
+        raise LLMError("API key not found. Please check your .env file.")
+
+    last_error = None
+    for current_key in keys:
+        for attempt in range(1, LLM_MAX_ATTEMPTS + 1):
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                raise LLMError(f"Gemini did not respond within the time limit: {last_error}")
+            try:
+                with span("llm.send", model=model_name, key=current_key, attempt=attempt, stream=stream):
+                    response = backend.send(current_key, model_name, generation_config, message, history,
+                                            stream=stream, timeout=min(timeout, remaining))
+                if not stream:
+                    return response
+                return trace_iterator("llm.stream", _stream_errors_as_llm_error(response), model=model_name)
+            except FAILOVER_ERRORS as e:
+                last_error = e
+                break
+            except RETRYABLE_ERRORS as e:
+                last_error = e
+                if attempt < LLM_MAX_ATTEMPTS:
+                    time.sleep(min(backoff_delay(attempt), max(0, expires_at - time.monotonic())))
+            except LLMError:
+                raise
+            except Exception as e:
+                # A bad request, a blocked response, ...: retrying or another key will not help
+                raise LLMError(f"Gemini request failed: {e}") from e
+    raise LLMError(f"Gemini request failed on every configured API key: {last_error}")
+
+
+# Re-raise errors from a response stream as LLMError, so callers only have one exception to catch
+def _stream_errors_as_llm_error(chunks):
+    try:
+        yield from chunks
+    except LLMError:
+        raise
+    except Exception as e:
+        raise LLMError(f"Gemini stream failed: {e}") from e
+
+
+# Full response text of one chat turn
+def generate_text(key_env, model_name, generation_config, message, history=(), timeout=None, deadline=None):
+    return send_message(key_env, model_name, generation_config, message, history,
+                        stream=False, timeout=timeout, deadline=deadline)
+
+
+# Text chunks of one chat turn as they arrive, e.g. for st.write_stream
+def stream_text(key_env, model_name, generation_config, message, history=(), timeout=None, deadline=None):
+    return send_message(key_env, model_name, generation_config, message, history,
+                        stream=True, timeout=timeout, deadline=deadline)
+
+
+if __name__ == "__main__":
+    # Offline check of the retry, failover and deadline paths against the stub backend
+    busy = api_exceptions.ServiceUnavailable("busy")
+    quota = api_exceptions.ResourceExhausted("quota")
+    scenarios = [
+        ("transient errors are retried", StubBackend("instant", errors={"GEMINI_API_KEY": [busy, busy]}), {}),
+        ("quota error fails over to the next key", StubBackend("instant", errors={"GEMINI_API_KEY": [quota]}), {}),
+        ("slow requests hit the deadline", StubBackend("slow"), {"timeout": 0.2, "deadline": 0.5}),
+    ]
+    for name, backend, kwargs in scenarios:
+        set_backend(backend)
+        started = time.monotonic()
+        try:
+            outcome = generate_text("GEMINI_API_KEY", "stub", {}, "hello", **kwargs).split("\n")[0]
+        except LLMError as e:
+            outcome = f"LLMError: {e}"
+        print(f"{name}: {outcome} ({time.monotonic() - started:.2f}s, calls={backend.calls})")
+    set_backend(None)
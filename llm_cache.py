@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+
+import db
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# How long a cached LLM answer stays valid, and how many answers / bytes each namespace keeps
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+# Normalize generation inputs so equivalent values hash the same way
+def normalize(value):
+    """
+    Canonical form of the inputs used to build a cache key.
+
+    Strings are stripped with inner whitespace collapsed, whole floats become
+    ints (2000.0 == 2000) and dict keys are sorted when dumped, so small
+    formatting differences in session state do not miss the cache.
+    """
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _digest(payload):
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    ).hexdigest()
+
+
+# Hash of the normalized generation inputs
+def make_cache_key(inputs):
+    return _digest(normalize(inputs))
+
+
+# Content-addressed key for a set of images (or other blobs): order and file names do not matter
+def make_content_key(blobs):
+    return make_cache_key(sorted(hashlib.sha256(blob).hexdigest() for blob in blobs))
+
+
+# Short hash identifying a prompt, model and generation config; changing any of them retires old entries
+def prompt_version(prompt, model_name, generation_config):
+    return _digest([str(prompt), model_name, generation_config])[:16]
+
+
+# Look up a cached response, recording the hit for LRU eviction
+def get_cached_response(namespace, cache_key, version, ttl=None):
+    """
+    Return the cached response text, or None on a miss.
+
+    Entries older than the TTL or written for another prompt version are
+    treated as misses. The hit is recorded in the same statement, so a hit
+    costs a single round trip. Cache errors are never fatal: the caller
+    just falls back to the LLM.
+    """
+    ttl = LLM_CACHE_TTL_SECONDS if ttl is None else ttl
+    try:
+        conn = db.get_db_connection()
+    except Exception:
+        return None
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE llm_response_cache
+            SET last_hit_at = CURRENT_TIMESTAMP, hit_count = hit_count + 1
+            WHERE namespace = %s AND cache_key = %s AND prompt_version = %s
+              AND created_at > CURRENT_TIMESTAMP - make_interval(secs => %s)
+            RETURNING response_text
+        """, (namespace, cache_key, version, ttl))
+        row = cur.fetchone()
+        conn.commit()
+        cur.close()
+        return row[0] if row else None
+    except Exception:
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+
+# Store a response and evict expired and least recently used entries of the namespace
+def store_response(namespace, cache_key, version, response_text, ttl=None, max_entries=None, max_bytes=None):
+    """
+    Args:
+        namespace (str): Cache area, e.g. "recipe"
+        cache_key (str): make_cache_key() of the inputs
+        version (str): prompt_version() of the prompt/model/config
+        response_text (str): Text to cache
+        ttl (int): Seconds before the entry expires, defaults to LLM_CACHE_TTL_SECONDS
+        max_entries (int): Entries kept per namespace, defaults to LLM_CACHE_MAX_ENTRIES
+        max_bytes (int): Response bytes kept per namespace, defaults to LLM_CACHE_MAX_BYTES
+
+    Returns:
+        tuple: (success, message)
+    """
+    ttl = LLM_CACHE_TTL_SECONDS if ttl is None else ttl
+    max_entries = LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    max_bytes = LLM_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not response_text:
+        return False, "Nothing to cache"
+    try:
+        conn = db.get_db_connection()
+    except Exception as e:
+        return False, str(e)
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO llm_response_cache
+            (namespace, cache_key, prompt_version, response_text, byte_size)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (namespace, cache_key) DO UPDATE SET
+                prompt_version = EXCLUDED.prompt_version,
+                response_text = EXCLUDED.response_text,
+                byte_size = EXCLUDED.byte_size,
+                created_at = CURRENT_TIMESTAMP,
+                last_hit_at = CURRENT_TIMESTAMP,
+                hit_count = 0
+        """, (namespace, cache_key, version, response_text, len(response_text.encode("utf-8"))))
+        # Stores only happen after a multi-second LLM call, so evicting here is cheap by comparison
+        cur.execute("""
+            DELETE FROM llm_response_cache
+            WHERE namespace = %s
+              AND (created_at <= CURRENT_TIMESTAMP - make_interval(secs => %s)
+                   OR cache_key IN (
+                       SELECT cache_key FROM (
+                           SELECT cache_key,
+                                  ROW_NUMBER() OVER lru AS position,
+                                  SUM(byte_size) OVER lru AS running_bytes
+                           FROM llm_response_cache
+                           WHERE namespace = %s
+                           WINDOW lru AS (ORDER BY last_hit_at DESC, cache_key)
+                       ) ranked
+                       WHERE position > %s OR running_bytes > %s
+                   ))
+        """, (namespace, ttl, namespace, max_entries, max_bytes))
+        conn.commit()
+        cur.close()
+        return True, "Response cached"
+    except Exception as e:
+        conn.rollback()
+        return False, str(e)
+    finally:
+        conn.close()
+
+
+# Remove cached responses, for one namespace or all of them
+def clear_cache(namespace=None):
+    try:
+        with db.connection() as conn:
+            cur = conn.cursor()
+            if namespace is None:
+                cur.execute("DELETE FROM llm_response_cache")
+            else:
+                cur.execute("DELETE FROM llm_response_cache WHERE namespace = %s", (namespace,))
+            deleted = cur.rowcount
+            cur.close()
+        return True, f"Removed {deleted} cached responses"
+    except Exception as e:
+        return False, str(e)
@@ -0,0 +1,611 @@
+import argparse
+import threading
+
+import db
+
+# Arbitrary key for pg_advisory_lock so concurrent app processes never migrate at the same time
+MIGRATION_LOCK_ID = 741_852_963
+
+
+# Guess meal types and better titles for recipes saved before saved_recipes.meal_type existed
+def backfill_recipe_meal_types(cur):
+    # Get all recipes
+    cur.execute("""
+        SELECT id, recipe_title, recipe_content, meal_type
+        FROM saved_recipes
+    """)
+    
+    recipes = cur.fetchall()
+    
+    for recipe_id, recipe_title, recipe_content, current_meal_type in recipes:
+        # Determine meal type from title or content if not already set
+        meal_type = current_meal_type if current_meal_type else "Other"
+        lower_title = recipe_title.lower()
+        lower_content = recipe_content.lower()
+        
+        if meal_type == "Other":
+            if 'breakfast' in lower_title or 'breakfast' in lower_content:
+                meal_type = "Breakfast"
+            elif 'lunch' in lower_title or 'lunch' in lower_content:
+                meal_type = "Lunch"
+            elif 'dinner' in lower_title or 'dinner' in lower_content:
+                meal_type = "Dinner"
+            elif 'snack' in lower_title or 'snack' in lower_content:
+                meal_type = "Snack"
+            elif any(word in lower_title for word in ['morning', 'toast', 'cereal', 'oatmeal', 'pancake']):
+                meal_type = "Breakfast"
+            elif any(word in lower_title for word in ['sandwich', 'salad', 'soup']):
+                meal_type = "Lunch"
+            elif any(word in lower_title for word in ['roast', 'steak', 'chicken', 'fish', 'supper']):
+                meal_type = "Dinner"
+            elif any(word in lower_title for word in ['cookie', 'bar', 'nuts', 'fruit']):
+                meal_type = "Snack"
+        
+        # Extract a better title from the content
+        new_title = recipe_title
+        
+        # Check if the current title is just a generic meal type with nutritional info
+        if (lower_title.startswith(('breakfast', 'lunch', 'dinner', 'snack')) and 
+            '(' in lower_title and 'calories' in lower_title):
+            
+            # Get the second line of the recipe content as specified by the user
+            lines = recipe_content.strip().split('\n')
+            line_index = 0
+            actual_line_count = 0
+            
+            # Find the second non-empty line
+            while line_index < len(lines) and actual_line_count < 2:
+                if lines[line_index].strip():
+                    actual_line_count += 1
+                line_index += 1
+            
+            # If we found the second line, use it as the title
+            if actual_line_count == 2 and line_index > 0 and line_index <= len(lines):
+                second_line = lines[line_index - 1].strip()
+                
+                # Skip if the second line is just a header like "Ingredients:" or "Instructions:"
+                if second_line.lower() not in ['ingredients:', 'instructions:', 'directions:', 'steps:', 'method:']:
+                    # Extract timestamp from original title if present
+                    timestamp = ""
+                    if '(' in recipe_title and ')' in recipe_title:
+                        timestamp_start = recipe_title.rfind('(')
+                        timestamp_end = recipe_title.rfind(')')
+                        if timestamp_start > 0 and timestamp_end > timestamp_start:
+                            timestamp = recipe_title[timestamp_start:timestamp_end+1]
+                    
+                    # Create new title with the dish name from the second line and timestamp
+                    new_title = second_line
+                    if timestamp:
+                        new_title = f"{new_title} {timestamp}"
+        
+        # Update the recipe with the determined meal type and better title
+        cur.execute("""
+            UPDATE saved_recipes
+            SET meal_type = %s, recipe_title = %s
+            WHERE id = %s
+        """, (meal_type, new_title, recipe_id))
+
+
+# Add saved_recipes.meal_type and backfill meal types for recipes saved before it existed
+def add_recipe_meal_type(cur):
+    cur.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_name = 'saved_recipes' AND column_name = 'meal_type'
+    """)
+    if cur.fetchone():
+        return
+
+    cur.execute("ALTER TABLE saved_recipes ADD COLUMN meal_type TEXT DEFAULT 'Other'")
+    backfill_recipe_meal_types(cur)
+
+
+# habit_counts and the trigger maintaining it, as rebuilt by migration 10. The table is
+# keyed by a hash of the text: the raw-text key of migration 4 rejects habits longer
+# than ~2.7 KB, and the trigger failing would roll back the user's insert into analysis_results.
+HABIT_COUNTS_STEPS = [
+    '''
+    CREATE TABLE IF NOT EXISTS habit_counts (
+        analysis_md5 CHAR(32) GENERATED ALWAYS AS (md5(analysis_text)) STORED PRIMARY KEY,
+        analysis_text TEXT NOT NULL,
+        habit_count INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_habit_counts_count ON habit_counts (habit_count DESC)",
+    # Keep habit_counts in step with analysis_results in the same transaction,
+    # including rows removed by ON DELETE CASCADE when a user is deleted
+    '''
+    CREATE OR REPLACE FUNCTION maintain_habit_counts() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE habit_counts SET habit_count = habit_count - 1
+            WHERE analysis_md5 = md5(OLD.analysis_text);
+            DELETE FROM habit_counts
+            WHERE analysis_md5 = md5(OLD.analysis_text) AND habit_count <= 0;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO habit_counts (analysis_text, habit_count)
+            VALUES (NEW.analysis_text, 1)
+            ON CONFLICT (analysis_md5)
+            DO UPDATE SET habit_count = habit_counts.habit_count + 1;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    ''',
+    "DROP TRIGGER IF EXISTS trg_analysis_results_habit_counts ON analysis_results",
+    '''
+    CREATE TRIGGER trg_analysis_results_habit_counts
+    AFTER INSERT OR DELETE OR UPDATE OF analysis_text ON analysis_results
+    FOR EACH ROW EXECUTE FUNCTION maintain_habit_counts()
+    ''',
+    '''
+    INSERT INTO habit_counts (analysis_text, habit_count)
+    SELECT analysis_text, COUNT(*)
+    FROM analysis_results
+    GROUP BY analysis_text
+    ON CONFLICT (analysis_md5)
+    DO UPDATE SET habit_count = EXCLUDED.habit_count
+    ''',
+]
+
+
+# habit_first_seen and the trigger maintaining it, as rebuilt by migration 11 with a
+# hash key for the same reason as habit_counts
+HABIT_FIRST_SEEN_STEPS = [
+    '''
+    CREATE TABLE IF NOT EXISTS habit_first_seen (
+        analysis_md5 CHAR(32) GENERATED ALWAYS AS (md5(analysis_text)) STORED PRIMARY KEY,
+        analysis_text TEXT NOT NULL,
+        first_seen TIMESTAMP NOT NULL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_habit_first_seen_first_seen ON habit_first_seen (first_seen DESC)",
+    # New habits are recorded once; when rows go away the first appearance is
+    # recomputed from the (md5(analysis_text), created_at) index, or dropped if none remain
+    '''
+    CREATE OR REPLACE FUNCTION maintain_habit_first_seen() RETURNS trigger AS $$
+    DECLARE
+        earliest TIMESTAMP;
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            SELECT MIN(created_at) INTO earliest
+            FROM analysis_results
+            WHERE md5(analysis_text) = md5(OLD.analysis_text) AND analysis_text = OLD.analysis_text;
+            IF earliest IS NULL THEN
+                DELETE FROM habit_first_seen WHERE analysis_md5 = md5(OLD.analysis_text);
+            ELSE
+                UPDATE habit_first_seen SET first_seen = earliest
+                WHERE analysis_md5 = md5(OLD.analysis_text) AND first_seen <> earliest;
+            END IF;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.created_at IS NOT NULL THEN
+            INSERT INTO habit_first_seen (analysis_text, first_seen)
+            VALUES (NEW.analysis_text, NEW.created_at)
+            ON CONFLICT (analysis_md5) DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    ''',
+    "DROP TRIGGER IF EXISTS trg_analysis_results_habit_first_seen ON analysis_results",
+    '''
+    CREATE TRIGGER trg_analysis_results_habit_first_seen
+    AFTER INSERT OR DELETE OR UPDATE OF analysis_text, created_at ON analysis_results
+    FOR EACH ROW EXECUTE FUNCTION maintain_habit_first_seen()
+    ''',
+    '''
+    INSERT INTO habit_first_seen (analysis_text, first_seen)
+    SELECT analysis_text, MIN(created_at)
+    FROM analysis_results
+    WHERE created_at IS NOT NULL
+    GROUP BY analysis_text
+    ON CONFLICT (analysis_md5)
+    DO UPDATE SET first_seen = EXCLUDED.first_seen
+    ''',
+]
+
+
+# Numbered migrations, applied in order and recorded in schema_version.
+# Each entry is (version, description, steps); a step is either a SQL string or a
+# callable taking a cursor. Never edit an applied migration, add a new one instead.
+MIGRATIONS = [
+    (1, "Baseline tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            name VARCHAR(100),
+            age INTEGER,
+            gender VARCHAR(20),
+            weight FLOAT,
+            height FLOAT,
+            activity_level VARCHAR(50),
+            goal VARCHAR(50),
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_nutrition (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            carbs INTEGER,
+            protein INTEGER,
+            fat INTEGER,
+            calories INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS analysis_results (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            analysis_text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS feedback (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+            rating FLOAT NOT NULL,
+            comment TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS nutrition_history (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            carbs INTEGER,
+            protein INTEGER,
+            fat INTEGER,
+            calories INTEGER,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS saved_recipes (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            recipe_title TEXT,
+            recipe_content TEXT,
+            saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, "Add saved_recipes.meal_type", [add_recipe_meal_type]),
+    (3, "Indexes for hot query shapes", [
+        # Habit pills and Profile habit list: WHERE user_id = %s ORDER BY created_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_analysis_results_user_created ON analysis_results (user_id, created_at DESC)",
+        # Rank tab: GROUP BY analysis_text with COUNT(*) / MIN(created_at)
+        "CREATE INDEX IF NOT EXISTS idx_analysis_results_text_created ON analysis_results (analysis_text, created_at)",
+        # Nutrition history: latest entry per DATE(recorded_at) for one user
+        "CREATE INDEX IF NOT EXISTS idx_nutrition_history_user_day ON nutrition_history (user_id, (DATE(recorded_at)), recorded_at DESC)",
+        # Saved recipes: WHERE user_id = %s ORDER BY meal_type, saved_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_saved_recipes_user_meal_saved ON saved_recipes (user_id, meal_type, saved_at DESC)",
+        # Recent comments: non-empty comments ORDER BY created_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_feedback_comment_created ON feedback (created_at DESC) WHERE comment IS NOT NULL AND comment != ''",
+    ]),
+    (4, "Habit leaderboard aggregate", [
+        # Block writers while the trigger is installed and the table backfilled
+        "LOCK TABLE analysis_results IN SHARE ROW EXCLUSIVE MODE",
+        '''
+        CREATE TABLE IF NOT EXISTS habit_counts (
+            analysis_text TEXT PRIMARY KEY,
+            habit_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_habit_counts_count ON habit_counts (habit_count DESC)",
+        # Keep habit_counts in step with analysis_results in the same transaction,
+        # including rows removed by ON DELETE CASCADE when a user is deleted
+        '''
+        CREATE OR REPLACE FUNCTION maintain_habit_counts() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE habit_counts SET habit_count = habit_count - 1
+                WHERE analysis_text = OLD.analysis_text;
+                DELETE FROM habit_counts
+                WHERE analysis_text = OLD.analysis_text AND habit_count <= 0;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO habit_counts (analysis_text, habit_count)
+                VALUES (NEW.analysis_text, 1)
+                ON CONFLICT (analysis_text)
+                DO UPDATE SET habit_count = habit_counts.habit_count + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        ''',
+        "DROP TRIGGER IF EXISTS trg_analysis_results_habit_counts ON analysis_results",
+        '''
+        CREATE TRIGGER trg_analysis_results_habit_counts
+        AFTER INSERT OR DELETE OR UPDATE OF analysis_text ON analysis_results
+        FOR EACH ROW EXECUTE FUNCTION maintain_habit_counts()
+        ''',
+        '''
+        INSERT INTO habit_counts (analysis_text, habit_count)
+        SELECT analysis_text, COUNT(*)
+        FROM analysis_results
+        GROUP BY analysis_text
+        ON CONFLICT (analysis_text)
+        DO UPDATE SET habit_count = EXCLUDED.habit_count
+        ''',
+    ]),
+    (5, "First appearance of each habit", [
+        "LOCK TABLE analysis_results IN SHARE ROW EXCLUSIVE MODE",
+        '''
+        CREATE TABLE IF NOT EXISTS habit_first_seen (
+            analysis_text TEXT PRIMARY KEY,
+            first_seen TIMESTAMP NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_habit_first_seen_first_seen ON habit_first_seen (first_seen DESC)",
+        # New habits are recorded once; when rows go away the first appearance is
+        # recomputed from the (analysis_text, created_at) index, or dropped if none remain
+        '''
+        CREATE OR REPLACE FUNCTION maintain_habit_first_seen() RETURNS trigger AS $$
+        DECLARE
+            earliest TIMESTAMP;
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                SELECT MIN(created_at) INTO earliest
+                FROM analysis_results
+                WHERE analysis_text = OLD.analysis_text;
+                IF earliest IS NULL THEN
+                    DELETE FROM habit_first_seen WHERE analysis_text = OLD.analysis_text;
+                ELSE
+                    UPDATE habit_first_seen SET first_seen = earliest
+                    WHERE analysis_text = OLD.analysis_text AND first_seen <> earliest;
+                END IF;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.created_at IS NOT NULL THEN
+                INSERT INTO habit_first_seen (analysis_text, first_seen)
+                VALUES (NEW.analysis_text, NEW.created_at)
+                ON CONFLICT (analysis_text) DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        ''',
+        "DROP TRIGGER IF EXISTS trg_analysis_results_habit_first_seen ON analysis_results",
+        '''
+        CREATE TRIGGER trg_analysis_results_habit_first_seen
+        AFTER INSERT OR DELETE OR UPDATE OF analysis_text, created_at ON analysis_results
+        FOR EACH ROW EXECUTE FUNCTION maintain_habit_first_seen()
+        ''',
+        '''
+        INSERT INTO habit_first_seen (analysis_text, first_seen)
+        SELECT analysis_text, MIN(created_at)
+        FROM analysis_results
+        WHERE created_at IS NOT NULL
+        GROUP BY analysis_text
+        ON CONFLICT (analysis_text)
+        DO UPDATE SET first_seen = EXCLUDED.first_seen
+        ''',
+    ]),
+    (6, "Running feedback aggregates", [
+        "LOCK TABLE feedback IN SHARE ROW EXCLUSIVE MODE",
+        # Single row holding the rating sum, count and a histogram of whole-number
+        # ratings (rating_histogram[1] counts 0.0-0.9, ..., rating_histogram[11] counts 10.0)
+        '''
+        CREATE TABLE IF NOT EXISTS feedback_stats (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            rating_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            rating_count BIGINT NOT NULL DEFAULT 0,
+            rating_histogram INTEGER[] NOT NULL DEFAULT array_fill(0, ARRAY[11])
+        )
+        ''',
+        '''
+        INSERT INTO feedback_stats (id, rating_sum, rating_count, rating_histogram)
+        SELECT TRUE,
+               COALESCE(SUM(f.rating), 0),
+               COUNT(f.rating),
+               ARRAY(
+                   SELECT COUNT(f2.rating)::INTEGER
+                   FROM generate_series(0, 10) AS bucket
+                   LEFT JOIN feedback f2 ON LEAST(FLOOR(f2.rating), 10) = bucket
+                   GROUP BY bucket
+                   ORDER BY bucket
+               )
+        FROM feedback f
+        ON CONFLICT (id) DO UPDATE SET
+            rating_sum = EXCLUDED.rating_sum,
+            rating_count = EXCLUDED.rating_count,
+            rating_histogram = EXCLUDED.rating_histogram
+        ''',
+    ]),
+    (7, "Unique habit per user", [
+        "LOCK TABLE analysis_results IN SHARE ROW EXCLUSIVE MODE",
+        # Drop duplicates left by the old check-then-insert race, keeping the earliest row
+        '''
+        DELETE FROM analysis_results a
+        USING analysis_results b
+        WHERE a.user_id = b.user_id
+          AND md5(a.analysis_text) = md5(b.analysis_text)
+          AND a.analysis_text = b.analysis_text
+          AND a.id > b.id
+        ''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_analysis_results_user_text ON analysis_results (user_id, md5(analysis_text))",
+    ]),
+    (8, "LLM response cache", [
+        # One row per (namespace, hash of the normalized inputs); see llm_cache.py
+        '''
+        CREATE TABLE IF NOT EXISTS llm_response_cache (
+            namespace VARCHAR(50) NOT NULL,
+            cache_key CHAR(64) NOT NULL,
+            prompt_version VARCHAR(64) NOT NULL,
+            response_text TEXT NOT NULL,
+            byte_size INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            last_hit_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            hit_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (namespace, cache_key)
+        )
+        ''',
+        # Least recently used entries are evicted first
+        "CREATE INDEX IF NOT EXISTS idx_llm_response_cache_lru ON llm_response_cache (namespace, last_hit_at DESC)",
+    ]),
+    (9, "Index habit texts by hash", [
+        # The raw-text btree from migration 3 made inserts of
+        # texts over ~2.7 KB fail with "index row size exceeds btree maximum"
+        "DROP INDEX IF EXISTS idx_analysis_results_text_created",
+        "CREATE INDEX IF NOT EXISTS idx_analysis_results_text_hash_created ON analysis_results (md5(analysis_text), created_at)",
+        # The habit_first_seen trigger function switches to this index in migration 11
+    ]),
+    (10, "Key habit_counts by text hash", [
+        "LOCK TABLE analysis_results IN SHARE ROW EXCLUSIVE MODE",
+        # Rebuilt from analysis_results, so the counts survive the new key
+        "DROP TABLE IF EXISTS habit_counts",
+        *HABIT_COUNTS_STEPS,
+    ]),
+    (11, "Key habit_first_seen by text hash", [
+        "LOCK TABLE analysis_results IN SHARE ROW EXCLUSIVE MODE",
+        "DROP TABLE IF EXISTS habit_first_seen",
+        *HABIT_FIRST_SEEN_STEPS,
+    ]),
+]
+
+
+# Create the schema_version bookkeeping table if needed and return the applied versions
+def get_applied_versions(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute("SELECT version FROM schema_version")
+    return {row[0] for row in cur.fetchall()}
+
+
+# Apply every pending migration, each in its own transaction
+def migrate(target=None):
+    """
+    Bring the schema up to date.
+
+    Args:
+        target (int): Highest version to apply, or None for all
+
+    Returns:
+        list: Versions applied by this call
+    """
+    applied_now = []
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            applied = get_applied_versions(cur)
+            conn.commit()
+
+            for version, description, steps in sorted(MIGRATIONS, key=lambda m: m[0]):
+                if version in applied or (target is not None and version > target):
+                    continue
+                try:
+                    for step in steps:
+                        if callable(step):
+                            step(cur)
+                        else:
+                            cur.execute(step)
+                    cur.execute(
+                        "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                        (version, description)
+                    )
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    raise RuntimeError(f"Migration {version} ({description}) failed: {e}") from e
+                applied_now.append(version)
+        finally:
+            # A failed step or bookkeeping query leaves the transaction aborted, so roll
+            # back before unlocking. If the unlock still fails, drop the connection: a
+            # pooled connection must never keep holding the session-level lock.
+            try:
+                conn.rollback()
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+                conn.commit()
+                cur.close()
+            except Exception:
+                conn.discard()
+    finally:
+        conn.close()
+    return applied_now
+
+
+# Report applied and pending migrations
+def status():
+    with db.connection() as conn:
+        cur = conn.cursor()
+        applied = get_applied_versions(cur)
+        cur.close()
+    return [
+        (version, description, version in applied)
+        for version, description, _ in sorted(MIGRATIONS, key=lambda m: m[0])
+    ]
+
+
+_bootstrapped = False
+_bootstrap_lock = threading.Lock()
+
+
+# Provision the database and apply migrations once per process
+def bootstrap():
+    """
+    One-time startup step: create the database if needed, then migrate it.
+
+    Request-path code never issues DDL; everything schema related happens here.
+
+    Returns:
+        tuple: (success, message)
+    """
+    global _bootstrapped
+    if _bootstrapped:
+        return True, "Database already initialized"
+    with _bootstrap_lock:
+        if _bootstrapped:
+            return True, "Database already initialized"
+        success, message = db.ensure_database()
+        if not success:
+            return False, f"Could not create database: {message}"
+        try:
+            applied = migrate()
+        except Exception as e:
+            return False, f"Could not migrate database: {e}"
+        _bootstrapped = True
+        if applied:
+            return True, f"Applied migrations: {', '.join(str(v) for v in applied)}"
+        return True, "Database schema is up to date"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the My Plate database schema.")
+    subparsers = parser.add_subparsers(dest="command")
+    upgrade_parser = subparsers.add_parser("upgrade", help="create the database and apply pending migrations (default)")
+    upgrade_parser.add_argument("--target", type=int, default=None, help="highest migration version to apply")
+    subparsers.add_parser("status", help="list applied and pending migrations")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        for version, description, is_applied in status():
+            print(f"{version:>4}  {'applied' if is_applied else 'pending':<8} {description}")
+    else:
+        success, message = db.ensure_database()
+        print(message)
+        if not success:
+            raise SystemExit(1)
+        applied = migrate(getattr(args, "target", None))
+        print(f"Applied migrations: {', '.join(str(v) for v in applied)}" if applied else "Database schema is up to date")
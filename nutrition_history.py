@@ -1,65 +1,32 @@
 import streamlit as st
-import psycopg2
-import os
 import pandas as pd
 import altair as alt
-from dotenv import load_dotenv
 from functions import get_session_key
+from history import get_db_connection
 from datetime import datetime
+from tracing import traced
 
-# Load environment variables
-load_dotenv()
-
-# Database connection parameters
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-
-# Initialize database connection
-def get_db_connection():
-    try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        return conn
-    except Exception as e:
-        st.error(f"Database connection error: {e}")
-        return None
-
-# Create nutrition_history table if it doesn't exist
-def create_nutrition_history_table():
-    conn = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            # Create nutrition_history table
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS nutrition_history (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                    carbs INTEGER,
-                    protein INTEGER,
-                    fat INTEGER,
-                    calories INTEGER,
-                    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            conn.commit()
-            cur.close()
-            conn.close()
-            return True
-        except Exception as e:
-            st.error(f"Error creating nutrition_history table: {e}")
-            conn.close()
-            return False
-    return False
+# Statements issued by this module; benchmarks/db_bench.py and tests/test_index_check.py import them
+INSERT_NUTRITION_HISTORY_SQL = """
+    INSERT INTO nutrition_history
+    (user_id, carbs, protein, fat, calories)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+NUTRITION_HISTORY_SQL = """
+    WITH latest_entries AS (
+        SELECT
+            carbs, protein, fat, calories,
+            DATE(recorded_at) as entry_date,
+            ROW_NUMBER() OVER (PARTITION BY DATE(recorded_at) ORDER BY recorded_at DESC) as rn
+        FROM nutrition_history
+        WHERE user_id = %s
+    )
+    SELECT carbs, protein, fat, calories, entry_date
+    FROM latest_entries
+    WHERE rn = 1
+    ORDER BY entry_date ASC
+    LIMIT %s
+"""
 
 # Save nutrition data to history
 def save_nutrition_history(user_id, nutrition_data):
@@ -75,20 +42,13 @@ def save_nutrition_history(user_id, nutrition_data):
             # we need to handle this case differently
             return False, "Please log in to save nutrition history."
     
-    # Ensure nutrition_history table exists
-    create_nutrition_history_table()
-    
     conn = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
             
             # Insert new nutrition history record
-            cur.execute("""
-                INSERT INTO nutrition_history
-                (user_id, carbs, protein, fat, calories)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (
+            cur.execute(INSERT_NUTRITION_HISTORY_SQL, (
                 user_id,
                 nutrition_data.get('carbs', 0),
                 nutrition_data.get('protein', 0),
@@ -127,21 +87,7 @@ def get_nutrition_history(user_id, limit=30):
             
             cur = conn.cursor()
             # Get the latest entry for each day
-            cur.execute("""
-                WITH latest_entries AS (
-                    SELECT 
-                        carbs, protein, fat, calories, 
-                        DATE(recorded_at) as entry_date,
-                        ROW_NUMBER() OVER (PARTITION BY DATE(recorded_at) ORDER BY recorded_at DESC) as rn
-                    FROM nutrition_history
-                    WHERE user_id = %s
-                )
-                SELECT carbs, protein, fat, calories, entry_date
-                FROM latest_entries
-                WHERE rn = 1
-                ORDER BY entry_date ASC
-                LIMIT %s
-            """, (user_id, limit))
+            cur.execute(NUTRITION_HISTORY_SQL, (user_id, limit))
             
             rows = cur.fetchall()
             cur.close()
@@ -170,6 +116,7 @@ def get_nutrition_history(user_id, limit=30):
     return None
 
 # Display nutrition history chart
+@traced("chart.nutrition_history")
 def display_nutrition_history_chart():
     # Check if user is logged in
     if not ('logged_in' in st.session_state and st.session_state.logged_in and 
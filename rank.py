@@ -3,35 +3,74 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 from history import get_db_connection
+from cache import cached
+from tracing import traced
 
+# Statements issued by this module; benchmarks/db_bench.py and tests/test_index_check.py import them
+POPULAR_HABITS_SQL = """
+    SELECT analysis_text, habit_count
+    FROM habit_counts
+    ORDER BY habit_count DESC
+    LIMIT %s
+"""
+NEW_HABITS_SQL = """
+    SELECT analysis_text, first_seen
+    FROM habit_first_seen
+    ORDER BY first_seen DESC
+    LIMIT %s
+"""
 
-def popular_habits():
-    st.markdown("""
-    <br><br>
-    <div style="text-align: center;">
-        <h4>Top 5 Popular Habits</h4>
-    </div>
-    """, unsafe_allow_html=True)
-    
-    # Connect to the database
+
+# Get the most popular habits from the trigger-maintained habit_counts leaderboard
+@cached("habits")
+def get_popular_habits(limit=5):
     conn = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
-            
-            # Query to get the top 5 most popular habits
-            cur.execute("""
-                SELECT analysis_text, COUNT(*) as count
-                FROM analysis_results
-                GROUP BY analysis_text
-                ORDER BY count DESC
-                LIMIT 5
-            """)
+            cur.execute(POPULAR_HABITS_SQL, (limit,))
             
             results = cur.fetchall()
             cur.close()
             conn.close()
+            return results
+        except Exception as e:
+            st.error(f"Error retrieving popular habits: {e}")
+            conn.close()
+    return None
+
+# Get the most recent first appearances from the trigger-maintained habit_first_seen table
+@cached("habits")
+def get_new_habits(limit=5):
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(NEW_HABITS_SQL, (limit,))
             
+            results = cur.fetchall()
+            cur.close()
+            conn.close()
+            return results
+        except Exception as e:
+            st.error(f"Error retrieving recent habits: {e}")
+            conn.close()
+    return None
+
+
+@traced("chart.popular_habits")
+def popular_habits():
+    st.markdown("""
+    <br><br>
+    <div style="text-align: center;">
+        <h4>Top 5 Popular Habits</h4>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    # Get the top 5 most popular habits (shared across sessions, refreshed on new analyses)
+    results = get_popular_habits(limit=5)
+    if results is not None:
+        try:
             if results:
                 # Create a DataFrame for better display
                 df = pd.DataFrame(results, columns=["Habit", "Count"])
@@ -98,6 +137,7 @@ def popular_habits():
     else:
         st.warning("Could not connect to the database. Please make sure the database is properly configured.")
 
+@traced("chart.new_habits")
 def new_habits():
     st.markdown("""
     <br><br>
@@ -106,29 +146,10 @@ def new_habits():
     </div>
     """, unsafe_allow_html=True)
     
-    # Connect to the database
-    conn = get_db_connection()
-    if conn:
+    # Get the 5 latest habits that did not show in database before
+    results = get_new_habits(limit=5)
+    if results is not None:
         try:
-            cur = conn.cursor()
-            
-            # Query to get the 5 latest habits that did not show in database before
-            cur.execute("""
-                WITH first_appearances AS (
-                    SELECT analysis_text, MIN(created_at) as first_appearance
-                    FROM analysis_results
-                    GROUP BY analysis_text
-                )
-                SELECT analysis_text, first_appearance
-                FROM first_appearances
-                ORDER BY first_appearance DESC
-                LIMIT 5
-            """)
-            
-            results = cur.fetchall()
-            cur.close()
-            conn.close()
-            
             if results:
                 # Create a DataFrame for better display
                 df = pd.DataFrame(results, columns=["Habit", "Added On"])
@@ -1,10 +1,15 @@
 import streamlit as st
 from functions import get_session_key
-import os
-from dotenv import load_dotenv
-import google.generativeai as genai
+from llm import generate_text, stream_text, LLMError, NUTRITION_ADVICE_CONFIG, RECIPE_CONFIG
+from llm_cache import make_cache_key, prompt_version, get_cached_response, store_response
 from prompts import prompt2, prompt3
 
+RECIPE_MODEL = "gemini-2.0-flash-lite"
+
+# Profile fields the recipe prompt relies on; name and username are left out of both
+# the prompt and the response cache key, so users with the same body data share answers
+RECIPE_PROFILE_FIELDS = ("age", "gender", "weight", "height", "activity_level", "goal", "nutrition")
+
 
 def recommandation1():
     session_key_recommandation1 = get_session_key("recommandation1")
@@ -39,41 +44,23 @@ def recommandation1():
                 return
                 
         
-            load_dotenv()
-            api_key = os.environ.get("GEMINI_API_KEY_3")
-            if not api_key:
-                st.error("API key not found. Please check your .env file.")
-                return
-                    
-            genai.configure(api_key=api_key)
-
-            generation_config = {
-                            "temperature": 0.8,
-                            "top_p": 0.95,
-                            "top_k": 40,
-                            "max_output_tokens": 1024,
-                            "response_mime_type": "text/plain",
-                        }
-
-            model = genai.GenerativeModel(
-                            model_name="gemini-2.0-flash-lite",
-                            generation_config=generation_config,
-                        )
-                    
-                    # Format nutrition data in a more readable way
+            # Format nutrition data in a more readable way
             nutrition_str = str(st.session_state[session_key_profile]['nutrition'])
             profile_str = str(st.session_state[session_key_profile])
-                    
 
-            chat_session = model.start_chat(history=[
-                            {"role": "user", "parts": [{"text": profile_str}]},
-                            {"role": "user", "parts": [{"text": nutrition_str}]}
-                        ])
+            history = [
+                {"role": "user", "parts": [{"text": profile_str}]},
+                {"role": "user", "parts": [{"text": nutrition_str}]}
+            ]
 
-                        
             message = str(prompt3)
-            response = chat_session.send_message(message)
-            st.session_state[session_key_recommandation1] = response.text
+            try:
+                advice_text = generate_text("GEMINI_API_KEY_3", RECIPE_MODEL, NUTRITION_ADVICE_CONFIG,
+                                            message, history=history)
+            except LLMError as e:
+                st.error(str(e))
+                return
+            st.session_state[session_key_recommandation1] = advice_text
             st.markdown(st.session_state[session_key_recommandation1])       
                         
                         
@@ -94,8 +81,20 @@ def recommandation2():
     if session_key_recipe_generated not in st.session_state:
         st.session_state[session_key_recipe_generated] = False
     
+    stream_response = None
+    streamed = False
+    recipe_cache_key = None
+    recipe_version = prompt_version(prompt2, RECIPE_MODEL, RECIPE_CONFIG)
+
+    get_recipe = st.button('Get Recipe', key=get_session_key("recomd_button"))
+    # Regenerate skips the response cache and asks Gemini for a fresh recipe
+    regenerate = False
+    if st.session_state[session_key_recipe_generated]:
+        regenerate = st.button('Regenerate', key=get_session_key("regenerate_button"),
+                               help="Ignore the stored answer for these inputs and generate a new recipe")
+
     # Generate recipe when button is clicked
-    if st.button('Get Recipe', key=get_session_key("recomd_button")):
+    if get_recipe or regenerate:
         with st.spinner("Generating..."):
             try:
                 # Check if profile exists in session state
@@ -123,32 +122,13 @@ def recommandation2():
                     return
                 
                 try:
-                    load_dotenv()
-                    api_key = os.environ.get("GEMINI_API_KEY_2")
-                    if not api_key:
-                        st.error("API key not found. Please check your .env file.")
-                        return
-                    
-                    genai.configure(api_key=api_key)
-
-                    generation_config = {
-                            "temperature": 0.8,
-                            "top_p": 0.95,
-                            "top_k": 40,
-                            "max_output_tokens": 8192,
-                            "response_mime_type": "text/plain",
-                        }
-
-                    model = genai.GenerativeModel(
-                            model_name="gemini-2.0-flash-lite",
-                            generation_config=generation_config,
-                        )
-                    
                     # Format nutrition data in a more readable way
                     nutrition_str = f"Daily Nutrition Requirements:\nCalories: {nutrition['calories']}\nCarbs: {nutrition['carbs']}g\nProtein: {nutrition['protein']}g\nFat: {nutrition['fat']}g"
                     
                     # Convert other data to strings
-                    profile_str = str(st.session_state[session_key_profile])
+                    profile = st.session_state[session_key_profile]
+                    recipe_profile = {field: profile[field] for field in RECIPE_PROFILE_FIELDS if field in profile}
+                    profile_str = str(recipe_profile)
                     
                     # Check if these session state variables exist before accessing them
                     time_str = str(st.session_state.get('cook_time', 5))  # Default to 5 minutes
@@ -160,49 +140,44 @@ def recommandation2():
                     # Get notes and analysis result, with empty string defaults if not found
                     notes_text = st.session_state.get(session_key_notes, "")
                     
-                    try:
-                        chat_session = model.start_chat(history=[
-                            {"role": "user", "parts": [{"text": notes_text}]},
-                            {"role": "user", "parts": [{"text": profile_str}]},
-                            {"role": "user", "parts": [{"text": nutrition_str}]},
-                            {"role": "user", "parts": [{"text": habit_str}]},
-                            {"role": "user", "parts": [{"text": cook_style_str}]},
-                            {"role": "user", "parts": [{"text": time_str}]},
-                            {"role": "user", "parts": [{"text": meal_str}]},
-                            {"role": "user", "parts": [{"text": ingredients_str}]}
-                        ])
-
-                        # Create a simplified message to avoid the list index out of range error
+                    # Identical inputs (same user clicking again, or users with the same
+                    # profile and targets) are answered from the response cache
+                    recipe_cache_key = make_cache_key({
+                        "notes": notes_text,
+                        "profile": recipe_profile,
+                        "habits": habit_str,
+                        "cook_style": cook_style_str,
+                        "cook_time": time_str,
+                        "meal": meal_str,
+                        "ingredients": ingredients_str,
+                    })
+                    cached_recipe = None if regenerate else get_cached_response("recipe", recipe_cache_key, recipe_version)
+                    if cached_recipe:
+                        st.session_state[session_key_recommandation2] = cached_recipe
+                        st.session_state[session_key_recipe_generated] = True
+                    else:
                         try:
-                            # Create a simplified recipe request that doesn't rely on complex formatting
-                            simplified_message = str(prompt2)
-                            
-                            # Send the simplified message instead of prompt2
-                            response = chat_session.send_message(simplified_message)
+                            history = [
+                                {"role": "user", "parts": [{"text": notes_text}]},
+                                {"role": "user", "parts": [{"text": profile_str}]},
+                                {"role": "user", "parts": [{"text": nutrition_str}]},
+                                {"role": "user", "parts": [{"text": habit_str}]},
+                                {"role": "user", "parts": [{"text": cook_style_str}]},
+                                {"role": "user", "parts": [{"text": time_str}]},
+                                {"role": "user", "parts": [{"text": meal_str}]},
+                                {"role": "user", "parts": [{"text": ingredients_str}]}
+                            ]
+
+                            # Returns as soon as the first chunk arrives; transient errors are
+                            # retried and quota errors fail over to another key
+                            # The rest of the recipe is rendered below, outside the spinner
+                            stream_response = stream_text("GEMINI_API_KEY_2", RECIPE_MODEL, RECIPE_CONFIG,
+                                                          str(prompt2), history=history)
                         except Exception as e:
-                            # If there's still an error, try an even simpler approach
-                            try:
-                                basic_message = "Please create a recipe based on the nutrition data I provided earlier."
-                                response = chat_session.send_message(basic_message)
-                            except Exception as e2:
-                                error_message = f"Error sending message to Gemini API: {str(e2)}"
-                                st.error(error_message)
-                                raise
-                        
-                        # Check if response has text before trying to access it
-                        if hasattr(response, 'text'):
-                            st.session_state[session_key_recommandation2] = response.text
-                            st.session_state[session_key_recipe_generated] = True
-                        else:
-                            error_message = "No response text received from the model. Please try again later."
+                            error_message = f"Error in API call: {str(e)}"
                             st.error(error_message)
                             st.session_state[session_key_recommandation2] = error_message
                             st.session_state[session_key_recipe_generated] = False
-                    except Exception as e:
-                        error_message = f"Error in API call: {str(e)}"
-                        st.error(error_message)
-                        st.session_state[session_key_recommandation2] = error_message
-                        st.session_state[session_key_recipe_generated] = False
                 except Exception as e:
                     error_message = f"Error in API setup: {str(e)}"
                     st.error(error_message)
@@ -214,9 +189,29 @@ def recommandation2():
                 st.error(error_message)
                 st.session_state[session_key_recommandation2] = error_message
                 st.session_state[session_key_recipe_generated] = False
+
+        # Render the recipe as it streams in, then keep the full text for reruns and saving
+        if stream_response is not None:
+            try:
+                recipe_text = st.write_stream(stream_response)
+                streamed = True
+                if isinstance(recipe_text, str) and recipe_text.strip():
+                    st.session_state[session_key_recommandation2] = recipe_text
+                    st.session_state[session_key_recipe_generated] = True
+                    store_response("recipe", recipe_cache_key, recipe_version, recipe_text)
+                else:
+                    error_message = "No response text received from the model. Please try again later."
+                    st.error(error_message)
+                    st.session_state[session_key_recommandation2] = error_message
+                    st.session_state[session_key_recipe_generated] = False
+            except Exception as e:
+                error_message = f"Error while streaming the recipe: {str(e)}"
+                st.error(error_message)
+                st.session_state[session_key_recommandation2] = error_message
+                st.session_state[session_key_recipe_generated] = False
     
-    # Always display the recipe if it exists in session state
-    if st.session_state[session_key_recipe_generated] and st.session_state[session_key_recommandation2]:
+    # Always display the recipe if it exists in session state (it was just streamed on this run otherwise)
+    if st.session_state[session_key_recipe_generated] and st.session_state[session_key_recommandation2] and not streamed:
         # Display the recipe
         st.markdown(st.session_state[session_key_recommandation2])
     
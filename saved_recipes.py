@@ -6,141 +6,23 @@ from functions import get_session_key
 from history import get_db_connection
 from datetime import datetime
 
-# Create saved_recipes table if it doesn't exist
-def create_saved_recipes_table():
-    conn = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            # Create saved_recipes table if it doesn't exist
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS saved_recipes (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                    recipe_title TEXT,
-                    recipe_content TEXT,
-                    saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Check if meal_type column exists, add it if it doesn't
-            cur.execute("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name = 'saved_recipes' AND column_name = 'meal_type'
-            """)
-            
-            if not cur.fetchone():
-                # Add meal_type column if it doesn't exist
-                cur.execute("ALTER TABLE saved_recipes ADD COLUMN meal_type TEXT DEFAULT 'Other'")
-                st.success("Added meal_type column to saved_recipes table")
-                
-                # Update existing recipes with meal types based on their titles
-                update_existing_recipe_meal_types()
-            
-            conn.commit()
-            cur.close()
-            conn.close()
-            return True
-        except Exception as e:
-            st.error(f"Error creating saved_recipes table: {e}")
-            conn.close()
-            return False
-    return False
-
-# Update existing recipes with meal types and better titles
-def update_existing_recipe_meal_types():
-    conn = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            
-            # Get all recipes
-            cur.execute("""
-                SELECT id, recipe_title, recipe_content, meal_type
-                FROM saved_recipes
-            """)
-            
-            recipes = cur.fetchall()
-            
-            for recipe_id, recipe_title, recipe_content, current_meal_type in recipes:
-                # Determine meal type from title or content if not already set
-                meal_type = current_meal_type if current_meal_type else "Other"
-                lower_title = recipe_title.lower()
-                lower_content = recipe_content.lower()
-                
-                if meal_type == "Other":
-                    if 'breakfast' in lower_title or 'breakfast' in lower_content:
-                        meal_type = "Breakfast"
-                    elif 'lunch' in lower_title or 'lunch' in lower_content:
-                        meal_type = "Lunch"
-                    elif 'dinner' in lower_title or 'dinner' in lower_content:
-                        meal_type = "Dinner"
-                    elif 'snack' in lower_title or 'snack' in lower_content:
-                        meal_type = "Snack"
-                    elif any(word in lower_title for word in ['morning', 'toast', 'cereal', 'oatmeal', 'pancake']):
-                        meal_type = "Breakfast"
-                    elif any(word in lower_title for word in ['sandwich', 'salad', 'soup']):
-                        meal_type = "Lunch"
-                    elif any(word in lower_title for word in ['roast', 'steak', 'chicken', 'fish', 'supper']):
-                        meal_type = "Dinner"
-                    elif any(word in lower_title for word in ['cookie', 'bar', 'nuts', 'fruit']):
-                        meal_type = "Snack"
-                
-                # Extract a better title from the content
-                new_title = recipe_title
-                
-                # Check if the current title is just a generic meal type with nutritional info
-                if (lower_title.startswith(('breakfast', 'lunch', 'dinner', 'snack')) and 
-                    '(' in lower_title and 'calories' in lower_title):
-                    
-                    # Get the second line of the recipe content as specified by the user
-                    lines = recipe_content.strip().split('\n')
-                    line_index = 0
-                    actual_line_count = 0
-                    
-                    # Find the second non-empty line
-                    while line_index < len(lines) and actual_line_count < 2:
-                        if lines[line_index].strip():
-                            actual_line_count += 1
-                        line_index += 1
-                    
-                    # If we found the second line, use it as the title
-                    if actual_line_count == 2 and line_index > 0 and line_index <= len(lines):
-                        second_line = lines[line_index - 1].strip()
-                        
-                        # Skip if the second line is just a header like "Ingredients:" or "Instructions:"
-                        if second_line.lower() not in ['ingredients:', 'instructions:', 'directions:', 'steps:', 'method:']:
-                            # Extract timestamp from original title if present
-                            timestamp = ""
-                            if '(' in recipe_title and ')' in recipe_title:
-                                timestamp_start = recipe_title.rfind('(')
-                                timestamp_end = recipe_title.rfind(')')
-                                if timestamp_start > 0 and timestamp_end > timestamp_start:
-                                    timestamp = recipe_title[timestamp_start:timestamp_end+1]
-                            
-                            # Create new title with the dish name from the second line and timestamp
-                            new_title = second_line
-                            if timestamp:
-                                new_title = f"{new_title} {timestamp}"
-                
-                # Update the recipe with the determined meal type and better title
-                cur.execute("""
-                    UPDATE saved_recipes
-                    SET meal_type = %s, recipe_title = %s
-                    WHERE id = %s
-                """, (meal_type, new_title, recipe_id))
-            
-            conn.commit()
-            cur.close()
-            conn.close()
-            return True
-        except Exception as e:
-            st.error(f"Error updating recipe meal types and titles: {e}")
-            if conn:
-                conn.close()
-            return False
-    return False
+# Statements issued by this module; benchmarks/db_bench.py and tests/test_index_check.py import them
+INSERT_RECIPE_SQL = """
+    INSERT INTO saved_recipes
+    (user_id, recipe_title, recipe_content, meal_type)
+    VALUES (%s, %s, %s, %s)
+"""
+SAVED_RECIPES_SQL = """
+    SELECT id, recipe_title, recipe_content, meal_type, saved_at
+    FROM saved_recipes
+    WHERE user_id = %s
+    ORDER BY meal_type, saved_at DESC
+"""
+DELETE_RECIPE_SQL = """
+    DELETE FROM saved_recipes
+    WHERE id = %s AND user_id = %s
+    RETURNING id
+"""
 
 # Save recipe to database
 def save_recipe(user_id, recipe_content):
@@ -156,9 +38,6 @@ def save_recipe(user_id, recipe_content):
             # we need to handle this case differently
             return False, "Please log in to save recipes."
     
-    # Ensure saved_recipes table exists
-    create_saved_recipes_table()
-    
     # Extract recipe title from content - specifically the second non-empty line as requested
     lines = recipe_content.strip().split('\n')
     recipe_title = "Saved Recipe"
@@ -235,11 +114,7 @@ def save_recipe(user_id, recipe_content):
             recipe_title_with_time = f"{recipe_title} ({timestamp})"
             
             # Insert new recipe with meal type
-            cur.execute("""
-                INSERT INTO saved_recipes
-                (user_id, recipe_title, recipe_content, meal_type)
-                VALUES (%s, %s, %s, %s)
-            """, (user_id, recipe_title_with_time, recipe_content, meal_type))
+            cur.execute(INSERT_RECIPE_SQL, (user_id, recipe_title_with_time, recipe_content, meal_type))
             message = "Recipe saved successfully"
             
             conn.commit()
@@ -265,21 +140,13 @@ def get_saved_recipes(user_id):
             # we need to handle this case differently
             return None
     
-    # Ensure saved_recipes table exists
-    create_saved_recipes_table()
-    
     conn = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
             
             # Get all saved recipes for the user
-            cur.execute("""
-                SELECT id, recipe_title, recipe_content, meal_type, saved_at
-                FROM saved_recipes
-                WHERE user_id = %s
-                ORDER BY meal_type, saved_at DESC
-            """, (user_id,))
+            cur.execute(SAVED_RECIPES_SQL, (user_id,))
             
             recipes = cur.fetchall()
             cur.close()
@@ -306,20 +173,13 @@ def delete_saved_recipe(recipe_id, user_id):
             # we need to handle this case differently
             return False, "Please log in to delete recipes."
     
-    # Ensure saved_recipes table exists
-    create_saved_recipes_table()
-    
     conn = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
             
             # Delete the recipe (ensuring it belongs to the user)
-            cur.execute("""
-                DELETE FROM saved_recipes
-                WHERE id = %s AND user_id = %s
-                RETURNING id
-            """, (recipe_id, user_id))
+            cur.execute(DELETE_RECIPE_SQL, (recipe_id, user_id))
             
             deleted = cur.fetchone()
             conn.commit()
@@ -343,9 +203,6 @@ def display_saved_recipes():
         return
     
     try:
-        # Ensure saved_recipes table exists
-        create_saved_recipes_table()
-        
         # Get user_id and convert to integer if needed
         user_id = st.session_state.user_id
         if not isinstance(user_id, int):
@@ -0,0 +1,48 @@
+import os
+import shutil
+import sys
+
+import pytest
+from pytest_postgresql import factories
+
+# The app modules live at the repository root, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import migrations  # noqa: E402
+
+# Database tests run against a throwaway database that is created and dropped around
+# each test: on the server named by DB_HOST/DB_PORT when set, otherwise on a
+# temporary server started with pg_ctl (PG_CTL, or pg_ctl on PATH)
+PG_CTL = os.getenv("PG_CTL") or shutil.which("pg_ctl")
+TEST_DB_NAME = "myplate_test"
+
+if os.getenv("DB_HOST"):
+    postgresql_server = factories.postgresql_noproc(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        dbname=TEST_DB_NAME,
+    )
+else:
+    postgresql_server = factories.postgresql_proc(executable=PG_CTL, dbname=TEST_DB_NAME)
+postgresql = factories.postgresql("postgresql_server")
+
+
+# Point the app's connection pool at a freshly migrated throwaway database
+@pytest.fixture
+def app_db(request, monkeypatch):
+    if not os.getenv("DB_HOST") and PG_CTL is None:
+        pytest.skip("needs PostgreSQL: set DB_HOST or put pg_ctl on PATH")
+    info = request.getfixturevalue("postgresql").info
+    monkeypatch.setattr(db, "DB_HOST", info.host)
+    monkeypatch.setattr(db, "DB_PORT", info.port)
+    monkeypatch.setattr(db, "DB_NAME", info.dbname)
+    monkeypatch.setattr(db, "DB_USER", info.user)
+    monkeypatch.setattr(db, "DB_PASSWORD", info.password)
+    db.close_pool()
+    migrations.migrate()
+    yield
+    # Release every connection before the database is dropped
+    db.close_pool()
@@ -0,0 +1,143 @@
+import threading
+import time
+
+import pytest
+
+import cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    c = cache.TTLCache(ttl=30)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return len(loads)
+
+    assert c.get_or_load("habits", "k", loader) == 1
+    clock.now += 29
+    assert c.get_or_load("habits", "k", loader) == 1
+    clock.now += 2
+    assert c.get_or_load("habits", "k", loader) == 2
+    # A per-call ttl overrides the default
+    assert c.get_or_load("habits", "short", loader, ttl=1) == 3
+    clock.now += 1
+    assert c.get_or_load("habits", "short", loader, ttl=1) == 4
+
+
+def test_invalidate_bumps_generation(clock):
+    c = cache.TTLCache()
+    c.get_or_load("habits", "k", lambda: "old")
+    c.get_or_load("feedback", "k", lambda: "kept")
+
+    c.invalidate("habits")
+    assert c.get_or_load("habits", "k", lambda: "new") == "new"
+    assert c.get_or_load("feedback", "k", lambda: "reloaded") == "kept"
+
+    c.invalidate()
+    assert c.get_or_load("feedback", "k", lambda: "reloaded") == "reloaded"
+
+
+def test_load_started_before_invalidate_is_not_stored(clock):
+    c = cache.TTLCache()
+
+    def slow_read():
+        # A write lands while the read is still running
+        c.invalidate("habits")
+        return "stale"
+
+    assert c.get_or_load("habits", "k", slow_read) == "stale"
+    assert c.get_or_load("habits", "k", lambda: "fresh") == "fresh"
+
+
+def test_hit_and_miss_counters(clock):
+    c = cache.TTLCache()
+    c.get_or_load("habits", "a", lambda: 1)
+    c.get_or_load("habits", "a", lambda: 1)
+    c.get_or_load("habits", "a", lambda: 1)
+    c.get_or_load("habits", "b", lambda: None)
+    c.invalidate("habits")
+
+    stats = c.stats()["habits"]
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["invalidations"] == 1
+    assert stats["size"] == 0
+    assert stats["hit_rate"] == 0.5
+
+
+def test_lists_are_frozen(clock):
+    c = cache.TTLCache()
+    value = c.get_or_load("feedback", "k", lambda: [("a", [1, 2])])
+    assert value == (("a", (1, 2)),)
+    assert c.get_or_load("feedback", "k", lambda: None) is value
+
+
+@pytest.mark.parametrize("result", ["rows", None])
+def test_single_flight_under_threads(result):
+    c = cache.TTLCache()
+    started = threading.Event()
+    release = threading.Event()
+    state = {"running": 0, "overlap": 0, "calls": 0}
+    lock = threading.Lock()
+
+    def loader():
+        with lock:
+            state["calls"] += 1
+            state["running"] += 1
+            state["overlap"] = max(state["overlap"], state["running"])
+        started.set()
+        release.wait(5)
+        time.sleep(0.01)
+        with lock:
+            state["running"] -= 1
+        return result
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(c.get_or_load("habits", "k", loader)))
+               for _ in range(12)]
+    threads[0].start()
+    assert started.wait(5)
+    for t in threads[1:8]:
+        t.start()
+    time.sleep(0.05)
+    release.set()
+    # Late callers arrive after the first load finished, while others still wait
+    time.sleep(0.02)
+    for t in threads[8:]:
+        t.start()
+    for t in threads:
+        t.join(5)
+
+    assert results == [result] * 12
+    assert state["overlap"] == 1
+    # A cached value is loaded once; None is not cached, so callers load it one at a time
+    assert state["calls"] == (1 if result is not None else 12)
+    assert c._key_locks == {}
+
+
+def test_key_lock_released_when_loader_fails(clock):
+    c = cache.TTLCache()
+
+    def loader():
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        c.get_or_load("habits", "k", loader)
+    assert c._key_locks == {}
+    assert c.get_or_load("habits", "k", lambda: "ok") == "ok"
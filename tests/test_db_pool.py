@@ -0,0 +1,168 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+import db
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, vars=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.executed.append(query)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = False
+        self.broken = False
+        self.executed = []
+        self.rollbacks = 0
+        self.info = SimpleNamespace(transaction_status=extensions.TRANSACTION_STATUS_IDLE)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Every connection opened by a pool, in order; psycopg2.connect never reaches a server."""
+    opened = []
+
+    def connect(**kwargs):
+        conn = FakeConnection()
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(db.psycopg2, "connect", connect)
+    return opened
+
+
+def test_connections_are_reused(connections):
+    pool = db.ConnectionPool(min_size=0, max_size=2)
+    conn = pool.connection()
+    raw = conn._conn
+    conn.close()
+    assert conn.closed
+    with pytest.raises(psycopg2.InterfaceError):
+        conn.cursor()
+
+    assert pool.connection()._conn is raw
+    assert len(connections) == 1
+
+
+def test_checkout_blocks_at_max_size(connections):
+    pool = db.ConnectionPool(min_size=0, max_size=2, timeout=5)
+    first = pool.connection()
+    second = pool.connection()
+    assert pool.stats() == {"size": 2, "idle": 0, "in_use": 2, "max_size": 2}
+
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.connection()))
+    waiter.start()
+    time.sleep(0.05)
+    assert got == []
+
+    raw = first._conn
+    first.close()
+    waiter.join(5)
+    assert got[0]._conn is raw
+    assert len(connections) == 2
+    second.close()
+    got[0].close()
+
+
+def test_checkout_times_out(connections):
+    pool = db.ConnectionPool(min_size=0, max_size=1)
+    held = pool.connection()
+
+    start = time.monotonic()
+    with pytest.raises(db.PoolTimeout):
+        pool.connection(timeout=0.05)
+    assert time.monotonic() - start >= 0.05
+    # Callers that handle connection errors generically still catch it
+    assert issubclass(db.PoolTimeout, psycopg2.OperationalError)
+    held.close()
+
+
+def test_failed_health_check_replaces_connection(connections):
+    pool = db.ConnectionPool(min_size=1, max_size=1, health_check_after=0)
+    stale = connections[0]
+    stale.broken = True
+
+    conn = pool.connection()
+    assert stale.closed
+    assert conn._conn is connections[1]
+    assert pool.stats()["size"] == 1
+
+    # A healthy idle connection passes the ping and is handed out again
+    conn.close()
+    assert pool.connection()._conn is connections[1]
+    assert connections[1].executed == ["SELECT 1"]
+
+
+def test_discard_frees_a_slot(connections):
+    pool = db.ConnectionPool(min_size=0, max_size=1)
+    conn = pool.connection()
+    raw = conn._conn
+    conn.discard()
+
+    assert raw.closed
+    assert pool.stats() == {"size": 0, "idle": 0, "in_use": 0, "max_size": 1}
+    assert pool.connection(timeout=0.05)._conn is connections[1]
+
+
+def test_release_rolls_back_open_transaction(connections):
+    pool = db.ConnectionPool(min_size=0, max_size=1)
+    conn = pool.connection()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    conn.autocommit = True
+    conn.close()
+
+    raw = connections[0]
+    assert raw.rollbacks == 1
+    assert raw.autocommit is False
+    assert pool.stats()["idle"] == 1
+
+
+@pytest.mark.parametrize("error", [
+    psycopg2.OperationalError("could not connect to server"),
+    psycopg2.InterfaceError("connection pool is closed"),
+    UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte"),
+])
+def test_is_available_is_false_on_connection_errors(monkeypatch, error):
+    def get_db_connection(timeout=None):
+        raise error
+
+    monkeypatch.setattr(db, "get_db_connection", get_db_connection)
+    assert db.is_available() is False
+
+
+def test_is_available_raises_when_pool_is_busy(monkeypatch):
+    def get_db_connection(timeout=None):
+        raise db.PoolTimeout("pool exhausted")
+
+    monkeypatch.setattr(db, "get_db_connection", get_db_connection)
+    with pytest.raises(db.PoolTimeout):
+        db.is_available()
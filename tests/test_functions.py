@@ -0,0 +1,119 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import functions
+
+
+def image_bytes(image, image_format="JPEG", **params):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **params)
+    return buffer.getvalue()
+
+
+# Landscape photo, red on the left and blue on the right, stored with an EXIF orientation tag
+def oriented_photo(size, orientation):
+    image = Image.new("RGB", size, (0, 0, 255))
+    image.paste((255, 0, 0), (0, 0, size[0] // 2, size[1]))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    return image_bytes(image, exif=exif.tobytes())
+
+
+def test_resize_image_applies_exif_orientation():
+    # Orientation 6: the camera was turned clockwise, so the photo is shown rotated 90 degrees
+    resized = Image.open(io.BytesIO(functions.resize_image(oriented_photo((1600, 800), 6))))
+
+    assert resized.format == "JPEG"
+    assert resized.size == (150, 300)
+    top = resized.getpixel((75, 20))
+    bottom = resized.getpixel((75, 280))
+    assert top[0] > 200 and top[2] < 60
+    assert bottom[2] > 200 and bottom[0] < 60
+
+
+def test_resize_image_keeps_small_upright_images():
+    resized = Image.open(io.BytesIO(functions.resize_image(oriented_photo((200, 100), 1))))
+    assert resized.size == (200, 100)
+
+
+def test_resize_image_keeps_png_format():
+    original = image_bytes(Image.new("RGBA", (900, 600), (10, 200, 30, 128)), "PNG")
+    resized = Image.open(io.BytesIO(functions.resize_image(original)))
+    assert resized.format == "PNG"
+    assert resized.mode == "RGBA"
+    assert resized.size == (300, 200)
+
+
+# Seeded noise compresses badly, so it exercises the quality steps
+def noisy_photo(size=(300, 300), seed=0):
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    return Image.fromarray(pixels)
+
+
+@pytest.mark.parametrize("image_format, mime_type", [("JPEG", "image/jpeg"), ("WEBP", "image/webp")])
+def test_encode_image_for_model_fits_byte_budget(image_format, mime_type):
+    original = image_bytes(noisy_photo(), "PNG")
+    part = functions.encode_image_for_model(original, image_format=image_format, max_bytes=48_000)
+
+    # Over budget at the starting quality, so a lower quality step was used
+    assert len(image_bytes(noisy_photo(), image_format, quality=functions.MODEL_IMAGE_QUALITY)) > 48_000
+    assert part["mime_type"] == mime_type
+    assert len(part["data"]) <= 48_000
+    assert Image.open(io.BytesIO(part["data"])).format == image_format
+
+
+def test_encode_image_for_model_stops_at_min_quality():
+    original = image_bytes(noisy_photo(), "PNG")
+    part = functions.encode_image_for_model(original, max_bytes=1_000)
+    floor = image_bytes(noisy_photo(), "JPEG", quality=functions.MODEL_IMAGE_MIN_QUALITY)
+
+    assert part["mime_type"] == "image/jpeg"
+    assert part["data"] == floor
+
+
+def test_encode_image_for_model_sends_small_jpeg_unchanged():
+    original = image_bytes(noisy_photo((40, 40)), "JPEG", quality=90)
+    part = functions.encode_image_for_model(original, image_format="jpeg")
+    assert part == {"mime_type": "image/jpeg", "data": original}
+
+
+def test_encode_image_for_model_flattens_transparency_for_jpeg():
+    original = image_bytes(Image.new("RGBA", (50, 50), (0, 0, 0, 0)), "PNG")
+    part = functions.encode_image_for_model(original)
+
+    encoded = Image.open(io.BytesIO(part["data"]))
+    assert part["mime_type"] == "image/jpeg"
+    assert encoded.mode == "RGB"
+    assert min(encoded.getpixel((25, 25))) > 245
+
+
+def test_encode_image_for_model_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        functions.encode_image_for_model(image_bytes(noisy_photo((10, 10))), image_format="GIF")
+
+
+# A 9x8 grid of random colour blocks, so the 8x8 difference hash is stable under re-encoding
+def meal_photo(seed, brightness=0, size=(270, 240)):
+    blocks = np.random.default_rng(seed).integers(40, 216, (8, 9, 3), dtype=np.int16) + brightness
+    return Image.fromarray(blocks.astype(np.uint8)).resize(size, Image.Resampling.NEAREST)
+
+
+def test_remove_near_duplicates_keeps_first_of_each_photo():
+    first = image_bytes(meal_photo(1), quality=90)
+    burst = image_bytes(meal_photo(1, brightness=8), quality=60)
+    rescaled = image_bytes(meal_photo(1, size=(180, 160)), "PNG")
+    other = image_bytes(meal_photo(2), quality=90)
+
+    assert functions.remove_near_duplicates([first, burst, other, rescaled]) == [first, other]
+    assert functions.remove_near_duplicates([other, burst, first]) == [other, burst]
+
+
+def test_remove_near_duplicates_respects_max_distance():
+    first = image_bytes(meal_photo(1), quality=90)
+    burst = image_bytes(meal_photo(1, brightness=8), quality=60)
+
+    assert functions.remove_near_duplicates([first, burst], max_distance=-1) == [first, burst]
+    assert functions.remove_near_duplicates([]) == []
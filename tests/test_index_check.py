@@ -0,0 +1,93 @@
+import json
+
+import analysis_storage
+import db
+import history
+import nutrition_history
+import rank
+import saved_recipes
+
+# The app's hot queries, imported from the modules that issue them so the test
+# always EXPLAINs the statements the request path runs. Each entry is
+# (name, sql, params); params may reference the seeded user via the "user_id"
+# placeholder value.
+HOT_QUERIES = [
+    ("habit pills (functions.display_habit_collection)", history.USER_HABITS_SQL, ("user_id",)),
+    ("delete habit (analysis_storage.delete_analysis_result)", analysis_storage.DELETE_ANALYSIS_SQL,
+     ("user_id", "habit 1", "habit 1")),
+    ("popular habits (rank.popular_habits)", rank.POPULAR_HABITS_SQL, (5,)),
+    ("new trends (rank.new_habits)", rank.NEW_HABITS_SQL, (5,)),
+    ("nutrition history (nutrition_history.get_nutrition_history)", nutrition_history.NUTRITION_HISTORY_SQL,
+     ("user_id", 30)),
+    ("saved recipes (saved_recipes.get_saved_recipes)", saved_recipes.SAVED_RECIPES_SQL, ("user_id",)),
+    ("recent comments (history.get_recent_comments)", history.RECENT_COMMENTS_SQL, (5,)),
+]
+
+
+# Insert a synthetic dataset and return a sample user id
+def seed(cur, users=500, habits_per_user=40, nutrition_per_user=60, recipes_per_user=10, feedback_rows=5000):
+    cur.execute("""
+        INSERT INTO users (username, email, password_hash)
+        SELECT 'index_check_' || g, 'index_check_' || g || '@example.com', 'x'
+        FROM generate_series(1, %s) g
+        RETURNING id
+    """, (users,))
+    user_ids = [row[0] for row in cur.fetchall()]
+    cur.execute("""
+        INSERT INTO analysis_results (user_id, analysis_text, created_at)
+        SELECT u, 'habit ' || (g %% 200), now() - (g || ' minutes')::interval
+        FROM unnest(%s) u, generate_series(1, %s) g
+    """, (user_ids, habits_per_user))
+    cur.execute("""
+        INSERT INTO nutrition_history (user_id, carbs, protein, fat, calories, recorded_at)
+        SELECT u, 200, 120, 60, 1820, now() - (g * 7 || ' hours')::interval
+        FROM unnest(%s) u, generate_series(1, %s) g
+    """, (user_ids, nutrition_per_user))
+    cur.execute("""
+        INSERT INTO saved_recipes (user_id, recipe_title, recipe_content, meal_type, saved_at)
+        SELECT u, 'Recipe ' || g, 'Recipe body', (ARRAY['Breakfast', 'Lunch', 'Dinner', 'Snack', 'Other'])[1 + g %% 5],
+               now() - (g || ' hours')::interval
+        FROM unnest(%s) u, generate_series(1, %s) g
+    """, (user_ids, recipes_per_user))
+    cur.execute("""
+        INSERT INTO feedback (user_id, rating, comment, created_at)
+        SELECT NULL, (g %% 101) / 10.0, CASE WHEN g %% 3 = 0 THEN '' ELSE 'comment ' || g END,
+               now() - (g || ' minutes')::interval
+        FROM generate_series(1, %s) g
+    """, (feedback_rows,))
+    for table in ("users", "analysis_results", "habit_counts", "habit_first_seen", "nutrition_history", "saved_recipes", "feedback"):
+        cur.execute(f"ANALYZE {table}")
+    return user_ids[len(user_ids) // 2]
+
+
+# Return the plan node types used by a query, e.g. {"Index Scan", "Sort"}
+def plan_node_types(plan):
+    nodes = {plan["Node Type"]}
+    for child in plan.get("Plans", []):
+        nodes |= plan_node_types(child)
+    return nodes
+
+
+def test_hot_queries_use_indexes(app_db):
+    """
+    EXPLAIN every hot query against a seeded copy of the schema.
+
+    Runs on the throwaway database from the app_db fixture: seed() also runs
+    ANALYZE, whose statistics (pg_class.reltuples and relpages) are updated in
+    place and survive a rollback.
+    """
+    failures = []
+    with db.connection() as conn:
+        cur = conn.cursor()
+        user_id = seed(cur)
+        for name, query, params in HOT_QUERIES:
+            params = tuple(user_id if p == "user_id" else p for p in params)
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            nodes = plan_node_types(plan[0]["Plan"])
+            if not any("Index" in node for node in nodes) or "Seq Scan" in nodes:
+                failures.append(f"{name}: {', '.join(sorted(nodes))}")
+        cur.close()
+    assert not failures, "hot queries not served by an index:\n" + "\n".join(failures)
@@ -0,0 +1,277 @@
+import json
+import time
+
+import google.ai.generativelanguage as glm
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+import llm
+
+
+def model_reply(*texts, finish_reason=glm.Candidate.FinishReason.STOP, output_tokens=0):
+    return glm.GenerateContentResponse(
+        candidates=[{"content": {"role": "model", "parts": [{"text": t} for t in texts]},
+                     "finish_reason": finish_reason}],
+        usage_metadata={"prompt_token_count": 7, "candidates_token_count": output_tokens},
+    )
+
+
+class RecordingClient:
+    """Stands in for a GenerativeServiceClient, answering every request with canned replies."""
+
+    def __init__(self, *chunks):
+        self.chunks = chunks
+        self.requests = []
+
+    def generate_content(self, request, **kwargs):
+        self.requests.append((request, kwargs))
+        return self.chunks[-1]
+
+    def stream_generate_content(self, request, **kwargs):
+        self.requests.append((request, kwargs))
+        return iter(self.chunks)
+
+
+@pytest.fixture
+def api_keys(monkeypatch):
+    monkeypatch.setenv("TEST_GEMINI_KEY_1", "key-one")
+    monkeypatch.setenv("TEST_GEMINI_KEY_2", "key-two")
+    llm.reset_clients()
+    yield
+    llm.reset_clients()
+
+
+def test_get_client_binds_one_client_per_key(api_keys):
+    first = llm.get_client("TEST_GEMINI_KEY_1")
+    second = llm.get_client("TEST_GEMINI_KEY_2")
+    assert isinstance(first, glm.GenerativeServiceClient)
+    assert first is not second
+    assert llm.get_client("TEST_GEMINI_KEY_1") is first
+    llm.reset_clients()
+    assert llm.get_client("TEST_GEMINI_KEY_1") is not first
+
+
+def test_get_client_without_key_returns_none(api_keys):
+    assert llm.get_client("TEST_GEMINI_KEY_MISSING") is None
+    with pytest.raises(api_exceptions.Unauthenticated):
+        llm.GeminiBackend().send("TEST_GEMINI_KEY_MISSING", "gemini-2.0-flash", {}, "hello")
+
+
+def test_gemini_backend_sends_chat_turn(api_keys):
+    client = RecordingClient(model_reply("Grilled salmon", output_tokens=3))
+    llm._clients["TEST_GEMINI_KEY_1"] = client
+    history = [{"role": "user", "parts": [{"text": "I am vegetarian"}]}]
+    image = {"mime_type": "image/jpeg", "data": b"jpeg bytes"}
+    usage = {}
+
+    text = llm.GeminiBackend().send("TEST_GEMINI_KEY_1", "gemini-2.0-flash", llm.DIET_ANALYSIS_CONFIG,
+                                    ["What is this?", image], history=history, timeout=5, usage=usage)
+
+    assert text == "Grilled salmon"
+    assert usage == {"prompt_tokens": 7, "output_tokens": 3}
+    request, kwargs = client.requests[0]
+    assert kwargs == {"timeout": 5}
+    assert request.model == "models/gemini-2.0-flash"
+    assert [c.role for c in request.contents] == ["user", "user"]
+    assert request.contents[0].parts[0].text == "I am vegetarian"
+    assert request.contents[1].parts[1].inline_data.data == b"jpeg bytes"
+    assert request.generation_config.max_output_tokens == llm.DIET_ANALYSIS_CONFIG["max_output_tokens"]
+
+
+def test_gemini_backend_streams_chunks(api_keys):
+    client = RecordingClient(model_reply("Grilled ", finish_reason=0), model_reply("salmon", output_tokens=2))
+    llm._clients["TEST_GEMINI_KEY_1"] = client
+    usage = {}
+
+    chunks = llm.GeminiBackend().send("TEST_GEMINI_KEY_1", "gemini-2.0-flash", {}, "hello", stream=True,
+                                      usage=usage)
+
+    assert list(chunks) == ["Grilled ", "salmon"]
+    assert usage == {"prompt_tokens": 7, "output_tokens": 2}
+    assert client.requests[0][1] == {}
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    # No backoff sleeps, and only the primary key is configured unless a test adds more
+    monkeypatch.setattr(llm, "LLM_BACKOFF_BASE", 0)
+    monkeypatch.setattr(llm, "API_KEY_ENVS", ("GEMINI_API_KEY", "GEMINI_API_KEY_2"))
+
+    def install(**kwargs):
+        backend = llm.StubBackend("instant", **kwargs)
+        llm.set_backend(backend)
+        return backend
+    yield install
+    llm.set_backend(None)
+
+
+def test_send_message_retries_transient_errors(stub):
+    busy = api_exceptions.ServiceUnavailable("busy")
+    backend = stub(errors={"GEMINI_API_KEY": [busy, busy]})
+    text = llm.generate_text("GEMINI_API_KEY", "stub", {}, "hello")
+    assert text == backend.response_text("stub", {}, "hello")
+    assert backend.calls == {"GEMINI_API_KEY": 3}
+
+
+def test_send_message_gives_up_after_max_attempts(stub, monkeypatch):
+    monkeypatch.setattr(llm, "API_KEY_ENVS", ("GEMINI_API_KEY",))
+    backend = stub(errors={"GEMINI_API_KEY": [api_exceptions.ServiceUnavailable("busy")] * llm.LLM_MAX_ATTEMPTS})
+    with pytest.raises(llm.LLMError, match="every configured API key"):
+        llm.generate_text("GEMINI_API_KEY", "stub", {}, "hello")
+    assert backend.calls == {"GEMINI_API_KEY": llm.LLM_MAX_ATTEMPTS}
+
+
+def test_send_message_fails_over_on_quota_errors(stub):
+    backend = stub(errors={"GEMINI_API_KEY": [api_exceptions.ResourceExhausted("quota")]})
+    llm.generate_text("GEMINI_API_KEY", "stub", {}, "hello")
+    # No retry with the exhausted key
+    assert backend.calls == {"GEMINI_API_KEY": 1, "GEMINI_API_KEY_2": 1}
+
+
+def test_send_message_raises_llm_error_at_the_deadline(stub):
+    backend = stub(first_token_latency=1.0)
+    started = time.monotonic()
+    with pytest.raises(llm.LLMError, match="time limit"):
+        llm.generate_text("GEMINI_API_KEY", "stub", {}, "hello", timeout=0.05, deadline=0.2)
+    assert time.monotonic() - started < 0.8
+    assert backend.calls["GEMINI_API_KEY"] >= 1
+
+
+def test_send_message_wraps_unexpected_errors(stub):
+    invalid = api_exceptions.InvalidArgument("bad request")
+    backend = stub(errors={"GEMINI_API_KEY": [invalid]})
+    with pytest.raises(llm.LLMError) as excinfo:
+        llm.generate_text("GEMINI_API_KEY", "stub", {}, "hello")
+    assert excinfo.value.__cause__ is invalid
+    # Not retried, and not sent with another key
+    assert backend.calls == {"GEMINI_API_KEY": 1}
+
+
+def test_stream_text_retries_before_the_first_chunk(stub):
+    backend = stub(errors={"GEMINI_API_KEY": [api_exceptions.ServiceUnavailable("busy")]})
+    chunks = list(llm.stream_text("GEMINI_API_KEY", "stub", {}, "hello"))
+    assert "".join(chunks) == backend.response_text("stub", {}, "hello")
+    assert backend.calls == {"GEMINI_API_KEY": 2}
+
+
+def test_stream_text_wraps_errors_while_streaming(stub, monkeypatch):
+    backend = stub()
+
+    def failing_stream(text):
+        yield text[:5]
+        raise ValueError("response was blocked")
+    monkeypatch.setattr(backend, "_stream", failing_stream)
+
+    chunks = llm.stream_text("GEMINI_API_KEY", "stub", {}, "hello")
+    assert next(chunks)
+    with pytest.raises(llm.LLMError, match="blocked"):
+        next(chunks)
+
+
+IMAGE = {"mime_type": "image/jpeg", "data": b"\xff\xd8 fake jpeg"}
+
+
+def test_stub_output_is_deterministic():
+    first = llm.StubBackend("instant")
+    second = llm.StubBackend("instant")
+    text = first.send("GEMINI_API_KEY", "stub", {"temperature": 1}, ["What is this?", IMAGE])
+
+    assert second.send("GEMINI_API_KEY", "stub", {"temperature": 1}, ["What is this?", IMAGE]) == text
+    assert text.startswith("Stub answer") and text.split("\n")[0].endswith("for 1 images")
+    assert first.send("GEMINI_API_KEY", "stub", {"temperature": 1}, "What is this?") != text
+    assert first.send("GEMINI_API_KEY", "stub", {"temperature": 0}, ["What is this?", IMAGE]) != text
+    assert first.send("GEMINI_API_KEY", "other", {"temperature": 1}, ["What is this?", IMAGE]) != text
+    history = [{"role": "user", "parts": ["earlier turn"]}]
+    assert first.send("GEMINI_API_KEY", "stub", {"temperature": 1}, ["What is this?", IMAGE], history) != text
+
+    # Streaming yields the same text, and max_output_tokens caps its length
+    assert "".join(first.send("GEMINI_API_KEY", "stub", {"temperature": 1}, ["What is this?", IMAGE],
+                              stream=True)) == text
+    assert len(first.send("GEMINI_API_KEY", "stub", {"max_output_tokens": 10}, "hi").split(" ")) <= 10
+
+
+def test_stub_consumes_injected_errors_per_key():
+    busy = api_exceptions.ServiceUnavailable("busy")
+    quota = api_exceptions.ResourceExhausted("quota")
+    backend = llm.StubBackend("instant", errors={"GEMINI_API_KEY": [busy, None, quota]})
+
+    with pytest.raises(api_exceptions.ServiceUnavailable):
+        backend.send("GEMINI_API_KEY", "stub", {}, "hello")
+    assert backend.send("GEMINI_API_KEY_2", "stub", {}, "hello")
+    assert backend.send("GEMINI_API_KEY", "stub", {}, "hello")
+    with pytest.raises(api_exceptions.ResourceExhausted):
+        backend.send("GEMINI_API_KEY", "stub", {}, "hello")
+    assert backend.send("GEMINI_API_KEY", "stub", {}, "hello")
+    assert backend.calls == {"GEMINI_API_KEY": 4, "GEMINI_API_KEY_2": 1}
+
+
+def test_stub_times_out_and_reports_usage():
+    usage = {}
+    slow = llm.StubBackend("instant", first_token_latency=1.0)
+    with pytest.raises(api_exceptions.DeadlineExceeded):
+        slow.send("GEMINI_API_KEY", "stub", {}, "hello", timeout=0.01, usage=usage)
+    assert usage == {}
+
+    llm.StubBackend("instant").send("GEMINI_API_KEY", "stub", {}, "hello world", usage=usage)
+    assert usage["prompt_tokens"] == 2
+    assert usage["output_tokens"] > 0
+
+
+def test_cassette_record_then_replay(tmp_path):
+    path = tmp_path / "exchanges.jsonl"
+    inner = llm.StubBackend("instant")
+    recorder = llm.CassetteBackend(str(path), mode="record", inner=inner)
+    usage = {}
+    text = recorder.send("GEMINI_API_KEY", "stub", {}, ["What is this?", IMAGE], usage=usage)
+    streamed = list(recorder.send("GEMINI_API_KEY", "stub", {}, "Suggest a recipe", stream=True))
+
+    entries = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [entry["stream"] for entry in entries] == [False, True]
+    assert entries[0]["fingerprint"] == llm.request_fingerprint("stub", {}, ["What is this?", IMAGE])
+    # Only the hash of the prompt is stored
+    assert "What is this?" not in path.read_text()
+
+    player = llm.CassetteBackend(str(path), mode="replay", speed=1000)
+    replayed_usage = {}
+    assert player.send("GEMINI_API_KEY", "stub", {}, ["What is this?", IMAGE], usage=replayed_usage) == text
+    assert replayed_usage == usage
+    assert list(player.send("GEMINI_API_KEY", "stub", {}, "Suggest a recipe", stream=True)) == streamed
+    assert player.has_key("GEMINI_API_KEY_3")
+
+
+def test_cassette_replays_recordings_in_turn(tmp_path):
+    path = str(tmp_path / "exchanges.jsonl")
+    recorder = llm.CassetteBackend(path, mode="record", inner=llm.StubBackend("instant"))
+    recorder.send("GEMINI_API_KEY", "stub", {}, "first")
+    recorder.send("GEMINI_API_KEY", "stub", {}, "second")
+
+    # "model" matching falls back to any recording for the same model, in turn
+    player = llm.CassetteBackend(path, mode="replay", match="model", speed=1000)
+    stub = llm.StubBackend("instant")
+    replies = [player.send("GEMINI_API_KEY", "stub", {}, "unrecorded") for _ in range(3)]
+    assert replies == [stub.response_text("stub", {}, "first"), stub.response_text("stub", {}, "second"),
+                       stub.response_text("stub", {}, "first")]
+
+
+def test_cassette_replay_without_match_raises(tmp_path, stub):
+    path = str(tmp_path / "exchanges.jsonl")
+    llm.CassetteBackend(path, mode="record", inner=llm.StubBackend("instant")).send(
+        "GEMINI_API_KEY", "stub", {}, "recorded")
+
+    player = llm.CassetteBackend(path, mode="replay", speed=1000)
+    with pytest.raises(llm.LLMError, match="No recorded stub response"):
+        player.send("GEMINI_API_KEY", "stub", {}, "unrecorded")
+    with pytest.raises(llm.LLMError, match="No recorded other response"):
+        player.send("GEMINI_API_KEY", "other", {}, "recorded")
+
+    # Through generate_text the miss is neither retried nor failed over
+    llm.set_backend(player)
+    with pytest.raises(llm.LLMError, match="No recorded"):
+        llm.generate_text("GEMINI_API_KEY", "stub", {}, "unrecorded")
+
+
+def test_cassette_record_mode_needs_inner_backend(tmp_path):
+    with pytest.raises(ValueError):
+        llm.CassetteBackend(str(tmp_path / "exchanges.jsonl"), mode="record")
+    with pytest.raises(ValueError):
+        llm.CassetteBackend(str(tmp_path / "exchanges.jsonl"), mode="rewind")
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+import tracing
+
+
+class RecordingLogger:
+    def __init__(self):
+        self.lines = []
+
+    def info(self, message):
+        self.lines.extend(json.loads(line) for line in message.splitlines())
+
+
+@pytest.fixture
+def trace_log(monkeypatch):
+    logger = RecordingLogger()
+    monkeypatch.setattr(tracing, "TRACE_ENABLED", True)
+    monkeypatch.setattr(tracing, "_logger", logger)
+    yield logger
+    tracing._current_trace.set(None)
+    tracing._current_span.set(None)
+
+
+@tracing.trace_fragment("analysis")
+def analysis_fragment():
+    with tracing.span("llm.send", model="gemini-2.0-flash"):
+        pass
+    return "done"
+
+
+def test_fragment_only_rerun_is_traced(trace_log):
+    # A full rerun has finished; Streamlit now reruns just the fragment
+    tracing.finish_rerun(tracing.start_rerun())
+    trace_log.lines.clear()
+
+    assert analysis_fragment() == "done"
+
+    header, *spans = trace_log.lines
+    assert header["name"] == "rerun"
+    assert header["section"] == "fragment.analysis"
+    by_name = {s["name"]: s for s in spans}
+    assert set(by_name) == {"fragment.analysis", "llm.send"}
+    assert by_name["llm.send"]["parent_id"] == by_name["fragment.analysis"]["span_id"]
+    assert tracing._current_trace.get() is None
+
+
+def test_fragment_in_full_rerun_joins_its_trace(trace_log):
+    trace = tracing.start_rerun()
+    with tracing.span("section.Habit"):
+        analysis_fragment()
+    tracing.finish_rerun(trace)
+
+    header, *spans = trace_log.lines
+    assert header["spans"] == 3
+    by_name = {s["name"]: s for s in spans}
+    assert by_name["fragment.analysis"]["parent_id"] == by_name["section.Habit"]["span_id"]
+
+
+def test_fragment_untraced_when_tracing_off(trace_log, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_ENABLED", False)
+    monkeypatch.setattr(tracing, "is_admin", lambda: False)
+
+    assert analysis_fragment() == "done"
+    assert trace_log.lines == []
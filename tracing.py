@@ -0,0 +1,321 @@
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from logging.handlers import RotatingFileHandler
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Trace every rerun of every session, or (when off) only admin sessions opened with ?trace=1
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0").lower() in ("1", "true", "yes")
+TRACE_QUERY_PARAM = "trace"
+# Logged-in usernames allowed to turn tracing on from the URL and to see the sidebar panel
+TRACE_ADMINS = {name.strip() for name in os.getenv("TRACE_ADMINS", "").split(",") if name.strip()}
+# Spans are appended to a size-rotated JSONL file for offline analysis
+TRACE_FILE = os.getenv("TRACE_FILE", "traces/spans.jsonl")
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "5"))
+# Spans kept per rerun; a runaway loop of queries cannot grow a trace without bound
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+
+# The trace of the rerun running in this context, and the innermost open span.
+# Both are None when tracing is off, which keeps span() to a single lookup.
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+_logger = None
+_logger_lock = threading.Lock()
+
+
+class Trace:
+    """
+    Spans recorded during one script rerun.
+
+    Spans can be added from worker threads (see propagate()), so appends are
+    locked. Times are kept relative to the start of the rerun.
+    """
+
+    def __init__(self, session=None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.session = session
+        self.section = None
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+
+class Span:
+    """One timed operation, e.g. "db.execute" or "llm.send", with optional attributes."""
+
+    __slots__ = ("span_id", "parent_id", "name", "attrs", "start", "end", "thread")
+
+    def __init__(self, name, parent_id, attrs):
+        self.span_id = next(_span_ids)
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end = None
+        self.thread = threading.current_thread().name
+
+    def to_dict(self, trace):
+        return {
+            "trace_id": trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start - trace.origin) * 1000, 3),
+            "duration_ms": round((self.end - self.start) * 1000, 3),
+            "thread": self.thread,
+            "attrs": self.attrs,
+        }
+
+
+# Time the enclosed block as a span of the current rerun's trace (a no-op when tracing is off)
+@contextlib.contextmanager
+def span(name, **attrs):
+    """
+    Args:
+        name (str): "<kind>.<operation>", e.g. "db.execute"; the kind groups
+            spans in the performance panel
+        **attrs: JSON-serializable details, e.g. sql="SELECT ..."
+
+    Example:
+        with span("chart.nutrition_history"):
+            st.altair_chart(chart)
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent else None, attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+        trace.add(current)
+
+
+# Decorator wrapping every call of a function in a span
+def traced(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Wrap an iterator so the time spent consuming it is recorded as one span
+def trace_iterator(name, iterator, **attrs):
+    """
+    Used for streamed LLM responses, whose chunks are pulled by st.write_stream
+    after the call that created the stream has returned. The span is recorded
+    without becoming the current span, so work done between chunks is not
+    attributed to it.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return iterator
+    parent = _current_span.get()
+
+    def generate():
+        current = Span(name, parent.span_id if parent else None, attrs)
+        chunks = 0
+        try:
+            for chunk in iterator:
+                chunks += 1
+                yield chunk
+        finally:
+            current.end = time.perf_counter()
+            attrs["chunks"] = chunks
+            trace.add(current)
+    return generate()
+
+
+# Bind a callable to a copy of the caller's context, so spans recorded on a worker thread join the rerun's trace
+def propagate(func):
+    """
+    Example:
+        pool.submit(propagate(resize_image), image_bytes)
+
+    Call once per submission: a context can only be entered by one thread at a time.
+    """
+    if _current_trace.get() is None:
+        return func
+    context = contextvars.copy_context()
+    return functools.partial(context.run, func)
+
+
+def is_admin():
+    import streamlit as st
+    return bool(st.session_state.get("logged_in")) and st.session_state.get("username") in TRACE_ADMINS
+
+
+# Start tracing this rerun if TRACE_ENABLED is set or an admin opened the app with ?trace=1
+def start_rerun():
+    """
+    Call at the top of the script. Returns the new Trace, or None when this
+    rerun is not traced.
+    """
+    import streamlit as st
+    enabled = TRACE_ENABLED or (st.query_params.get(TRACE_QUERY_PARAM) == "1" and is_admin())
+    # Script threads are reused across reruns, so always reset what the previous rerun left
+    _current_span.set(None)
+    if not enabled:
+        _current_trace.set(None)
+        return None
+    trace = Trace(session=st.session_state.get("username"))
+    _current_trace.set(trace)
+    return trace
+
+
+# Decorator for @st.fragment functions, which Streamlit also reruns on their own
+def trace_fragment(name):
+    """
+    A fragment rerun skips the top of the script, so start_rerun() never runs
+    for it. Inside a full rerun the fragment is recorded as a span of that
+    rerun's trace; on its own it gets a trace of its own, written to TRACE_FILE
+    (a fragment cannot draw in the sidebar, so it has no panel).
+
+    Example:
+        @st.fragment
+        @trace_fragment("images_analysis")
+        def images_analysis():
+            ...
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is not None:
+                with span(f"fragment.{name}"):
+                    return func(*args, **kwargs)
+            trace = start_rerun()
+            if trace is None:
+                return func(*args, **kwargs)
+            trace.section = f"fragment.{name}"
+            try:
+                with span(f"fragment.{name}"):
+                    return func(*args, **kwargs)
+            finally:
+                finish_rerun(trace)
+        return wrapper
+    return decorator
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                directory = os.path.dirname(TRACE_FILE)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_FILE_MAX_BYTES,
+                                              backupCount=TRACE_FILE_BACKUPS, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger = logging.getLogger("myplate.tracing")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.addHandler(handler)
+                _logger = logger
+    return _logger
+
+
+# Stop tracing and append the rerun's spans to TRACE_FILE, one JSON object per line
+def finish_rerun(trace):
+    if trace is None:
+        return
+    trace.duration_ms = (time.perf_counter() - trace.origin) * 1000
+    _current_trace.set(None)
+    _current_span.set(None)
+    try:
+        logger = _get_logger()
+        header = {
+            "trace_id": trace.trace_id,
+            "name": "rerun",
+            "section": trace.section,
+            "session": trace.session,
+            "started_at": trace.started_at,
+            "duration_ms": round(trace.duration_ms, 3),
+            "spans": len(trace.spans),
+            "dropped": trace.dropped,
+        }
+        lines = [json.dumps(header)]
+        lines.extend(json.dumps(s.to_dict(trace), default=str) for s in trace.spans)
+        logger.info("\n".join(lines))
+    except OSError:
+        # Tracing must never break the app, e.g. on a read-only filesystem
+        pass
+
+
+# Per-rerun waterfall in the sidebar, shown to TRACE_ADMINS only
+def trace_panel(trace):
+    if trace is None or not is_admin():
+        return
+    import altair as alt
+    import pandas as pd
+    import streamlit as st
+
+    spans = sorted(trace.spans, key=lambda s: s.start)
+    depth = {}
+    rows = []
+    for s in spans:
+        depth[s.span_id] = depth.get(s.parent_id, -1) + 1
+        detail = s.attrs.get("sql") or s.attrs.get("model") or ""
+        rows.append({
+            "label": f"{s.span_id:>5} " + "  " * depth[s.span_id] + s.name,
+            "kind": s.name.split(".")[0],
+            "start_ms": (s.start - trace.origin) * 1000,
+            "end_ms": (s.end - trace.origin) * 1000,
+            "duration_ms": round((s.end - s.start) * 1000, 2),
+            "thread": s.thread,
+            "detail": str(detail)[:80],
+        })
+
+    with st.sidebar:
+        st.subheader("Performance")
+        st.caption(f"{trace.section or 'rerun'}: {trace.duration_ms:.0f} ms, {len(spans)} spans"
+                   + (f" ({trace.dropped} dropped)" if trace.dropped else ""))
+        if not rows:
+            return
+        df = pd.DataFrame(rows)
+        waterfall = alt.Chart(df).mark_bar().encode(
+            x=alt.X("start_ms:Q", title="ms since rerun start"),
+            x2="end_ms:Q",
+            y=alt.Y("label:N", sort=None, title=None, axis=alt.Axis(labelLimit=220)),
+            color=alt.Color("kind:N", legend=alt.Legend(orient="bottom", title=None)),
+            tooltip=["label", "duration_ms", "thread", "detail"],
+        ).properties(height=max(120, 18 * len(df)))
+        st.altair_chart(waterfall, use_container_width=True)
+        totals = df.groupby("kind")["duration_ms"].agg(["count", "sum"]).sort_values("sum", ascending=False)
+        st.dataframe(totals.rename(columns={"sum": "total ms"}), use_container_width=True)